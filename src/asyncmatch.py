@@ -0,0 +1,554 @@
+''' tournament runner for players living in separate processes.
+
+Each player is its own long running process serving the GGP http protocol (START / PLAY / STOP /
+ABORT).  Processes are started once for the whole run and each has one keep alive connection, so
+networks are loaded once rather than per match and a slow player only holds up its own games.
+
+The coordinator owns the state machine and drives every game itself - it sends the last joint
+move to both players, checks the replies are legal and applies them.  Every request has a
+deadline (the move time plus some slack for the connection).  A player that misses it has its
+connection dropped and a random legal move is played for it, as in GGP competitions.
+
+Many matches run at once, one thread each.  All the time is spent waiting on sockets so threads
+are cheap here, and the ratings / archive are only touched under the coordinator's lock.  With
+paired=True, each thread plays an opening twice with colours swapped, and the pair is rated as
+one result (see elo.pair_result()).
+
+Players are described in a json file of rating name -> spec, where spec is either
+
+  {"kind": "puct", "game": "connect6", "gen": "h2_310", "playouts": 800, "version": 3, ...}
+
+with any extra keys passed on to elo.define_player(), or a get_player() kind ("r", "m", "s")
+and its options, eg {"kind": "s", "max_tree_playout_iterations": 800}.
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import random
+import functools
+import httplib
+import threading
+import subprocess
+
+from ggplib.util import log
+
+import elo
+import metrics
+import gamelength
+import gamearchive
+from ratings import elo_dump_and_save
+
+
+DEFAULT_BASE_PORT = 9200
+DEFAULT_CONCURRENCY = 8
+
+# seconds
+START_CLOCK = 60
+STARTUP_TIMEOUT = 300.0
+SLACK = 5.0
+
+MAX_PLIES = 1000
+
+# pairs sampled per choice when running games in parallel, the longest expected is started first
+LONGEST_FIRST_SAMPLES = 3
+
+
+class PlayerError(Exception):
+    pass
+
+
+class PlayerTimeout(PlayerError):
+    pass
+
+
+def normalise_move(move):
+    move = re.sub(r"([()])", r" \1 ", move)
+    return " ".join(move.split()).lower()
+
+
+def format_joint_move(moves):
+    if moves is None:
+        return "nil"
+    return "(%s)" % " ".join(moves)
+
+
+class PlayerProcess(object):
+    def __init__(self, name, specs_filename, port, host="127.0.0.1"):
+        self.name = name
+        self.specs_filename = specs_filename
+        self.port = port
+        self.host = host
+
+        self.proc = None
+        self.conn = None
+        self.timeouts = 0
+
+    def start(self):
+        cmd = [sys.executable, os.path.abspath(__file__), "serve",
+               self.specs_filename, self.name, "--port=%d" % self.port]
+        self.proc = subprocess.Popen(cmd)
+
+    def wait_ready(self, timeout=STARTUP_TIMEOUT):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise PlayerError("%s exited on startup" % self.name)
+            try:
+                socket.create_connection((self.host, self.port), timeout=1.0).close()
+                return
+            except socket.error:
+                time.sleep(0.25)
+
+        raise PlayerError("%s not listening on port %d" % (self.name, self.port))
+
+    def disconnect(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def request(self, message, timeout):
+        ''' sends a GGP message and returns the reply.  Raises PlayerTimeout after timeout
+        seconds. '''
+        if self.conn is None:
+            self.conn = httplib.HTTPConnection(self.host, self.port, timeout=timeout)
+
+        self.conn.timeout = timeout
+        if self.conn.sock is not None:
+            self.conn.sock.settimeout(timeout)
+
+        try:
+            self.conn.request("POST", "/", message, {"Content-Type": "text/acl"})
+            return self.conn.getresponse().read().strip()
+
+        except socket.timeout:
+            # a late reply would be read as the answer to the next request
+            self.disconnect()
+            self.timeouts += 1
+            raise PlayerTimeout("%s timed out after %.1fs" % (self.name, timeout))
+
+        except (socket.error, httplib.HTTPException) as exc:
+            self.disconnect()
+            raise PlayerError("%s: %s" % (self.name, exc))
+
+    def stop(self):
+        self.disconnect()
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+
+
+class PlayerPool(object):
+    ''' one persistent process per player, listening on consecutive ports '''
+
+    def __init__(self, specs_filename, names, base_port=DEFAULT_BASE_PORT):
+        self.players = dict((name, PlayerProcess(name, specs_filename, base_port + ii))
+                            for ii, name in enumerate(sorted(names)))
+
+    def __getitem__(self, name):
+        return self.players[name]
+
+    def start(self):
+        # start them all, then wait - loading networks happens in parallel
+        for p in self.players.values():
+            p.start()
+        for p in self.players.values():
+            p.wait_ready()
+
+    def shutdown(self):
+        for p in self.players.values():
+            p.stop()
+
+
+def ask_all(requests):
+    ''' requests is a list of (player, message, timeout), sent concurrently.  Returns a list of
+    (reply, seconds), where reply is None if the player failed to respond. '''
+    results = [None] * len(requests)
+
+    def ask(ii, player, message, timeout):
+        start_time = time.time()
+        try:
+            reply = player.request(message, timeout)
+        except PlayerError as exc:
+            log.warning(str(exc))
+            reply = None
+        results[ii] = reply, time.time() - start_time
+
+    threads = [threading.Thread(target=ask, args=(ii,) + r) for ii, r in enumerate(requests)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def joint_opening(game_info, gdl_moves):
+    ''' returns joint moves for a sequence of single gdl moves (each the mover's), with the other
+    roles playing their only legal move '''
+    sm = game_info.get_sm()
+    sm.reset()
+    joint_move = sm.get_joint_move()
+    base_state = sm.new_base_state()
+
+    res = []
+    for move in gdl_moves:
+        move = normalise_move(move)
+        joint = []
+        for ri in range(len(sm.get_roles())):
+            ls = sm.get_legal_state(ri)
+            choices = [ls.get_legal(ii) for ii in range(ls.get_count())]
+            legals = dict((normalise_move(sm.legal_to_move(ri, l)), l) for l in choices)
+            choice = move if move in legals else (legals.keys()[0] if len(legals) == 1 else None)
+            assert choice is not None, "opening move %s not legal" % move
+
+            joint_move.set(ri, legals[choice])
+            joint.append(choice)
+
+        res.append(joint)
+        sm.next_state(joint_move, base_state)
+        sm.update_bases(base_state)
+    return res
+
+
+def elo_opening(game_info, match_info, move_generator):
+    ''' an opening from one of elo.py's move generators, as joint gdl moves (or None) '''
+    moves = move_generator()
+    if moves is None:
+        return None
+    return joint_opening(game_info, [gdl for move in moves
+                                     for gdl in match_info.convert_move_to_gdl(move)])
+
+
+def play_match(game_info, rules, players, move_time, opening=None, cancel=None, ply_limit=None):
+    ''' plays one game between two PlayerProcess (in role order), returns a GameRecord.
+
+    opening is an optional list of joint moves (gdl) to force at the start of the game, cancel
+    an optional threading.Event to abort the game.  Games are adjudicated as in
+    gamelength.Progress, with ply_limit as the early MatchTooLong limit. '''
+    sm = game_info.get_sm()
+    sm.reset()
+    roles = sm.get_roles()
+    opening = list(opening or [])
+
+    record = gamearchive.GameRecord(gamearchive.new_game_id(),
+                                    game_info.game,
+                                    players=[p.name for p in players],
+                                    opening=list(opening),
+                                    source="asyncmatch")
+    match_id = record.game_id
+    start_time = time.time()
+
+    joint_move = sm.get_joint_move()
+    base_state = sm.new_base_state()
+    progress = gamelength.Progress(ply_limit)
+
+    ask_all([(p, "(START %s %s %s %d %d)" % (match_id, role, rules, START_CLOCK, move_time),
+              START_CLOCK + SLACK) for p, role in zip(players, roles)])
+
+    last_moves = None
+    while not sm.is_terminal():
+        verdict = progress.adjudicate()
+        if len(record.moves) >= MAX_PLIES:
+            verdict = "MatchTooLong"
+        elif cancel is not None and cancel.is_set():
+            verdict = "Aborted"
+
+        if verdict is not None:
+            if verdict in ("MatchTooLong", "Aborted"):
+                record.result = verdict
+            else:
+                record.result = "Adjudicated %s" % verdict
+                record.scores = [50] * len(roles)
+            ask_all([(p, "(ABORT %s)" % match_id, SLACK) for p in players])
+            break
+
+        legals = []
+        for ri in range(len(roles)):
+            ls = sm.get_legal_state(ri)
+            choices = [ls.get_legal(ii) for ii in range(ls.get_count())]
+            legals.append(dict((normalise_move(sm.legal_to_move(ri, l)), l) for l in choices))
+
+        message = "(PLAY %s %s)" % (match_id, format_joint_move(last_moves))
+        replies = ask_all([(p, message, move_time + SLACK) for p in players])
+        forced = opening.pop(0) if opening else None
+
+        last_moves = []
+        for ri, (reply, secs) in enumerate(replies):
+            move = normalise_move(forced[ri] if forced else reply or "")
+            if move not in legals[ri]:
+                log.warning("%s: illegal or missing move '%s', playing random" %
+                            (players[ri].name, reply))
+                move = random.choice(legals[ri].keys())
+
+            legal = legals[ri][move]
+            joint_move.set(ri, legal)
+            last_moves.append(sm.legal_to_move(ri, legal))
+
+            if len(legals[ri]) > 1:
+                record.move_times.append([ri, secs])
+
+        record.moves.append(last_moves)
+        sm.next_state(joint_move, base_state)
+        sm.update_bases(base_state)
+        progress.update(tuple(base_state.get(i) for i in range(base_state.len())))
+
+    if sm.is_terminal():
+        record.scores = [sm.get_goal_value(ri) for ri in range(len(roles))]
+        ask_all([(p, "(STOP %s %s)" % (match_id, format_joint_move(last_moves)), SLACK)
+                 for p in players])
+
+    record.timestamp = time.time()
+    record.duration = record.timestamp - start_time
+    return record
+
+
+###############################################################################
+
+class RemotePlayer(object):
+    ''' stands in for a ggpzero player in elo.prepare_ratings() / elo.choose_players() '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+
+class Coordinator(object):
+    def __init__(self, game, pool, filename, move_time=elo.MOVE_TIME,
+                 concurrency=DEFAULT_CONCURRENCY, opening_generator=None, paired=False):
+        import rulesheets
+
+        self.game = game
+        self.pool = pool
+        self.filename = filename
+        self.move_time = move_time
+        self.concurrency = concurrency
+        self.opening_generator = opening_generator
+        self.paired = paired
+
+        self.game_info = rulesheets.get_game_info(game)
+        with open(rulesheets.kif_filename(game)) as f:
+            self.rules = "(%s)" % rulesheets.normalise(f.read())
+
+        self.all_players = [RemotePlayer(name) for name in sorted(pool.players)]
+        self.ratings = elo.prepare_ratings(game, self.all_players, filename)
+
+        self.archive = None
+        if elo.ARCHIVE_GAMES:
+            self.archive = gamearchive.GameArchive(gamearchive.archive_filename(filename))
+
+        self.stats = None
+        if elo.EXPORT_METRICS:
+            self.stats = metrics.Metrics(filename, game, elo.CHOOSE_BUCKETS)
+
+        self.lengths = gamelength.load(filename, "asyncmatch")
+
+        self.cond = threading.Condition()
+        self.cancel = threading.Event()
+        self.busy = set()
+        self.threads = []
+
+    def ply_limit(self):
+        return self.lengths.limit() if elo.PREDICT_LENGTH else None
+
+    def choose(self):
+        idle = [p for p in self.all_players if p.name not in self.busy]
+        if len(idle) < 2:
+            return None
+
+        if self.concurrency == 1:
+            return elo.choose_players(idle)
+
+        # long games first, so the pool isn't left waiting on one at the end
+        def expected(players):
+            return self.lengths.expected_duration(*[p.name for p in players])
+
+        pairs = [elo.choose_players(idle) for _ in range(LONGEST_FIRST_SAMPLES)]
+        pairs = [pair for pair in pairs if pair is not None]
+        return max(pairs, key=expected) if pairs else None
+
+    def _archive(self, record):
+        if self.archive is not None:
+            self.archive.append(record)
+        self.lengths.add(record)
+
+    def finished(self, player0, player1, record, rate=True):
+        ''' called with the lock held.  with rate=False the game is logged / archived, but the
+        ratings are left to the caller. '''
+        if not record.scores:
+            self._archive(record)
+            err = "%s, %s v %s" % (record.result, player0, player1)
+            self.ratings.log.append(err)
+            print "match aborted", err
+
+            if self.stats is not None and record.result == "MatchTooLong":
+                self.stats.record(record.duration, too_long=True)
+                self.stats.write(self.ratings)
+            return
+
+        score0, score1 = record.scores
+        res_str, player0_wins, k = elo.match_result(score0, score1,
+                                                    player0.rating, player1.rating)
+        adjudicated = record.result
+        record.result = adjudicated or res_str
+        self._archive(record)
+
+        res_str = "%s: %s (%.1f) / %s (%.1f) " % (res_str, player0.name, player0.rating.elo,
+                                                  player1.name, player1.rating.elo)
+        if adjudicated:
+            res_str += adjudicated
+        print res_str
+        self.ratings.log.append(res_str)
+
+        if rate:
+            elo.update_ratings(player0.rating, player1.rating, player0_wins, k)
+            elo_dump_and_save(self.filename, self.ratings)
+
+        if self.stats is not None:
+            self.stats.record(record.duration)
+            self.stats.write(self.ratings)
+
+    def finished_pair(self, player0, player1, record0, record1):
+        ''' called with the lock held, record1 is record0's opening with colours swapped '''
+        self.finished(player0, player1, record0, rate=False)
+        self.finished(player1, player0, record1, rate=False)
+
+        if record0.scores and record1.scores:
+            score, k = elo.pair_result(record0, record1, player0.rating, player1.rating)
+            elo.update_ratings(player0.rating, player1.rating, score, k, games=2)
+
+        elif record0.scores or record1.scores:
+            # one game too long, rate the other alone
+            record, p0, p1 = ((record0, player0, player1) if record0.scores else
+                              (record1, player1, player0))
+            _, player0_wins, k = elo.match_result(record.scores[0], record.scores[1],
+                                                  p0.rating, p1.rating)
+            elo.update_ratings(p0.rating, p1.rating, player0_wins, k)
+
+        else:
+            return
+
+        elo_dump_and_save(self.filename, self.ratings)
+
+    def _play(self, player0, player1):
+        opening = self.opening_generator() if self.opening_generator else None
+        try:
+            # paired, the same opening is played again with colours swapped
+            order = [(player0, player1)]
+            if self.paired:
+                order.append((player1, player0))
+            records = []
+            for p0, p1 in order:
+                records.append(play_match(self.game_info, self.rules,
+                                          [self.pool[p0.name], self.pool[p1.name]],
+                                          self.move_time, opening=opening, cancel=self.cancel,
+                                          ply_limit=self.ply_limit()))
+
+            with self.cond:
+                if self.paired:
+                    self.finished_pair(player0, player1, *records)
+                else:
+                    self.finished(player0, player1, records[0])
+
+        finally:
+            with self.cond:
+                self.busy.discard(player0.name)
+                self.busy.discard(player1.name)
+                self.cond.notify_all()
+
+    def run(self, num_games):
+        started = 0
+        with self.cond:
+            while started < num_games and not self.cancel.is_set():
+                players = None
+                if len(self.busy) < 2 * self.concurrency:
+                    players = self.choose()
+
+                if players is None:
+                    if not self.busy:
+                        break
+
+                    # wait for a game to finish (timeout so ctrl-c is seen)
+                    self.cond.wait(1.0)
+                    continue
+
+                player0, player1 = players
+                self.busy.update((player0.name, player1.name))
+
+                t = threading.Thread(target=self._play, args=(player0, player1))
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+                started += 1
+
+                # check if there are any LG games waiting, and finish up if so
+                if elo.check_lg():
+                    break
+
+        for t in self.threads:
+            while t.is_alive():
+                t.join(1.0)
+
+
+def load_specs(specs_filename):
+    with open(specs_filename) as f:
+        return json.load(f)
+
+
+def make_player(spec):
+    spec = dict((str(k), v) for k, v in spec.items())
+    kind = spec.pop("kind")
+    if kind == "puct":
+        return elo.define_player(spec.pop("game"), spec.pop("gen"),
+                                 spec.pop("playouts", 800), spec.pop("version", 3), **spec)
+
+    from ggpzero.battle.common import get_player
+    return get_player(kind, elo.MOVE_TIME, **spec)
+
+
+###############################################################################
+
+class Runner(object):
+    """Tournaments with out of process players."""
+
+    def serve(self, specs_filename, name, port):
+        ''' runs a single player as a GGP http server (started by the pool) '''
+        from ggplib.play import play_runner
+        play_runner(make_player(load_specs(specs_filename)[name]), port)
+
+    def play(self, game, specs_filename, filename=None, num_games=elo.NUM_GAMES,
+             concurrency=DEFAULT_CONCURRENCY, move_time=elo.MOVE_TIME,
+             base_port=DEFAULT_BASE_PORT, paired=False, predict_length=False):
+        filename = filename or "../data/elo/%s.elo" % game
+
+        elo.PREDICT_LENGTH = predict_length
+        pool = PlayerPool(specs_filename, load_specs(specs_filename), base_port)
+        pool.start()
+        try:
+            coordinator = Coordinator(game, pool, filename, move_time, concurrency,
+                                      paired=paired)
+            if game in elo.MOVE_GENERATORS:
+                # same openings as elo's tournaments for this game
+                coordinator.opening_generator = functools.partial(
+                    elo_opening, coordinator.game_info, elo.match_info_for(game),
+                    elo.MOVE_GENERATORS[game])
+            try:
+                coordinator.run(num_games)
+            except KeyboardInterrupt:
+                coordinator.cancel.set()
+                coordinator.run(0)
+        finally:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,154 @@
+''' board symmetries as precomputed permutation index arrays.
+
+Each geometry precomputes, for every symmetry, a permutation of cell indices (cell = y * size +
+x).  Applying a symmetry to a batch of moves, or to a batch of board tensors, is then a single
+numpy gather - no per move python.
+
+  * square boards have the 8 dihedral symmetries.
+  * hex boards (rhombus, as used by hexLG*) only have identity and 180 degree rotation.  The
+    transpose (x, y) -> (y, x) is also a symmetry but swaps the players' edges, so is only
+    included if asked for (with_colour_swap=True).
+
+Moves as strings come in two styles:
+
+  alnum - column letter, then 1 based row number ("j10", connect6)
+  alpha - column letter, then row letter ("cb", hex)
+'''
+
+import numpy as np
+
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+# used to hash boards for deduplication
+HASH_SEED = 0x5eed
+
+
+def _dihedral(size):
+    ''' returns list of functions (x, y) -> (x, y) for the 8 square symmetries '''
+    n = size - 1
+    return [lambda x, y: (x, y),
+            lambda x, y: (n - y, x),
+            lambda x, y: (n - x, n - y),
+            lambda x, y: (y, n - x),
+            lambda x, y: (n - x, y),
+            lambda x, y: (y, x),
+            lambda x, y: (x, n - y),
+            lambda x, y: (n - y, n - x)]
+
+
+def _hex(size, with_colour_swap):
+    n = size - 1
+    fns = [lambda x, y: (x, y),
+           lambda x, y: (n - x, n - y)]
+    if with_colour_swap:
+        fns += [lambda x, y: (y, x),
+                lambda x, y: (n - y, n - x)]
+    return fns
+
+
+class Geometry(object):
+    def __init__(self, size, fns):
+        self.size = size
+        self.num_cells = size * size
+
+        y, x = np.divmod(np.arange(self.num_cells), size)
+
+        # perms[s][cell] is where cell goes under symmetry s
+        perms = []
+        for fn in fns:
+            nx, ny = fn(x, y)
+            perms.append(ny * size + nx)
+        self.perms = np.array(perms, dtype=np.int32)
+
+        # inverse[s][cell] is where cell came from, used to gather board tensors
+        self.inverse = np.argsort(self.perms, axis=1).astype(np.int32)
+
+    @property
+    def num_symmetries(self):
+        return len(self.perms)
+
+    ###########################################################################
+    # moves
+
+    def parse_move(self, move, style="alnum"):
+        x = LETTERS.index(move[0])
+        if style == "alnum":
+            y = int(move[1:]) - 1
+        else:
+            y = LETTERS.index(move[1])
+        assert 0 <= x < self.size and 0 <= y < self.size, "bad move %s" % move
+        return y * self.size + x
+
+    def format_move(self, cell, style="alnum"):
+        y, x = divmod(int(cell), self.size)
+        if style == "alnum":
+            return "%s%d" % (LETTERS[x], y + 1)
+        return "%s%s" % (LETTERS[x], LETTERS[y])
+
+    def parse_moves(self, moves, style="alnum"):
+        return np.array([self.parse_move(m, style) for m in moves], dtype=np.int32)
+
+    def format_moves(self, cells, style="alnum"):
+        return [self.format_move(c, style) for c in cells]
+
+    def transform_cells(self, cells, sym):
+        ''' cells is any shaped array of cell indices.  sym may be an int, or an array that
+        broadcasts against cells (ie one symmetry per row) '''
+        return self.perms[sym, cells]
+
+    def all_symmetries_cells(self, cells):
+        ''' returns (num_symmetries, ...) array of cells under every symmetry '''
+        return self.perms[:, cells]
+
+    def transform_moves(self, moves, sym, style="alnum"):
+        return self.format_moves(self.transform_cells(self.parse_moves(moves, style), sym), style)
+
+    ###########################################################################
+    # board tensors, last two dims (size, size)
+
+    def transform_boards(self, boards, sym):
+        flat = boards.reshape(boards.shape[:-2] + (self.num_cells,))
+        return flat[..., self.inverse[sym]].reshape(boards.shape)
+
+    def augment(self, boards):
+        ''' returns (num_symmetries * N, ...) - every board under every symmetry '''
+        flat = boards.reshape(boards.shape[:-2] + (self.num_cells,))
+        res = np.moveaxis(flat[..., self.inverse], -2, 0)
+        return res.reshape((-1,) + boards.shape[1:])
+
+    def canonical_hashes(self, boards):
+        ''' (N, ..., size, size) -> (N,) uint64 hash that is the same for symmetric boards '''
+        flat = boards.reshape(boards.shape[0], -1, self.num_cells)
+        rng = np.random.RandomState(HASH_SEED)
+        weights = rng.randint(1, 2 ** 62, size=flat.shape[1:], dtype=np.int64).astype(np.uint64)
+
+        hashes = []
+        for inv in self.inverse:
+            h = (flat[..., inv].astype(np.uint64) * weights).sum(axis=(1, 2))
+            hashes.append(h)
+        return np.min(hashes, axis=0)
+
+    def dedup(self, boards):
+        ''' returns indices of the first of each set of symmetrically equivalent boards '''
+        _, first = np.unique(self.canonical_hashes(boards), return_index=True)
+        return np.sort(first)
+
+
+def square(size):
+    return Geometry(size, _dihedral(size))
+
+
+def hexagonal(size, with_colour_swap=False):
+    return Geometry(size, _hex(size, with_colour_swap))
+
+
+_cache = {}
+
+
+def get(kind, size, **kwds):
+    ''' geometries are cached, so are built once per process '''
+    key = (kind, size) + tuple(sorted(kwds.items()))
+    if key not in _cache:
+        _cache[key] = dict(square=square, hex=hexagonal)[kind](size, **kwds)
+    return _cache[key]
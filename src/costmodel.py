@@ -0,0 +1,191 @@
+''' compute cost accounting for models/generations.
+
+Derives parameter counts and flops per evaluation (batch size 1, inference) from the keras
+model json in data/<game>/models.  Results are cached per model in a json file next to the
+models, keyed on the model file's size/mtime.
+
+The compute spent to reach a generation is estimated as self play inference cost:
+
+    positions_per_gen * evals_per_move * flops_per_eval(model used at that point)
+
+summed over generations, using the nearest model (by generation number) of the same series that
+we have a json for.  A series forked from another (eg hex13 c2 from c1 at generation 275) starts
+from its parent's total at the branch point.  positions_per_gen and evals_per_move are not
+recorded anywhere, so they are parameters - this gives a compute axis that is comparable between
+runs, rather than an absolute number.
+'''
+
+import os
+import json
+
+import kerasgraph
+
+
+CACHE_FILENAME = ".cost_cache.json"
+
+POSITIONS_PER_GEN = 50000
+EVALS_PER_MOVE = 800
+
+
+def layer_cost(layer):
+    ''' returns (params, flops) for a single layer '''
+    kind = layer.class_name
+    cfg = layer.config
+    in_shape = layer.input_shapes[0] if layer.input_shapes else ()
+    out_size = kerasgraph.prod(layer.output_shape)
+
+    if kind == "Conv2D":
+        fmt = cfg.get("data_format", "channels_first")
+        cin = in_shape[0] if fmt == "channels_first" else in_shape[-1]
+        kh, kw = cfg["kernel_size"]
+        params = kh * kw * cin * cfg["filters"]
+        flops = 2 * kh * kw * cin * out_size
+        if cfg["use_bias"]:
+            params += cfg["filters"]
+            flops += out_size
+        return params, flops
+
+    if kind == "Dense":
+        fan_in = in_shape[-1]
+        params = fan_in * cfg["units"]
+        flops = 2 * fan_in * out_size
+        if cfg["use_bias"]:
+            params += cfg["units"]
+            flops += out_size
+        return params, flops
+
+    if kind == "BatchNormalization":
+        channels = in_shape[cfg["axis"] - 1] if cfg["axis"] > 0 else in_shape[cfg["axis"]]
+        params = channels * (2 + int(cfg["scale"]) + int(cfg["center"]))
+        return params, 2 * out_size
+
+    if kind in ("Activation", "Add", "Multiply"):
+        return 0, out_size
+
+    if kind in ("AveragePooling2D", "MaxPooling2D", "GlobalAveragePooling2D"):
+        return 0, kerasgraph.prod(in_shape)
+
+    if kind == "Lambda":
+        # antirectifier: mean, subtract, l2 normalise, 2 x relu
+        return 0, 6 * kerasgraph.prod(in_shape)
+
+    # shape only (reshape, permute, flatten, concatenate, dropout at inference, input)
+    return 0, 0
+
+
+def model_cost(graph):
+    params = flops = 0
+    for layer in graph.layers:
+        p, f = layer_cost(layer)
+        params += p
+        flops += f
+
+    return dict(params=params,
+                flops_per_eval=flops,
+                input_shape=list(graph.input_shape))
+
+
+def _cache_key(filename):
+    st = os.stat(filename)
+    return "%s:%s" % (st.st_size, int(st.st_mtime))
+
+
+class ModelCosts(object):
+    ''' per model costs for one models directory, cached on disk '''
+
+    def __init__(self, models_dir):
+        self.models_dir = models_dir
+        self.cache_filename = os.path.join(models_dir, CACHE_FILENAME)
+        self.cache = {}
+        if os.path.exists(self.cache_filename):
+            with open(self.cache_filename) as f:
+                self.cache = json.load(f)
+
+    def model_names(self):
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.models_dir)
+                      if f.endswith(".json") and not f.startswith("."))
+
+    def get(self, gen):
+        filename = os.path.join(self.models_dir, "%s.json" % gen)
+        key = _cache_key(filename)
+
+        entry = self.cache.get(gen)
+        if entry is None or entry["key"] != key:
+            entry = model_cost(kerasgraph.load(filename))
+            entry["key"] = key
+            self.cache[gen] = entry
+            self.save()
+
+        return entry
+
+    def save(self):
+        try:
+            with open(self.cache_filename, "w") as f:
+                json.dump(self.cache, f, indent=4, sort_keys=True)
+        except IOError:
+            # read only checkouts are fine, just no caching
+            pass
+
+    def series_models(self, series):
+        ''' returns sorted list of (gen number, cost) for all models in series '''
+        res = []
+        for name in self.model_names():
+            if name.rsplit("_", 1)[0] == series:
+                res.append((int(name.rsplit("_", 1)[1]), self.get(name)))
+        res.sort()
+        return res
+
+
+class CumulativeCompute(object):
+    ''' estimated compute (flops) spent to reach generation N of a series '''
+
+    def __init__(self, model_costs, positions_per_gen=POSITIONS_PER_GEN,
+                 evals_per_move=EVALS_PER_MOVE, parents=None):
+        self.model_costs = model_costs
+
+        # series -> (parent series, generation of the parent it was forked at)
+        self.parents = parents or {}
+        self.positions_per_gen = positions_per_gen
+        self.evals_per_move = evals_per_move
+        self.series_cache = {}
+
+    def flops_at(self, series, gen, fallback=None):
+        if series not in self.series_cache:
+            self.series_cache[series] = self.model_costs.series_models(series)
+
+        models = self.series_cache[series]
+        if not models:
+            assert fallback is not None, "no models for series %s" % series
+            return fallback
+
+        _, cost = min(models, key=lambda m: abs(m[0] - gen))
+        return cost["flops_per_eval"]
+
+    def __call__(self, series, gen, fallback=None):
+        per_eval = [self.flops_at(series, g, fallback) for g in range(gen + 1)]
+        res = sum(per_eval) * float(self.positions_per_gen * self.evals_per_move)
+
+        if series in self.parents:
+            parent, branch_gen = self.parents[series]
+            res += self(parent, branch_gen, fallback)
+        return res
+
+
+###############################################################################
+
+class Runner(object):
+    """Model cost accounting."""
+
+    def show(self, models_dir):
+        costs = ModelCosts(models_dir)
+        for name in costs.model_names():
+            c = costs.get(name)
+            print "%-12s %10d params  %8.1f MFLOPs/eval  input %s" % (name, c["params"],
+                                                                      c["flops_per_eval"] / 1e6,
+                                                                      c["input_shape"])
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -1,19 +1,17 @@
 import os
-import math
+import time
 import random
-import operator
-from functools import partial
-
-# 3rd party: https://github.com/google/python-fire
-import fire
+from functools import partial, wraps
 
 from ggplib.util import log
 
-from ggpzero.util import attrutil as at
-from ggpzero.util import symmetry
-from ggpzero.nn import manager
-
-from ggpzero.battle.common import get_player, run, MatchTooLong
+import genwatch
+import metrics
+import gamelength
+import profiler
+import gamearchive
+from ratings import (PlayerRating, AllRatings, probability, next_elo_rating, load_ratings,
+                     elo_dump_and_save, retire)
 
 
 NUM_GAMES = 20
@@ -26,60 +24,60 @@ INITIAL_K = 100.0
 CHOOSE_BUCKETS = [10, 20, 30, 40, 50, 60, 80, 100]
 CHECK_LG = True
 
+# keep every played game in <elo file base>.games
+ARCHIVE_GAMES = True
 
-def check_lg():
-    if not CHECK_LG:
-        return False
-    try:
-        import check_lg
-        return check_lg.check_lg()
-    except ImportError:
-        return False
-
-
-def probability(rating1, rating2):
-    return 1.0 * 1.0 / (1 + 1.0 * math.pow(10, 1.0 * (rating1 - rating2) / 400))
+# retire settled players far below the frontier (see ratings.retire), up to RETIRE_MAX a run
+AUTO_RETIRE = False
 
+# rewrite <elo file base>.metrics.json / .prom after every game
+EXPORT_METRICS = True
 
-def next_elo_rating(rating_a, rating_b, k0, k1, player_a_wins):
+# play each opening twice with colours swapped, and rate the pair as one result, set by
+# Runner(paired=True).  See pair_result().
+PAIRED_OPENINGS = False
 
-    # Winning probability of players
-    pa = probability(rating_b, rating_a)
-    pb = probability(rating_a, rating_b)
+# abort games as MatchTooLong once far longer than any in the archive (see gamelength), set by
+# Runner(predict_length=True)
+PREDICT_LENGTH = False
 
-    # When Player A wins
-    if player_a_wins:
-        new_rating_a = rating_a + k0 * (1.0 - pa)
-        new_rating_b = rating_b + k1 * (0.0 - pb)
-    else:
-        new_rating_a = rating_a + k0 * (0.0 - pa)
-        new_rating_b = rating_b + k1 * (1.0 - pb)
+# phase timings, set by Runner(profile=...)
+PROFILER = profiler.NULL
 
-    log.info("rating_a k=%s %s -> %s" % (k0, rating_a, new_rating_a))
-    log.info("rating_b k=%s %s -> %s" % (k1, rating_b, new_rating_b))
-    return new_rating_a, new_rating_b
+# add new generations to the running tournament as they are trained, set by Runner(watch=True)
+WATCH_GENERATIONS = False
 
+# only rate the generations genplan chooses, set by Runner(plan=True)
+PLAN_GENERATIONS = False
 
-@at.register_attrs
-class PlayerRating(object):
-    name = at.attribute("xxyyyzz")
-    played = at.attribute(42)
-    elo = at.attribute(1302.124)
-    fixed = at.attribute(False)
+# screen generations at low fidelity before full matches, set by Runner(screen=True)
+SCREEN_GENERATIONS = False
 
 
-@at.register_attrs
-class AllRatings(object):
-    game = at.attribute("game")
+def check_lg():
+    if not CHECK_LG:
+        return False
+    try:
+        import check_lg
+        return check_lg.check_lg()
+    except ImportError:
+        return False
 
-    # list of PlayerRating
-    players = at.attribute(default=at.attr_factory(list))
 
-    # simple log of recent games
-    log = at.attribute(default=at.attr_factory(list))
+def profiled(name):
+    ''' decorator, times calls as a phase of PROFILER '''
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwds):
+            with PROFILER.phase(name):
+                return fn(*args, **kwds)
+        return wrapper
+    return decorator
 
 
-def define_player(game, gen, playouts, version, **extra_opts):
+@profiled("define_player")
+def define_player(game, gen, playouts, version, move_time=None, **extra_opts):
+    move_time = move_time or MOVE_TIME
     opts = dict(verbose=True,
                 puct_constant=0.85,
 
@@ -106,6 +104,8 @@ def define_player(game, gen, playouts, version, **extra_opts):
                 # Passed in
                 playouts_per_iteration=playouts)
 
+    from ggpzero.battle.common import get_player
+
     if version == 3:
         opts.update(name="%s_v3" % game,
 
@@ -123,10 +123,10 @@ def define_player(game, gen, playouts, version, **extra_opts):
 
                     batch_size=8,
 
-                    think_time=MOVE_TIME,
+                    think_time=move_time,
                     converged_visits=playouts / 2)
         opts.update(extra_opts)
-        return get_player("puct", MOVE_TIME, gen, **opts)
+        player = get_player("puct", move_time, gen, **opts)
 
     elif version == 2:
         opts.update(name="%s_v2" % game,
@@ -135,11 +135,11 @@ def define_player(game, gen, playouts, version, **extra_opts):
 
                     batch_size=8,
 
-                    think_time=MOVE_TIME,
+                    think_time=move_time,
                     converge_relaxed=playouts / 2)
 
         opts.update(extra_opts)
-        return get_player("puct", MOVE_TIME, gen, **opts)
+        player = get_player("puct", move_time, gen, **opts)
 
     elif version == 1:
         assert False, "Deprecated with puct1 removal"
@@ -147,31 +147,20 @@ def define_player(game, gen, playouts, version, **extra_opts):
     else:
         assert False, "invalid version: %s" % version
 
-
-def elo_dump_and_save(filename, ratings, verbose=False):
-    if verbose:
-        print "ELO DUMP:"
-        print "========="
-
-    # sort in place, so also benefit by saving in this order
-    ratings.players.sort(reverse=True,
-                         key=operator.attrgetter("elo"))
-    if verbose:
-        for p in ratings.players:
-            print p.name, p.played, p.elo
-
-    with open(filename, "w") as f:
-        contents = at.attr_to_json(ratings, pretty=True)
-        f.write(contents)
+    # so the same generation can be redefined at another fidelity (see screen())
+    player.define_args = (game, gen, version, extra_opts)
+    return player
 
 
 def choose_players(all_players, verbose=False):
     ''' will return None if no candidates '''
 
+    # retired players keep their rating, and are only scheduled as opponents (anchors)
     all_players = [p for p in all_players if hasattr(p, "rating")]
+    active = [p for p in all_players if not p.rating.retired]
 
     for count in CHOOSE_BUCKETS:
-        candidates = [c for c in all_players if c.rating.played < count]
+        candidates = [c for c in active if c.rating.played < count]
         if candidates:
             break
     else:
@@ -235,42 +224,113 @@ def choose_players(all_players, verbose=False):
         return second_player, first_player
 
 
-def gen_elo(match_info, all_players, filename, move_generator=None, verbose=False):
-    if os.path.exists(filename):
-        ratings = at.json_to_attr(open(filename).read())
+def match_result(score0, score1, rating0, rating1):
+    ''' returns (result string, player0_wins, k) from final scores '''
+    k = INITIAL_K
+    if score0 == 100:
+        return "1st player wins", True, k
+
+    if score1 == 100:
+        return "2nd player wins", False, k
+
+    # fake a win for player with lower elo
+    return "Draws", rating0.elo < rating1.elo, k / 2.0
+
+
+def getk(r, o, k):
+    if r.fixed or r.retired:
+        return 0.0
+
+    if r.played < 10:
+        return k * 2
+
+    if r.played < 20:
+        scale = 1.0 + (20 - r.played) / 2.0
+        return k * scale
+
+    if r.played < 40:
+        return k
+
+    if r.played < 60:
+        return k / 2.0
+
+    if r.played > 60:
+        kx = k / 2.5
+
     else:
-        ratings = AllRatings(match_info.name)
+        kx = k
+
+    # extra penalty if o not established
+    if o.played < 10:
+        kx /= 10.0
+
+    elif o.played < 20:
+        kx /= 3.0
+
+    elif o.played < 40:
+        kx /= 2.0
+
+    return kx
+
+
+def update_ratings(rating0, rating1, player0_wins, k, games=1, verbose=True):
+    ''' player0_wins may also be a fractional score, eg for a pair of games.  verbose=False
+    skips logging, for bulk replays (elomerge). '''
+    rating0.played += games
+    rating1.played += games
+
+    rating0.elo, rating1.elo = next_elo_rating(rating0.elo,
+                                               rating1.elo,
+                                               getk(rating0, rating1, k),
+                                               getk(rating1, rating0, k),
+                                               player0_wins,
+                                               verbose)
 
-        # only add random if in all_players
-        if "random" in all_players:
-            ratings.players.append(PlayerRating("random", fixed=True, elo=500.0))
 
-    # add in all the players
+def admit_players(ratings, all_players, verbose=False):
+    ''' attaches ratings to players (as p.rating), adding at most MAX_ADD_COUNT unsettled
+    players at a time.  returns players newly added. '''
+    by_name = dict((info.name, info) for info in ratings.players)
 
     # slow add one playeer
+    added = []
     slow_add_count = 0
     for p in all_players:
         if verbose:
             print "Adding", p.get_name()
 
-        playerinfo = None
-        for info in ratings.players:
-            if info.name == p.get_name():
-                playerinfo = info
-
+        playerinfo = by_name.get(p.get_name())
         if playerinfo is None:
             if slow_add_count >= MAX_ADD_COUNT:
                 if verbose:
-                    print "SKIPPING for now", playerinfo
+                    print "SKIPPING for now", p.get_name()
                 continue
             else:
                 playerinfo = PlayerRating(p.get_name(), 0, STARTING_ELO)
                 ratings.players.append(playerinfo)
+                by_name[playerinfo.name] = playerinfo
+                added.append(p)
 
         p.rating = playerinfo
         if playerinfo.played < 20:
             slow_add_count += 1
 
+    return added
+
+
+def prepare_ratings(game, all_players, filename, verbose=False):
+    ''' loads (or creates) ratings, and attaches a rating to each player as p.rating '''
+    if os.path.exists(filename):
+        ratings = load_ratings(filename)
+    else:
+        ratings = AllRatings(game)
+
+        # only add random if in all_players
+        if any(p.get_name() == "random" for p in all_players):
+            ratings.players.append(PlayerRating("random", fixed=True, elo=500.0))
+
+    admit_players(ratings, all_players, verbose)
+
     # check no leftover ratings for players
     for rated_player in ratings.players:
         found = False
@@ -282,128 +342,302 @@ def gen_elo(match_info, all_players, filename, move_generator=None, verbose=Fals
         if not found:
             log.warning("Dangling rating in elo file: %s" % rated_player.name)
 
+    if AUTO_RETIRE:
+        for p in retire(ratings):
+            log.info("Retiring %s (%.1f, played %d)" % (p.name, p.elo, p.played))
+
     # update the ratings with players
     elo_dump_and_save(filename, ratings)
+    return ratings
 
-    for i in range(NUM_GAMES):
-        players = choose_players(all_players)
-        if players is None:
-            break
 
-        player0, player1 = players
+def plan_players(game, all_players, filename):
+    ''' all_players less the unrated generations genplan doesn't want rated yet '''
+    import genplan
 
-        moves = None
-        if move_generator:
-            moves = move_generator()
+    ratings = load_ratings(filename) if os.path.exists(filename) else AllRatings(game)
+    planner = genplan.Planner(ratings, [p.get_name() for p in all_players])
+    keep = set(planner.select([p.get_name() for p in all_players]))
 
-        # play the game
-        try:
-            res = match_info.play(players,
-                                  MOVE_TIME,
-                                  moves=moves,
-                                  resign_score=RESIGN_PCT,
-                                  verbose=True)
-
-            (_, score0), (_, score1) = res[1]
-            res_str = ""
-            k = INITIAL_K
-            if score0 == 100:
-                res_str = "1st player wins"
-                player0_wins = True
-
-            elif score1 == 100:
-                res_str = "2nd player wins"
-                player0_wins = False
+    log.info("plan: %d of %d players, others interpolated" % (len(keep), len(all_players)))
+    return [p for p in all_players if p.get_name() in keep]
 
-            else:
-                res_str = "Draws"
-                k /= 2.0
 
-                # fake a win for player with lower elo
-                player0_wins = player0.rating.elo < player1.rating.elo
+def screen(match_info, all_players, filename, move_generator=None):
+    ''' plays a round of screening matches, and returns all_players less the generations not
+    (yet) promoted to full fidelity '''
+    import screening
 
-            res_str = "%s: %s (%.1f) / %s (%.1f) " % (res_str, player0.get_name(),
-                                                      player0.rating.elo, player1.get_name(),
-                                                      player1.rating.elo)
-            print res_str
-            ratings.log.append(res_str)
+    screen_filename = screening.screen_filename(filename)
+    candidates = [p.get_name() for p in all_players if hasattr(p, "define_args")]
+    screen_ratings = load_ratings(screen_filename) if os.path.exists(screen_filename) else None
 
-        except MatchTooLong as exc:
-            err = 'MatchTooLong, %s v %s' % (player0, player1)
-            ratings.log.append(err)
-            print "match aborted", exc
-            continue
+    # nothing left to decide, don't pay for more screening games
+    if screen_ratings is None or not screening.all_settled(candidates, screen_ratings):
+        # random anchors both tiers, other fixed players don't run at screening time controls
+        screen_players = []
+        for p in all_players:
+            if hasattr(p, "define_args"):
+                game, gen, version, extra_opts = p.define_args
+                screen_players.append(define_player(game, gen, screening.SCREEN_PLAYOUTS,
+                                                    version,
+                                                    move_time=screening.SCREEN_MOVE_TIME,
+                                                    **extra_opts))
+            elif p.get_name() == "random":
+                screen_players.append(p)
+
+        with PROFILER.phase("screen"):
+            gen_elo(match_info, screen_players, screen_filename, move_generator,
+                    fidelity="screen")
+        screen_ratings = load_ratings(screen_filename)
+
+    full_ratings = load_ratings(filename) if os.path.exists(filename) else None
+    if full_ratings is not None:
+        rho, count = screening.tier_correlation(full_ratings, screen_ratings)
+        if rho is not None:
+            log.info("tier correlation: spearman %.3f over %d generations" % (rho, count))
+
+    keep = set(screening.select([p.get_name() for p in all_players],
+                                full_ratings, screen_ratings))
+    return [p for p in all_players if not hasattr(p, "define_args") or p.get_name() in keep]
+
+
+def play_game(match_info, players, ratings, moves, move_time, move_limit=None):
+    ''' plays one game, and logs the result.  returns a GameRecord, without scores if the match
+    was too long. '''
+    from ggpzero.battle.common import MatchTooLong
+
+    player0, player1 = players
+    record = gamearchive.GameRecord(gamearchive.new_game_id(),
+                                    ratings.game,
+                                    players=[player0.get_name(), player1.get_name()],
+                                    opening=list(moves or []),
+                                    source="gen_elo")
+
+    start_time = time.time()
+    try:
+        with PROFILER.phase("play"), PROFILER.wrap(players, "on_meta_gaming", "meta_gaming"):
+            with gamearchive.MoveTimer(players, partial(check_length, move_limit)) as timer:
+                res = match_info.play(players,
+                                      move_time,
+                                      moves=moves,
+                                      resign_score=RESIGN_PCT,
+                                      verbose=True)
+
+            PROFILER.add("next_move", sum(secs for _, secs in timer.move_times),
+                         count=len(timer.move_times))
+
+        (_, score0), (_, score1) = res[1]
+        record.moves = list(res[0] or [])
+        record.move_times = timer.move_times
+        record.scores = [score0, score1]
+        record.result, _, _ = match_result(score0, score1, player0.rating, player1.rating)
+        res_str = "%s: %s (%.1f) / %s (%.1f) " % (record.result, player0.get_name(),
+                                                  player0.rating.elo, player1.get_name(),
+                                                  player1.rating.elo)
+        print res_str
+        ratings.log.append(res_str)
+
+    except MatchTooLong as exc:
+        err = 'MatchTooLong, %s v %s' % (player0, player1)
+        ratings.log.append(err)
+        print "match aborted", exc
+        record.result = "MatchTooLong"
+
+    except Exception as exc:
+        print "match aborted", str(exc)
+        raise
+
+    record.timestamp = time.time()
+    record.duration = record.timestamp - start_time
+    return record
+
+
+def pair_result(record0, record1, rating0, rating1):
+    ''' returns (score, k) of record0's first player, over it and the colour swapped record1.
+    Each game counts as match_result() would rate it alone (draws included), but both are
+    rated from the ratings before the pair - so k is the sum of the games' k, and score their
+    k weighted mean. '''
+    _, first_wins, k0 = match_result(record0.scores[0], record0.scores[1], rating0, rating1)
+    _, second_wins, k1 = match_result(record1.scores[0], record1.scores[1], rating1, rating0)
+    return (k0 * first_wins + k1 * (not second_wins)) / (k0 + k1), k0 + k1
+
+
+def check_length(limit, timer):
+    ''' MoveTimer on_move - aborts a game that has gone on far longer than usual '''
+    from ggpzero.battle.common import MatchTooLong
+    if limit is not None and len(timer.move_times) >= limit:
+        raise MatchTooLong("predicted too long, at %d moves" % len(timer.move_times))
+
+
+def watching(watcher):
+    return watcher if WATCH_GENERATIONS else None
+
+
+def gen_elo(match_info, all_players, filename, move_generator=None, watcher=None,
+            verbose=False, fidelity="full"):
+    ''' watcher is an optional genwatch.GenerationWatcher, for new generations to join.
+    fidelity is "full", or "screen" for the screening tier (see screen()) '''
+    move_time, num_games = MOVE_TIME, NUM_GAMES
+    if fidelity == "screen":
+        import screening
+        move_time, num_games = screening.SCREEN_MOVE_TIME, screening.SCREEN_GAMES
+
+    elif SCREEN_GENERATIONS:
+        all_players = screen(match_info, all_players, filename, move_generator)
+        if not any(hasattr(p, "define_args") for p in all_players):
+            log.info("no generations promoted to full fidelity yet")
+            return
+
+    if PLAN_GENERATIONS and fidelity == "full":
+        all_players = plan_players(match_info.name, all_players, filename)
+
+    with PROFILER.phase("rulesheet"):
+        use_rulesheet(match_info)
+
+    with PROFILER.phase("prepare_ratings"):
+        ratings = prepare_ratings(match_info.name, all_players, filename, verbose)
+
+    archive = None
+    if ARCHIVE_GAMES:
+        archive = gamearchive.GameArchive(gamearchive.archive_filename(filename))
+
+    stats = None
+    if EXPORT_METRICS:
+        stats = metrics.Metrics(filename, ratings.game, CHOOSE_BUCKETS)
+
+    lengths = None
+    if PREDICT_LENGTH and archive is not None:
+        lengths = gamelength.load(filename, "gen_elo")
+
+    for i in range(num_games):
+        if watcher is not None:
+            with PROFILER.phase("watch"):
+                names = set(p.get_name() for p in all_players)
+                all_players = all_players + [p for p in watcher.poll()
+                                             if p.get_name() not in names]
+                if any(not hasattr(p, "rating") for p in all_players):
+                    for p in admit_players(ratings, all_players):
+                        log.info("Adding new player %s" % p.get_name())
+
+        with PROFILER.phase("choose_players"):
+            players = choose_players(all_players)
+        if players is None:
+            break
 
-        except Exception as exc:
-            print "match aborted", str(exc)
-            raise
+        player0, player1 = players
 
-        def getk(r, o):
-            if r.fixed:
-                return 0.0
+        moves = None
+        if move_generator:
+            moves = move_generator()
 
-            if r.played < 10:
-                return k * 2
+        # paired, the same opening is played again with colours swapped
+        order = [(player0, player1), (player1, player0)] if PAIRED_OPENINGS else [players]
+        records = []
+        for game_players in order:
+            move_limit = lengths.limit(timed=True) if lengths is not None else None
+            record = play_game(match_info, game_players, ratings, moves, move_time, move_limit)
+            records.append(record)
+
+            if archive is not None:
+                with PROFILER.phase("archive"):
+                    archive.append(record)
+            if lengths is not None:
+                lengths.add(record)
+            if stats is not None:
+                stats.record(record.duration, too_long=not record.scores)
+
+        finished = [(r, ps) for r, ps in zip(records, order) if r.scores]
+        if len(finished) == 2:
+            score, k = pair_result(records[0], records[1], player0.rating, player1.rating)
+            update_ratings(player0.rating, player1.rating, score, k, games=2)
+            log.info("pair %s v %s scored %.2f" % (player0.get_name(), player1.get_name(), score))
+
+        elif finished:
+            # a single game, or a pair with one game too long
+            record, (p0, p1) = finished[0]
+            _, player0_wins, k = match_result(record.scores[0], record.scores[1],
+                                              p0.rating, p1.rating)
+            update_ratings(p0.rating, p1.rating, player0_wins, k)
+
+        if finished:
+            with PROFILER.phase("save"):
+                elo_dump_and_save(filename, ratings)
+
+        if stats is not None:
+            with PROFILER.phase("metrics"):
+                stats.write(ratings)
+
+        PROFILER.game_done()
 
-            if r.played < 20:
-                scale = 1.0 + (20 - r.played) / 2.0
-                return k * scale
+        # check if there are any LG games waiting, and finish up if so
+        with PROFILER.phase("check_lg"):
+            lg_waiting = check_lg()
+        if lg_waiting:
+            break
 
-            if r.played < 40:
-                return k
 
-            if r.played < 60:
-                return k / 2.0
+def use_rulesheet(match_info):
+    ''' swaps in the cached state machine for the game's rulesheet in data/rulesheets (if it has
+    one), rather than grounding the rules again.  returns match_info. '''
+    # pulls in ggplib's game database, only wanted when games are played
+    import rulesheets
 
-            if r.played > 60:
-                kx = k / 2.5
+    if match_info.name in rulesheets.all_names():
+        match_info.game_info = rulesheets.get_game_info(match_info.name)
+    return match_info
 
-            else:
-                kx = k
 
-            # extra penalty if o not established
-            if o.played < 10:
-                kx /= 10.0
+def match_info_for(game):
+    ''' returns MatchInfo for a game (as named by the manager/generations) '''
+    return use_rulesheet(_new_match_info(game))
 
-            elif o.played < 20:
-                kx /= 3.0
 
-            elif o.played < 40:
-                kx /= 2.0
+def _new_match_info(game):
+    if game == "connect6":
+        from ggpzero.battle.connect6 import MatchInfo
+        return MatchInfo()
 
-            return kx
+    if game in ("hexLG11", "hexLG13"):
+        from ggpzero.battle import hex
+        return hex.MatchInfo(int(game[-2:]))
 
-        player0.rating.played += 1
-        player1.rating.played += 1
+    if game == "hex_lg_19":
+        from ggpzero.battle import hex2
+        return hex2.MatchInfo(19)
 
-        (player0.rating.elo,
-         player1.rating.elo) = next_elo_rating(player0.rating.elo,
-                                               player1.rating.elo,
-                                               getk(player0.rating, player1.rating),
-                                               getk(player1.rating, player0.rating),
-                                               player0_wins)
+    if game in ("breakthroughSmall", "bt_7", "breakthrough"):
+        from ggpzero.battle.bt import MatchInfo
+        return MatchInfo(dict(breakthroughSmall=6, bt_7=7, breakthrough=8)[game])
 
-        elo_dump_and_save(filename, ratings)
+    if game == "amazons_10x10":
+        from ggpzero.battle.amazons import MatchInfo
+        return MatchInfo()
 
-        # check if there are any LG games waiting, and finish up if so
-        if check_lg():
-            break
+    if game == "reversi":
+        from ggpzero.battle.reversi import MatchInfo8
+        return MatchInfo8()
 
+    if game == "reversi_10x10":
+        from ggpzero.battle.reversi import MatchInfo10
+        return MatchInfo10()
 
-###############################################################################
+    if game == "chess_15d":
+        from ggpzero.battle import chess
+        return chess.MatchInfo(short_50=True)
 
-def transform_c6(move_str, fn):
-    x = move_str[0]
-    y = move_str[1:]
+    if game == "draughts_killer_10x10":
+        from ggpzero.battle.draughts import Draughts_MatchInfo
+        return Draughts_MatchInfo(killer=True)
 
-    x_cords = 'abcdefghijklmnopqrs'
-    y_cords = [str(ii + 1) for ii in range(19)]
+    assert False, "unknown game: %s" % game
 
-    x, y = fn(x, y, x_cords, y_cords)
-    return "%s%s" % (x, y)
 
+###############################################################################
 
 def move_generator_c6():
+    import boardsym
+
     if random.random() > 0.95:
         return None
 
@@ -411,23 +645,16 @@ def move_generator_c6():
 
     first_moves = random.choice(candidates)
 
-    # rotate?
-    do_rotations = random.choice([0, 1, 2, 3])
-    for _ in range(do_rotations):
-        rot_moves = [transform_c6(m, symmetry.rotate_90) for m in first_moves.split()]
-        first_moves = " ".join(rot_moves)
-
-    # reflect?
-    if random.random() > 0.5:
-        reflect_moves = [transform_c6(m, symmetry.reflect_horizontal)
-                         for m in first_moves.split()]
-        first_moves = " ".join(reflect_moves)
-
-    first_moves = first_moves.replace(" ", "")
+    # any one of the 8 rotations/reflections
+    geometry = boardsym.get("square", 19)
+    sym = random.randrange(geometry.num_symmetries)
+    first_moves = "".join(geometry.transform_moves(first_moves.split(), sym))
     return ['j10', first_moves]
 
 
 def move_generator_hex13():
+    import boardsym
+
     if random.random() > 0.75:
         return None
 
@@ -440,9 +667,8 @@ def move_generator_hex13():
 
     first_move = random.choice(candidates)
 
-    first_move = "%s%s" % (first_move[0],
-                           "abcdefghijklm"[int(first_move[1:]) - 1])
-    return [first_move]
+    geometry = boardsym.get("hex", 13)
+    return [geometry.format_move(geometry.parse_move(first_move, "alnum"), "alpha")]
 
 
 def move_generator_baduk():
@@ -451,10 +677,36 @@ def move_generator_baduk():
     return [random.choice(["ee", "dd", "df", "ff", "fd"])]
 
 
+# openings by game name, as the tournaments below play them (asyncmatch plays the same)
+MOVE_GENERATORS = dict(connect6=move_generator_c6,
+                       hexLG13=move_generator_hex13)
+
+
 class Runner(object):
     """Run games and calculate ELO."""
 
+    def __init__(self, profile=None, profile_every=0, cprofile=False, tracemalloc=False,
+                 watch=False, plan=False, screen=False, paired=False, predict_length=False):
+        ''' profile is a filename prefix - per phase timings are written to
+        <profile>.profile.json at exit, and cProfile/tracemalloc snapshots every profile_every
+        games if asked for.  watch=True lets newly trained generations join while running.
+        plan=True only rates the generations genplan chooses.  screen=True plays cheap
+        screening matches first, and only promising generations get full matches.  paired=True
+        plays each opening twice, with colours swapped, as one rated pair.  predict_length=True
+        aborts games far longer than those archived. '''
+        global PROFILER, WATCH_GENERATIONS, PLAN_GENERATIONS, SCREEN_GENERATIONS
+        global PAIRED_OPENINGS, PREDICT_LENGTH
+        WATCH_GENERATIONS = watch
+        PLAN_GENERATIONS = plan
+        SCREEN_GENERATIONS = screen
+        PAIRED_OPENINGS = paired
+        PREDICT_LENGTH = predict_length
+        if profile:
+            PROFILER = profiler.PhaseProfiler(profile, profile_every, cprofile, tracemalloc)
+
     def connect6(self, filename="../data/elo/connect6.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
         from ggpzero.battle.connect6 import MatchInfo
 
         match_info = MatchInfo()
@@ -472,33 +724,22 @@ class Runner(object):
 
         man = manager.get_manager()
 
-        num = 5
-        gens = []
-        while True:
-            gen = "h1_%s" % num
-            if not man.can_load("connect6", gen):
-                break
-
-            gens.append(gen)
-            num += 10
-
-        num = 145
-        while True:
-            gen = "h2_%s" % num
-            if not man.can_load("connect6", gen):
-                break
-
-            gens.append(gen)
-            num += 5
+        series = (["h1", 5, 10],
+                  ["h2", 145, 5])
+        watcher = genwatch.GenerationWatcher(man, "connect6", series,
+                                             lambda g: dp(g, 800, 3))
+        gens = watcher.initial()
 
         gens += ["h1_183"]
         gens += ["h2_281", "h2_267", "h2_272", "h2_274", "h2_277", "h2_306", "h2_318", "h2_321"]
         all_players += [dp(g, 800, 3) for g in gens]
 
         gen_elo(match_info, all_players, filename,
-                move_generator=move_generator_c6)
+                move_generator=MOVE_GENERATORS["connect6"], watcher=watching(watcher))
 
     def hex13(self, filename="../data/elo/hex13.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
         from ggpzero.battle import hex
 
         match_info = hex.MatchInfo(13)
@@ -551,26 +792,20 @@ class Runner(object):
         man = manager.get_manager()
 
 
-        for name, num, incr in (["c2", 252, 3],
-                                ["d2", 113, 3],
-                                ["b1", 3, 5],
-                                ["b2", 100, 5],
-                                ["b3", 160, 5],
-                                ["b4", 280, 5]):
-
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("hexLG13", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["c2", 252, 3],
+                  ["d2", 113, 3],
+                  ["b1", 3, 5],
+                  ["b2", 100, 5],
+                  ["b3", 160, 5],
+                  ["b4", 280, 5])
+        watcher = genwatch.GenerationWatcher(man, "hexLG13", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         all_players += [dp(g, 800, 3) for g in gens + new_c1 + others + recent]
 
         gen_elo(match_info, all_players, filename,
-                move_generator=move_generator_hex13)
+                move_generator=MOVE_GENERATORS["hexLG13"], watcher=watching(watcher))
 
     def baduk9_1(self, filename="../data/elo/baduk9_1.elo"):
         from ggpzero.battle import baduk
@@ -596,7 +831,7 @@ class Runner(object):
     def test_move_gen(self):
         from ggpzero.battle.connect6 import MatchInfo
 
-        match_info = MatchInfo()
+        match_info = use_rulesheet(MatchInfo())
 
         sm = match_info.game_info.get_sm()
 
@@ -613,7 +848,7 @@ class Runner(object):
     def test_move_gen2(self):
         from ggpzero.battle import hex
 
-        match_info = hex.MatchInfo(13)
+        match_info = use_rulesheet(hex.MatchInfo(13))
 
         sm = match_info.game_info.get_sm()
 
@@ -628,6 +863,8 @@ class Runner(object):
             raw_input()
 
     def bt8(self, filename="../data/elo/bt8.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
         from ggpzero.battle.bt import MatchInfo
         match_info = MatchInfo(8)
 
@@ -655,19 +892,14 @@ class Runner(object):
 
         gens = []
 
-        for name, num, incr in (["kt1", 10, 4],
-                                ["kt3", 2, 3],
-                                ["kt5", 2, 10],
-                                ["f1", 1, 5],
-                                ["az1", 2, 3]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("breakthrough", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["kt1", 10, 4],
+                  ["kt3", 2, 3],
+                  ["kt5", 2, 10],
+                  ["f1", 1, 5],
+                  ["az1", 2, 3])
+        watcher = genwatch.GenerationWatcher(man, "breakthrough", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         all_players += [dp(g, 800, 3) for g in gens]
         random_player = get_player("r", MOVE_TIME)
@@ -675,9 +907,12 @@ class Runner(object):
         simplemcts_player = get_player("s", MOVE_TIME, max_tree_playout_iterations=800)
         all_players += [random_player, mcs_player, simplemcts_player]
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def amazons(self, filename="../data/elo/amazons.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.amazons import MatchInfo
@@ -691,17 +926,12 @@ class Runner(object):
                                  random_scale=0.9)
 
         gens = []
-        for name, num, incr in (["h1", 7, 5],
-                                ["h3", 7, 10],
-                                ["f1", 1, 4]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("amazons_10x10", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["h1", 7, 5],
+                  ["h3", 7, 10],
+                  ["f1", 1, 4])
+        watcher = genwatch.GenerationWatcher(man, "amazons_10x10", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         all_players = [dp(g, 800, 3) for g in gens]
 
@@ -710,10 +940,13 @@ class Runner(object):
         simplemcts_player = get_player("s", MOVE_TIME, max_tree_playout_iterations=800)
         all_players += [random_player, mcs_player, simplemcts_player]
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
 
     def hex11(self, filename="../data/elo/hex11.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.hex import MatchInfo
@@ -727,16 +960,11 @@ class Runner(object):
                                  random_scale=0.9)
 
         gens = []
-        for name, num, incr in (["h1", 5, 8],
-                                ["b1", 3, 5]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("hexLG11", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["h1", 5, 8],
+                  ["b1", 3, 5])
+        watcher = genwatch.GenerationWatcher(man, "hexLG11", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         all_players = [dp(g, 800, 3) for g in gens]
 
@@ -745,9 +973,12 @@ class Runner(object):
         simplemcts_player = get_player("s", MOVE_TIME, max_tree_playout_iterations=800)
         all_players += [random_player, mcs_player, simplemcts_player]
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def bt6(self, filename="../data/elo/bt6.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.bt import MatchInfo
@@ -760,17 +991,12 @@ class Runner(object):
                                  random_scale=0.5)
 
         gens = []
-        for name, num, incr in (["x1", 5, 8],
-                                ["h2", 7, 8],
-                                ["b1", 3, 5]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("breakthroughSmall", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["x1", 5, 8],
+                  ["h2", 7, 8],
+                  ["b1", 3, 5])
+        watcher = genwatch.GenerationWatcher(man, "breakthroughSmall", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         # 80 - all, 90 global
         gens += ["b1_80", "b1_90"]
@@ -782,9 +1008,12 @@ class Runner(object):
         simplemcts_player = get_player("s", MOVE_TIME, max_tree_playout_iterations=800)
         all_players += [random_player, mcs_player, simplemcts_player]
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def bt7(self, filename="../data/elo/bt7.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.bt import MatchInfo
@@ -797,15 +1026,10 @@ class Runner(object):
                                  random_scale=0.5)
 
         gens = []
-        for name, num, incr in (["kt1", 2, 4],):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("bt_7", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["kt1", 2, 4],)
+        watcher = genwatch.GenerationWatcher(man, "bt_7", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         all_players = [dp(g, 800, 3) for g in gens]
 
@@ -814,9 +1038,12 @@ class Runner(object):
         simplemcts_player = get_player("s", MOVE_TIME, max_tree_playout_iterations=800)
         all_players += [random_player, mcs_player, simplemcts_player]
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def reversi_8(self, filename="../data/elo/r8.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.reversi import MatchInfo8
@@ -836,27 +1063,25 @@ class Runner(object):
         all_players = [random_player, mcs_player, simplemcts_player]
 
         gens = []
-        for name, num, incr in (["h3", 5, 20],
-                                ["h5", 10, 20],
-                                ['h6', 15, 20],
-                                ["kt1", 3, 5],
-                                ["kt2", 2, 5],
-                                ["f1", 2, 6],
-                                ["f2", 2, 6]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("reversi", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["h3", 5, 20],
+                  ["h5", 10, 20],
+                  ['h6', 15, 20],
+                  ["kt1", 3, 5],
+                  ["kt2", 2, 5],
+                  ["f1", 2, 6],
+                  ["f2", 2, 6])
+        watcher = genwatch.GenerationWatcher(man, "reversi", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         all_players += [dp(g, 800, 3) for g in gens]
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def reversi_10(self, filename="../data/elo/r10.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.reversi import MatchInfo10
@@ -890,18 +1115,13 @@ class Runner(object):
         # current: x2_224 - assuming this was Scan 3rd match
 
         gens = []
-        for name, num, incr in (["x1", 5, 10],
-                                ["x2", 49, 10],
-                                ['h5', 20, 10],
-                                ["kt1", 3, 5]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("reversi_10x10", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["x1", 5, 10],
+                  ["x2", 49, 10],
+                  ['h5', 20, 10],
+                  ["kt1", 3, 5])
+        watcher = genwatch.GenerationWatcher(man, "reversi_10x10", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         # ensure this one
         gens.append("x2_224")
@@ -910,9 +1130,12 @@ class Runner(object):
 
         all_players.append(dp("h5_100", 800, 1))
 
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def chess_15d(self, filename="../data/elo/chess_15d.elo"):
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         def dp(g, playouts, v):
             return define_player("c_15f", g, playouts, v,
                                  dirichlet_noise_pct=0.15,
@@ -936,24 +1159,22 @@ class Runner(object):
         all_players = [random_player]
 
         gens = []
-        for name, num, incr in (["c1", 5, 7],
-                                ["kb1", 3, 5],
-                                ["c2", 145, 5]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("chess_15d", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["c1", 5, 7],
+                  ["kb1", 3, 5],
+                  ["c2", 145, 5])
+        watcher = genwatch.GenerationWatcher(man, "chess_15d", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         gens.append("c2_367")
         all_players += [dp(g, 800, 3) for g in gens]
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
     def idk(self, filename="../data/elo/idk.elo"):
         ' international draught killer '
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
+
         man = manager.get_manager()
 
         from ggpzero.battle.draughts import Draughts_MatchInfo
@@ -965,17 +1186,10 @@ class Runner(object):
         all_players = [random_player, mcs_player, simplemcts_player]
 
         gens = []
-        for name, num, incr in (["f1", 1, 5],):
-            while True:
-                if num > 700:
-                    break
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("draughts_killer_10x10", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
+        series = (["f1", 1, 5, 700],)
+        watcher = genwatch.GenerationWatcher(man, "draughts_killer_10x10", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         gens.append("f1_816")
         gens.append("f1_849")
@@ -989,11 +1203,13 @@ class Runner(object):
                                  random_scale=0.5)
 
         all_players += [dp(g, 800, 3) for g in gens]
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
 
     def hex19(self, filename="../data/elo/hex19.elo"):
         ' hex19 - with new hex C++ SM '
+        from ggpzero.battle.common import get_player
+        from ggpzero.nn import manager
         from ggpzero.battle import hex2
 
         man = manager.get_manager()
@@ -1007,21 +1223,14 @@ class Runner(object):
         all_players = [random_player, simplemcts_player]
 
         gens = []
-        for name, num, incr, maxg in (["h1", 258, 7, 360],
-                                      ["h1", 361, 10, 489],
-                                      ["h1", 496, 6, 700],
-                                      ["h2", 255, 6, 500],
-                                      ["t1", 5, 5, 100]):
-            while True:
-                gen = "%s_%s" % (name, num)
-                if not man.can_load("hex_lg_19", gen):
-                    print "FAILED TO LOAD GEN", gen
-                    break
-
-                gens.append(gen)
-                num += incr
-                if num > maxg:
-                    break
+        series = (["h1", 258, 7, 360],
+                  ["h1", 361, 10, 489],
+                  ["h1", 496, 6, 700],
+                  ["h2", 255, 6, 500],
+                  ["t1", 5, 5, 100])
+        watcher = genwatch.GenerationWatcher(man, "hex_lg_19", series,
+                                             lambda g: dp(g, 800, 3))
+        gens += watcher.initial()
 
         def dp(g, playouts, v):
             return define_player("hex_lg_19", g, playouts, v,
@@ -1037,10 +1246,23 @@ class Runner(object):
         gens += ["lalal_456", "lalal_490", "lalal_603"]
         gens += ["yy_291", "halfpol_291"]
         all_players += [dp(g, 800, 3) for g in gens]
-        gen_elo(match_info, all_players, filename)
+        gen_elo(match_info, all_players, filename, watcher=watching(watcher))
 
 
 ###############################################################################
 
 if __name__ == '__main__':
-    run(partial(fire.Fire, Runner), log_name_base="elo_")
+    import sys
+
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+
+    import ratings
+
+    # rating table commands never need the nn/battle stack (or logging setup from run())
+    if len(sys.argv) > 1 and sys.argv[1] in ratings.RATINGS_COMMANDS:
+        fire.Fire(ratings.Runner)
+
+    else:
+        from ggpzero.battle.common import run
+        run(partial(fire.Fire, Runner), log_name_base="elo_")
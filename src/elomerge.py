@@ -0,0 +1,238 @@
+''' merge tournament results from several machines.
+
+When the same tournament runs on boxes without a shared filesystem, each ends up with its own
+.elo snapshot and game archive (.games).  Merging:
+
+  1. every game is read from every archive, and deduplicated by game id (shards started from a
+     copy of another's files share a prefix of games).  Snapshots without an archive fall back to
+     their log lines, deduplicated by text.
+
+  2. ratings are rebuilt from scratch by replaying the unique games in timestamp order, with the
+     same K factors as gen_elo (or by a maximum likelihood fit with method="fit").  Fixed and
+     retired flags are taken from the snapshots - retired only once the ratings are rebuilt, as
+     retired players don't otherwise move.
+
+  3. a head to head summary (wins / losses / draws per pair of players) is built alongside.
+
+The output is a consolidated .elo, with the unique games written to its archive.  Records are
+copied without being re-encoded, so this is fast enough for hundreds of thousands of games.
+'''
+
+import os
+import csv
+import sys
+import json
+import zlib
+import operator
+
+from ggplib.util import log
+
+import elo
+import ratings
+import gamearchive
+
+
+GAME_ID = gamearchive.FIELDS.index("game_id")
+TIMESTAMP = gamearchive.FIELDS.index("timestamp")
+PLAYERS = gamearchive.FIELDS.index("players")
+SCORES = gamearchive.FIELDS.index("scores")
+
+
+class Game(object):
+    __slots__ = ("game_id", "timestamp", "players", "scores", "payload")
+
+    def __init__(self, game_id, timestamp, players, scores, payload=None):
+        self.game_id = game_id
+        self.timestamp = timestamp
+        self.players = players
+        self.scores = scores
+        self.payload = payload
+
+
+def games_from_archive(filename):
+    for payload in gamearchive.GameArchive(filename).payloads():
+        # only the fields needed, no GameRecord
+        values = json.loads(zlib.decompress(payload))
+        yield Game(values[GAME_ID], values[TIMESTAMP], values[PLAYERS], values[SCORES], payload)
+
+
+def games_from_log(all_ratings):
+    for line in all_ratings.log:
+        m = ratings.LOG_RESULT_RE.match(line)
+        if m is None:
+            continue
+
+        res, name0, name1 = m.groups()
+        scores = {"1st player wins": [100, 0], "2nd player wins": [0, 100]}.get(res, [50, 50])
+        yield Game(line, 0.0, [name0, name1], scores)
+
+
+class Merge(object):
+    def __init__(self):
+        self.game = None
+        self.snapshots = []
+        self.games = {}
+        self.duplicates = 0
+
+    def add_game(self, game):
+        if game.game_id in self.games:
+            self.duplicates += 1
+        else:
+            self.games[game.game_id] = game
+
+    def add(self, elo_filename):
+        ''' adds a snapshot, and its archive if there is one '''
+        snapshot = ratings.load_ratings(elo_filename)
+        assert self.game in (None, snapshot.game), "mixed games %s / %s" % (self.game,
+                                                                           snapshot.game)
+        self.game = snapshot.game
+        self.snapshots.append(snapshot)
+
+        archive = gamearchive.archive_filename(elo_filename)
+        from_archive = os.path.exists(archive)
+        games = games_from_archive(archive) if from_archive else games_from_log(snapshot)
+
+        count, duplicates = 0, self.duplicates
+        for g in games:
+            self.add_game(g)
+            count += 1
+
+        log.info("%s: %d games from its %s, %d duplicates" % (elo_filename, count,
+                                                             "archive" if from_archive else "log",
+                                                             self.duplicates - duplicates))
+
+    def unique_games(self):
+        # log lines have no timestamp, they stay in the order they were added after archived games
+        order = dict((gid, ii) for ii, gid in enumerate(self.games))
+        return sorted(self.games.values(),
+                      key=lambda g: (g.timestamp == 0.0, g.timestamp, order[g.game_id]))
+
+    def initial_ratings(self):
+        ''' returns (AllRatings, dict of name -> PlayerRating, set of retired names).  Nothing is
+        marked retired yet - retired players' ratings must move while rebuilding. '''
+        res = ratings.AllRatings(self.game)
+        by_name = {}
+        retired = set()
+        for snapshot in self.snapshots:
+            for p in snapshot.players:
+                if p.name not in by_name:
+                    by_name[p.name] = ratings.PlayerRating(p.name, 0, elo.STARTING_ELO)
+                    res.players.append(by_name[p.name])
+
+                merged = by_name[p.name]
+                if p.fixed:
+                    merged.fixed = True
+                    merged.elo = p.elo
+                if p.retired:
+                    retired.add(p.name)
+
+        for g in self.games.values():
+            for name in g.players:
+                if name not in by_name:
+                    by_name[name] = ratings.PlayerRating(name, 0, elo.STARTING_ELO)
+                    res.players.append(by_name[name])
+
+        return res, by_name, retired
+
+    def rebuild(self, method="replay"):
+        ''' returns (AllRatings, head to head dict of (name0, name1) -> [wins, losses, draws]) '''
+        all_ratings, by_name, retired = self.initial_ratings()
+        head_to_head = {}
+        games = []
+
+        for g in self.unique_games():
+            if len(g.scores) != 2 or len(g.players) != 2:
+                continue
+
+            name0, name1 = g.players
+            score0, score1 = g.scores
+            r0, r1 = by_name[name0], by_name[name1]
+            games.append((name0, name1, score0 / float(max(1, score0 + score1))))
+
+            # head to head keyed in name order
+            key, flip = ((name0, name1), False) if name0 < name1 else ((name1, name0), True)
+            h2h = head_to_head.setdefault(key, [0, 0, 0])
+            if score0 == score1:
+                h2h[2] += 1
+            else:
+                h2h[0 if (score0 > score1) != flip else 1] += 1
+
+            if method == "replay":
+                res_str, player0_wins, k = elo.match_result(score0, score1, r0, r1)
+                elo.update_ratings(r0, r1, player0_wins, k, verbose=False)
+            else:
+                r0.played += 1
+                r1.played += 1
+
+        if method == "fit":
+            initial = dict((p.name, p.elo) for p in all_ratings.players)
+            fixed = set(p.name for p in all_ratings.players if p.fixed)
+            elos = ratings.fit_ratings(initial, games, fixed=fixed)
+            for p in all_ratings.players:
+                p.elo = elos[p.name]
+
+        for name in retired:
+            by_name[name].retired = True
+
+        log.info("rebuilt %d players from %d games (%s)" % (len(all_ratings.players), len(games),
+                                                            method))
+        return all_ratings, head_to_head
+
+    def write_archive(self, filename):
+        archive = gamearchive.GameArchive(filename)
+        assert len(archive) == 0, "archive already exists: %s" % filename
+        archive.append_payloads(g.payload for g in self.unique_games() if g.payload is not None)
+
+
+def write_head_to_head(head_to_head, f):
+    writer = csv.writer(f)
+    writer.writerow(("player", "opponent", "wins", "losses", "draws"))
+    for (name0, name1), (wins, losses, draws) in sorted(head_to_head.items()):
+        writer.writerow((name0, name1, wins, losses, draws))
+
+
+###############################################################################
+
+class Runner(object):
+    """Merge sharded tournament results."""
+
+    def merge(self, output, *filenames, **kwds):
+        ''' merge .elo snapshots (and their archives) into output.
+
+        options: method=replay|fit, head_to_head=<csv filename> '''
+        method = kwds.pop("method", "replay")
+        h2h_filename = kwds.pop("head_to_head", None)
+        assert not kwds, "unknown options %s" % kwds
+        assert not os.path.exists(output), "will not overwrite %s" % output
+
+        merge = Merge()
+        for filename in filenames:
+            merge.add(filename)
+            print "%-40s %8d unique games so far" % (filename, len(merge.games))
+        print "%d duplicates dropped" % merge.duplicates
+
+        all_ratings, head_to_head = merge.rebuild(method)
+        merge.write_archive(gamearchive.archive_filename(output))
+        ratings.elo_dump_and_save(output, all_ratings)
+
+        if h2h_filename:
+            with open(h2h_filename, "w") as f:
+                write_head_to_head(head_to_head, f)
+
+        ratings.print_players(sorted(all_ratings.players, key=operator.attrgetter("elo"),
+                                     reverse=True)[:20])
+
+    def head_to_head(self, player, *filenames):
+        merge = Merge()
+        for filename in filenames:
+            merge.add(filename)
+
+        _, head_to_head = merge.rebuild()
+        rows = dict((k, v) for k, v in head_to_head.items() if player in k)
+        write_head_to_head(rows, sys.stdout)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
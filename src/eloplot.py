@@ -1,37 +1,54 @@
+import os
 from collections import OrderedDict
 
-import matplotlib.pyplot as plt
+import ratings as elo_ratings
 
-# 3rd party: https://github.com/google/python-fire
-import fire
 
-from ggpzero.util import attrutil as at
+def get_pyplot(output=None):
+    import matplotlib
+    if output is not None:
+        # no display needed when plotting to a file
+        matplotlib.use("Agg")
 
+    import matplotlib.pyplot as plt
+    return plt
 
-@at.register_attrs
-class PlayerRating(object):
-    name = at.attribute("xxyyyzz")
-    played = at.attribute(42)
-    elo = at.attribute(1302.124)
-    fixed = at.attribute(False)
 
+def get_compute(models_dir, continues=None):
+    ''' returns function (series, gen) -> estimated compute in PFLOPs, or None if there are no
+    models to derive it from.  continues maps a series to the (series, gen) it was forked from. '''
+    import costmodel
 
-@at.register_attrs
-class AllRatings(object):
-    game = at.attribute("game")
+    if models_dir is None or not os.path.isdir(models_dir):
+        return None
 
-    # list of PlayerRating
-    players = at.attribute(default=at.attr_factory(list))
+    costs = costmodel.ModelCosts(models_dir)
+    if not costs.model_names():
+        return None
+    compute = costmodel.CumulativeCompute(costs, parents=continues)
 
-    # simple log of recent games
-    log = at.attribute(default=at.attr_factory(list))
+    # series without any saved model are assumed to be the size of the largest network
+    fallback = max(costs.get(n)["flops_per_eval"] for n in costs.model_names())
+
+    def f(series, gen):
+        return compute(series, gen, fallback) / 1e15
+    return f
 
 
 def main(genname_mapping, filename, gen_modifier=None,
-         ignore_non_models=False, check_evals=800, adjust_elo=None):
-    ratings = at.json_to_attr(open(filename).read())
+         ignore_non_models=False, check_evals=800, adjust_elo=None, output=None,
+         xaxis="gen", models_dir=None, continues=None):
+    plt = get_pyplot(output)
+
+    ratings = elo_ratings.load_ratings(filename)
     genmodel_to_data = {}
 
+    compute = None
+    if xaxis == "compute":
+        compute = get_compute(models_dir, continues)
+        if compute is None:
+            print "no models in %s to derive compute from, plotting by generation" % models_dir
+
     # side effect of setting the size of graph
     plt.figure(figsize=(18, 14))
 
@@ -46,7 +63,15 @@ def main(genname_mapping, filename, gen_modifier=None,
             elo += adjust_elo
 
         if "_" in p.name:
-            if gen_modifier is not None:
+            # compute is derived from the raw generation of the series, gen_modifier is not needed
+            if compute is not None:
+                parts = p.name.split('_')
+                if len(parts) < 2 or not parts[-1].isdigit():
+                    print "NO COMPUTE", p.name
+                    continue
+                gen = compute(parts[-2], int(parts[-1]))
+
+            elif gen_modifier is not None:
                 gen = gen_modifier(p.name)
             else:
                 gen = int(p.name.split('_')[-1])
@@ -91,9 +116,17 @@ def main(genname_mapping, filename, gen_modifier=None,
             plt.plot(datapoints[0], datapoints[1], color, label=name)
 
     plt.ylabel("ELO")
-    plt.xlabel("Generation")
+    if compute is not None:
+        plt.xlabel("Estimated self play compute (PFLOPs)")
+    else:
+        plt.xlabel("Generation")
     plt.legend(loc='lower right')
-    plt.show()
+
+    if output is not None:
+        plt.savefig(output)
+        plt.close()
+    else:
+        plt.show()
 
 
 ###############################################################################
@@ -101,9 +134,13 @@ def main(genname_mapping, filename, gen_modifier=None,
 class Runner(object):
     def __init__(self,
                  elo_min=100,
-                 looptimes=1):
+                 looptimes=1,
+                 output=None,
+                 xaxis="gen"):
         Runner._elo_min = elo_min
         Runner._looptimes = looptimes
+        Runner._output = output
+        Runner._xaxis = xaxis
 
     def bt8(self):
 
@@ -126,7 +163,8 @@ class Runner(object):
 
         self._main(mapping, "../data/elo/bt8.elo",
                    gen_modifier=gen_modifier,
-                   check_evals=None)
+                   check_evals=None,
+                   models_dir="../data/breakthrough/models")
 
     def hex13(self):
 
@@ -163,14 +201,22 @@ class Runner(object):
             c2="bo",
             d2="co")
 
-        self._main(mapping, "../data/elo/hex13.elo", gen_modifier=gen_modifier)
+        # b4 combined d2/b3, it has no single parent
+        continues = dict(c2=("c1", 275),
+                         d2=("c2", 450 - 275),
+                         b2=("b1", 350),
+                         b3=("b2", 710 - 40 - 350))
+
+        self._main(mapping, "../data/elo/hex13.elo", gen_modifier=gen_modifier,
+                   models_dir="../data/hexLG13/models", continues=continues)
 
     def hex11(self):
         mapping = dict(
             h1="go",
             b1="co")
 
-        self._main(mapping, "../data/elo/hex11.elo")
+        self._main(mapping, "../data/elo/hex11.elo",
+                   models_dir="../data/hexLG11/models")
 
     def bt6(self):
         mapping = dict(
@@ -178,7 +224,8 @@ class Runner(object):
             h2="ro",
             b1="co")
 
-        self._main(mapping, "../data/elo/bt6.elo")
+        self._main(mapping, "../data/elo/bt6.elo",
+                   models_dir="../data/breakthroughSmall/models")
 
     def bt7(self):
         mapping = dict(
@@ -191,7 +238,8 @@ class Runner(object):
             h1="ro",
             h2="bo")
 
-        self._main(mapping, "../data/elo/connect6.elo")
+        self._main(mapping, "../data/elo/connect6.elo",
+                   models_dir="../data/connect6/models")
 
     def az(self):
         mapping = dict(
@@ -199,7 +247,8 @@ class Runner(object):
             h3="go",
             f1="yo")
 
-        self._main(mapping, "../data/elo/amazons.elo")
+        self._main(mapping, "../data/elo/amazons.elo",
+                   models_dir="../data/amazons_10x10/models")
 
     def r8(self):
         mapping = dict(
@@ -211,7 +260,8 @@ class Runner(object):
             h5="go",
             h6="bo")
 
-        self._main(mapping, "../data/elo/r8.elo")
+        self._main(mapping, "../data/elo/r8.elo",
+                   models_dir="../data/reversi_8x8/models")
 
     def r10(self):
         mapping = dict(
@@ -221,7 +271,8 @@ class Runner(object):
             kt1="mo",
             h6="bo")
 
-        self._main(mapping, "../data/elo/r10.elo")
+        self._main(mapping, "../data/elo/r10.elo",
+                   models_dir="../data/reversi_10x10/models")
 
     def chess_15d(self):
         mapping = OrderedDict(
@@ -242,7 +293,9 @@ class Runner(object):
             return gen
 
         self._main(mapping, "../data/elo/chess_15d.elo",
-                   gen_modifier=gen_modifier)
+                   gen_modifier=gen_modifier,
+                   models_dir="../data/chess/models",
+                   continues=dict(c2=("c1", 200)))
 
     def baduk9(self):
         mapping = dict(
@@ -265,7 +318,8 @@ class Runner(object):
         mapping = dict(
             f1="go")
 
-        self._main(mapping, "../data/elo/idk.elo", ignore_non_models=False, adjust_elo=None)
+        self._main(mapping, "../data/elo/idk.elo", ignore_non_models=False, adjust_elo=None,
+                   models_dir="../data/draughts_killer/models")
 
     def hex19(self):
         mapping = dict(
@@ -288,15 +342,20 @@ class Runner(object):
             return gen
 
         self._main(mapping, "../data/elo/hex19.elo",
-                   gen_modifier=gen_modifier)
+                   gen_modifier=gen_modifier,
+                   models_dir="../data/hex19/models")
 
     def _main(self, *args, **kargs):
+        kargs.setdefault("output", self._output)
+        kargs.setdefault("xaxis", self._xaxis)
         for ii in range(self._looptimes):
             main(*args, **kargs)
 
 
 
 if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
     fire.Fire(Runner)
 
 
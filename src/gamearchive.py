@@ -0,0 +1,283 @@
+''' append only, compressed archive of played games.
+
+Each game type gets a pair of files:
+
+  <base>.games      - header followed by records.  Each record is a small fixed header (length,
+                      crc32) followed by a zlib compressed json blob.
+  <base>.games.idx  - fixed size (offset, length) entries, one per record.
+
+Reading game N is one seek into the index and one seek into the data file, so there is no need to
+decompress the whole archive.  If the index is ever lost or truncated (crash mid-write), it can be
+rebuilt by scanning the data file (see GameArchive.reindex()), which skips over corrupt records.
+'''
+
+import os
+import json
+import time
+import uuid
+import zlib
+import struct
+
+from ggpzero.util import attrutil as at
+
+
+MAGIC = "GZGA\x01"
+RECORD_HEADER = struct.Struct("<II")
+INDEX_ENTRY = struct.Struct("<QI")
+COMPRESS_LEVEL = 6
+
+# first byte of a zlib stream (deflate, 32k window)
+ZLIB_HEADER = "\x78"
+
+
+@at.register_attrs
+class GameRecord(object):
+    game_id = at.attribute("xxxyyyzzz")
+    game = at.attribute("breakthrough")
+
+    # time.time() at the end of the game
+    timestamp = at.attribute(0.0)
+
+    # player names, in role order
+    players = at.attribute(default=at.attr_factory(list))
+
+    # the opening forced by the move generator (or empty list)
+    opening = at.attribute(default=at.attr_factory(list))
+
+    # full move sequence, including the opening
+    moves = at.attribute(default=at.attr_factory(list))
+
+    # seconds spent per move, as [role_index, seconds] - only where the player could be timed
+    move_times = at.attribute(default=at.attr_factory(list))
+
+    # final scores in role order
+    scores = at.attribute(default=at.attr_factory(list))
+
+    # "1st player wins" / "2nd player wins" / "Draws" / "MatchTooLong"
+    result = at.attribute("")
+
+    # wall time of the entire match
+    duration = at.attribute(0.0)
+
+    # what played the game, "gen_elo" or "asyncmatch" ("" if not known).  They count moves
+    # differently, so game lengths are only comparable within a source.
+    source = at.attribute("")
+
+
+FIELDS = ("game_id", "game", "timestamp", "players", "opening", "moves",
+          "move_times", "scores", "result", "duration", "source")
+
+
+def new_game_id():
+    return uuid.uuid4().hex
+
+
+def archive_filename(elo_filename):
+    return os.path.splitext(elo_filename)[0] + ".games"
+
+
+def _jsonable(obj):
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(o) for o in obj]
+    if isinstance(obj, (int, long, float, basestring)) or obj is None:
+        return obj
+    return str(obj)
+
+
+def encode_record(record):
+    # compact positional encoding, much smaller than attr_to_json()
+    blob = json.dumps([_jsonable(getattr(record, f)) for f in FIELDS], separators=(",", ":"))
+    return zlib.compress(blob, COMPRESS_LEVEL)
+
+
+def decode_record(payload):
+    values = json.loads(zlib.decompress(payload))
+    return GameRecord(**dict(zip(FIELDS, values)))
+
+
+class GameArchive(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_filename = filename + ".idx"
+
+        if not os.path.exists(self.filename):
+            with open(self.filename, "wb") as f:
+                f.write(MAGIC)
+
+            with open(self.index_filename, "wb"):
+                pass
+
+        else:
+            with open(self.filename, "rb") as f:
+                assert f.read(len(MAGIC)) == MAGIC, "not a game archive: %s" % self.filename
+
+            # missing, or a torn write left a partial entry (which would misalign every later one)
+            if (not os.path.exists(self.index_filename) or
+                    os.path.getsize(self.index_filename) % INDEX_ENTRY.size):
+                self.reindex()
+
+    def __len__(self):
+        return os.path.getsize(self.index_filename) // INDEX_ENTRY.size
+
+    def append(self, record):
+        self.append_payloads([encode_record(record)])
+
+    def append_payloads(self, payloads):
+        ''' appends already encoded records (see encode_record()) '''
+        entries = []
+        with open(self.filename, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            for payload in payloads:
+                f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff))
+                f.write(payload)
+                entries.append(INDEX_ENTRY.pack(offset, RECORD_HEADER.size + len(payload)))
+                offset += RECORD_HEADER.size + len(payload)
+
+        # the index is only written after the data, so a crash leaves at worst an unindexed record
+        # or a partial index entry - both are repaired by reindex() on the next open
+        with open(self.index_filename, "ab") as f:
+            f.write("".join(entries))
+
+    def _read_payload_at(self, f, offset, length):
+        f.seek(offset)
+        data = f.read(length)
+        size, crc = RECORD_HEADER.unpack(data[:RECORD_HEADER.size])
+        payload = data[RECORD_HEADER.size:]
+        assert len(payload) == size, "truncated record @ %s" % offset
+        assert zlib.crc32(payload) & 0xffffffff == crc, "corrupt record @ %s" % offset
+        return payload
+
+    def _read_at(self, f, offset, length):
+        return decode_record(self._read_payload_at(f, offset, length))
+
+    def get(self, index):
+        if index < 0:
+            index += len(self)
+
+        with open(self.index_filename, "rb") as f:
+            f.seek(index * INDEX_ENTRY.size)
+            entry = f.read(INDEX_ENTRY.size)
+            if len(entry) != INDEX_ENTRY.size:
+                raise IndexError(index)
+
+        offset, length = INDEX_ENTRY.unpack(entry)
+        with open(self.filename, "rb") as f:
+            return self._read_at(f, offset, length)
+
+    def payloads(self, start=0):
+        ''' yields the encoded records (from index start), without decoding them '''
+        with open(self.index_filename, "rb") as f:
+            f.seek(start * INDEX_ENTRY.size)
+            index = f.read()
+
+        with open(self.filename, "rb") as f:
+            for ii in range(len(index) // INDEX_ENTRY.size):
+                offset, length = INDEX_ENTRY.unpack_from(index, ii * INDEX_ENTRY.size)
+                yield self._read_payload_at(f, offset, length)
+
+    def __iter__(self):
+        for payload in self.payloads():
+            yield decode_record(payload)
+
+    def reindex(self):
+        ''' rebuild the index from the data file.  A corrupt record is skipped by scanning
+        forward, a byte at a time, to the next valid header and crc.  Any trailing partial record
+        is dropped. '''
+        with open(self.filename, "rb") as f:
+            data = f.read()
+
+        entries = []
+        skipped = 0
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= len(data):
+            size, crc = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            payload = data[start:start + size]
+
+            # every payload is a zlib stream, cheap to check before the crc
+            if (len(payload) == size and payload[:1] == ZLIB_HEADER and
+                    zlib.crc32(payload) & 0xffffffff == crc):
+                entries.append(INDEX_ENTRY.pack(offset, RECORD_HEADER.size + size))
+                offset = start + size
+            else:
+                offset += 1
+                skipped += 1
+
+        if skipped:
+            print "reindex %s: skipped %d corrupt bytes" % (self.filename, skipped)
+
+        with open(self.index_filename, "wb") as f:
+            f.write("".join(entries))
+
+        return len(entries)
+
+
+class MoveTimer(object):
+    ''' times each player's on_next_move() for the duration of a match.  on_move(timer), if
+    given, is called after each move (and may raise to end the match). '''
+
+    def __init__(self, players, on_move=None):
+        self.players = players
+        self.on_move = on_move
+        self.move_times = []
+
+    def _wrap(self, role_index, player):
+        orig = player.on_next_move
+
+        def on_next_move(*args, **kwds):
+            start = time.time()
+            try:
+                res = orig(*args, **kwds)
+            finally:
+                self.move_times.append([role_index, round(time.time() - start, 3)])
+
+            if self.on_move is not None:
+                self.on_move(self)
+            return res
+
+        return on_next_move
+
+    def __enter__(self):
+        for role_index, player in enumerate(self.players):
+            if hasattr(player, "on_next_move"):
+                player.on_next_move = self._wrap(role_index, player)
+        return self
+
+    def __exit__(self, *exc_info):
+        for player in self.players:
+            if "on_next_move" in vars(player):
+                del player.on_next_move
+
+
+###############################################################################
+
+class Runner(object):
+    """Inspect game archives."""
+
+    def info(self, filename):
+        archive = GameArchive(filename)
+        results = {}
+        num_moves = 0
+        for record in archive:
+            results[record.result] = results.get(record.result, 0) + 1
+            num_moves += len(record.moves)
+
+        print "games:", len(archive)
+        print "bytes:", os.path.getsize(archive.filename)
+        if len(archive):
+            print "average moves:", num_moves / float(len(archive))
+        for res, count in sorted(results.items()):
+            print "  %s: %s" % (res, count)
+
+    def show(self, filename, index=-1):
+        print at.attr_to_json(GameArchive(filename).get(index), pretty=True)
+
+    def reindex(self, filename):
+        print "indexed", GameArchive(filename).reindex(), "games"
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
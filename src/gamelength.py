@@ -0,0 +1,157 @@
+''' game length statistics and prediction, learned from the game archive.
+
+From the last HISTORY archived games of a tournament, played by the same source (gen_elo and
+asyncmatch count moves differently - see GameRecord.source):
+
+  * move count percentiles, giving an early limit - a game longer than LIMIT_FACTOR times the
+    LIMIT_PCT percentile is not going to finish, and is aborted as MatchTooLong there rather than
+    at the hard limit.  Counts are kept both as plies (len(moves), for asyncmatch) and as timed
+    moves (len(move_times), which is all gen_elo can see while ggpzero plays a match).
+
+  * expected match durations per player, so schedulers running games in parallel can start the
+    long ones first (see asyncmatch.Coordinator).
+
+Where the state machine is available (asyncmatch), Progress also adjudicates a game as a draw if
+a position repeats REPEAT_LIMIT times, or if nothing is captured / placed (the number of true
+base propositions doesn't change) for NO_PROGRESS_PLIES plies.
+'''
+
+import operator
+
+import gamearchive
+
+
+HISTORY = 2000
+MIN_GAMES = 30
+
+LIMIT_PCT = 99
+LIMIT_FACTOR = 1.5
+
+REPEAT_LIMIT = 3
+NO_PROGRESS_PLIES = 100
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+class LengthStats(object):
+    def __init__(self, records=(), source=None):
+        ''' with source, move counts are only learned from records of that source '''
+        self.source = source
+        self.plies = []
+        self.timed_moves = []
+        self.too_long = 0
+        self.games = 0
+
+        # name -> list of durations
+        self.durations = {}
+
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        if self.source is not None and record.source != self.source:
+            return
+
+        self.games += 1
+        if record.result == "MatchTooLong":
+            self.too_long += 1
+            return
+
+        if not record.scores:
+            return
+
+        self.plies.append(len(record.moves))
+        self.timed_moves.append(len(record.move_times))
+        for name in record.players:
+            self.durations.setdefault(name, []).append(record.duration)
+
+    def limit(self, timed=False):
+        ''' early move limit, or None if there isn't enough history '''
+        counts = self.timed_moves if timed else self.plies
+        if len(counts) < MIN_GAMES:
+            return None
+        return int(percentile(counts, LIMIT_PCT) * LIMIT_FACTOR) + 1
+
+    def expected_duration(self, name0, name1):
+        ''' mean duration of the players' games (or of all games), or None '''
+        durations = self.durations.get(name0, []) + self.durations.get(name1, [])
+        if not durations:
+            durations = [d for ds in self.durations.values() for d in ds]
+        return sum(durations) / len(durations) if durations else None
+
+    def summary(self):
+        return dict(games=self.games,
+                    too_long=self.too_long,
+                    plies_p50=percentile(self.plies, 50),
+                    plies_p99=percentile(self.plies, LIMIT_PCT),
+                    ply_limit=self.limit(),
+                    timed_move_limit=self.limit(timed=True))
+
+
+def load(elo_filename, source=None, history=HISTORY):
+    archive = gamearchive.GameArchive(gamearchive.archive_filename(elo_filename))
+    start = max(0, len(archive) - history)
+    return LengthStats((gamearchive.decode_record(p) for p in archive.payloads(start)), source)
+
+
+class Progress(object):
+    ''' follows a game's positions, see adjudicate() '''
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.seen = {}
+        self.plies = 0
+        self.last_change = 0
+        self.last_count = None
+
+    def update(self, bases):
+        ''' bases is a tuple of the state's base propositions (true / false) '''
+        self.plies += 1
+        self.seen[bases] = self.seen.get(bases, 0) + 1
+
+        count = sum(1 for b in bases if b)
+        if count != self.last_count:
+            self.last_count = count
+            self.last_change = self.plies
+
+    def adjudicate(self):
+        ''' None to carry on, "repetition" / "no progress" to call it a draw, or "MatchTooLong"
+        to abort '''
+        if self.seen and max(self.seen.values()) >= REPEAT_LIMIT:
+            return "repetition"
+
+        if self.plies - self.last_change >= NO_PROGRESS_PLIES:
+            return "no progress"
+
+        if self.limit is not None and self.plies >= self.limit:
+            return "MatchTooLong"
+
+        return None
+
+
+###############################################################################
+
+class Runner(object):
+    """Game length statistics."""
+
+    def stats(self, elo_filename, source=None, top=10):
+        stats = load(elo_filename, source)
+        for k, v in sorted(stats.summary().items()):
+            print "%-18s %s" % (k, v)
+
+        means = [(sum(ds) / len(ds), name) for name, ds in stats.durations.items()]
+        means.sort(key=operator.itemgetter(0), reverse=True)
+        print "longest games, by player:"
+        for secs, name in means[:top]:
+            print "  %-40s %8.1fs" % (name, secs)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,270 @@
+''' choosing which generations to rate, instead of rating all of them.
+
+Strength is modelled per series (eg all of hex_lg_19_v3_800_h2_xxx) as a smooth curve over the
+generation number - a gaussian process, with ratings of settled players as noisy observations.
+The curve gives an estimate (and an uncertainty) for every generation, rated or not, and the next
+generations to rate are the ones with the highest upper confidence bound (mean + KAPPA * sd).
+That favours both where the curve is unknown (its shape) and where it might be highest (the
+best generation).  Picks in one batch are spread out, by treating each pick as if it had already
+been rated at its predicted mean.
+
+With elo.py --plan=True, gen_elo only adds the generations chosen here (plus anything already
+rated); the rest are interpolated - see "genplan.py curve".
+'''
+
+import math
+import operator
+
+import ratings
+
+
+# players with fewer games than this are in progress, not observations
+MIN_OBS_PLAYED = 10
+
+# sd of a rating after one game, roughly - shrinks with sqrt(played)
+NOISE_ELO = 350.0
+
+# sd of a settled player, used for picks not yet rated
+SETTLED_SD = 50.0
+
+SIGNAL_SD = 400.0
+MIN_SIGNAL_SD = 100.0
+
+# candidate length scales, as fractions of a series' span - chosen by marginal likelihood
+LENGTH_SCALES = (0.05, 0.1, 0.2, 0.4)
+
+KAPPA = 2.0
+BATCH = 3
+
+
+def parse_generation(name):
+    ''' "hex_lg_19_v3_800_h2_477" -> ("hex_lg_19_v3_800_h2", 477), or None '''
+    parts = name.rsplit("_", 1)
+    if len(parts) != 2 or not parts[1].isdigit():
+        return None
+    return parts[0], int(parts[1])
+
+
+def _cholesky(a):
+    n = len(a)
+    l = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1):
+            s = a[i][j] - sum(l[i][k] * l[j][k] for k in range(j))
+            if i == j:
+                l[i][i] = math.sqrt(max(s, 1e-9))
+            else:
+                l[i][j] = s / l[j][j]
+    return l
+
+
+def _solve_lower(l, b):
+    x = []
+    for i in range(len(b)):
+        x.append((b[i] - sum(l[i][k] * x[k] for k in range(i))) / l[i][i])
+    return x
+
+
+def _solve_upper(l, b):
+    ''' solves transpose(l) x = b '''
+    n = len(b)
+    x = [0.0] * n
+    for i in reversed(range(n)):
+        x[i] = (b[i] - sum(l[k][i] * x[k] for k in range(i + 1, n))) / l[i][i]
+    return x
+
+
+class Curve(object):
+    ''' gaussian process over generation number, for one series '''
+
+    def __init__(self, observations, length_scale, signal_sd=SIGNAL_SD):
+        ''' observations is a list of (num, elo, noise sd) '''
+        self.xs = [float(x) for x, _, _ in observations]
+        self.length_scale = float(length_scale)
+        self.signal_sd = signal_sd
+
+        ys = [y for _, y, _ in observations]
+
+        # the mean is arbitrary without observations (every generation then looks the same)
+        self.mean = sum(ys) / len(ys) if ys else 0.0
+        self.residuals = [y - self.mean for y in ys]
+
+        k = [[self.kernel(a, b) for b in self.xs] for a in self.xs]
+        for i, (_, _, noise) in enumerate(observations):
+            k[i][i] += noise * noise
+
+        self.l = _cholesky(k)
+        self.alpha = _solve_upper(self.l, _solve_lower(self.l, self.residuals))
+
+    def kernel(self, a, b):
+        d = (a - b) / self.length_scale
+        return self.signal_sd ** 2 * math.exp(-0.5 * d * d)
+
+    def predict(self, x):
+        ''' returns (mean, sd) '''
+        ks = [self.kernel(x, xi) for xi in self.xs]
+        mu = self.mean + sum(k * a for k, a in zip(ks, self.alpha))
+        v = _solve_lower(self.l, ks)
+        var = self.signal_sd ** 2 - sum(vi * vi for vi in v)
+        return mu, math.sqrt(max(0.0, var))
+
+    def log_likelihood(self):
+        fit = -0.5 * sum(r * a for r, a in zip(self.residuals, self.alpha))
+        return fit - sum(math.log(self.l[i][i]) for i in range(len(self.xs)))
+
+
+def fit_curve(observations, candidates):
+    ''' picks hyperparameters for a series, returns a Curve '''
+    nums = [x for x, _, _ in observations] + list(candidates)
+    span = max(1, max(nums) - min(nums)) if nums else 1
+
+    signal_sd = SIGNAL_SD
+    if len(observations) > 2:
+        ys = [y for _, y, _ in observations]
+        mean = sum(ys) / len(ys)
+        signal_sd = max(MIN_SIGNAL_SD, math.sqrt(sum((y - mean) ** 2 for y in ys) / len(ys)))
+
+    curves = [Curve(observations, max(1.0, scale * span), signal_sd) for scale in LENGTH_SCALES]
+    return max(curves, key=lambda c: c.log_likelihood())
+
+
+class SeriesPlan(object):
+    def __init__(self, series, rated, candidates):
+        ''' rated is a list of PlayerRating, candidates a list of generation numbers '''
+        self.series = series
+        self.observations = []
+        self.pending = []
+        for p in rated:
+            num = parse_generation(p.name)[1]
+            if p.played >= MIN_OBS_PLAYED:
+                self.observations.append((num, p.elo, NOISE_ELO / math.sqrt(p.played)))
+            else:
+                self.pending.append(num)
+
+        rated_nums = set(parse_generation(p.name)[1] for p in rated)
+        self.candidates = sorted(set(candidates) - rated_nums)
+        self.curve = fit_curve(self.observations, self.candidates)
+
+    def choose(self, count=BATCH):
+        ''' returns up to count generation numbers to rate next '''
+        # in progress players are assumed to end up where the curve says
+        believed = list(self.observations)
+        for num in self.pending:
+            believed.append((num, self.curve.predict(num)[0], SETTLED_SD))
+
+        chosen = []
+        remaining = list(self.candidates)
+        for _ in range(min(count, len(remaining))):
+            curve = Curve(believed, self.curve.length_scale, self.curve.signal_sd)
+
+            def ucb(num):
+                mu, sd = curve.predict(num)
+                return mu + KAPPA * sd, num
+
+            num = max(remaining, key=ucb)
+            remaining.remove(num)
+            chosen.append(num)
+            believed.append((num, curve.predict(num)[0], SETTLED_SD))
+
+        return chosen
+
+    def estimates(self):
+        ''' returns sorted list of (num, mean, sd, rated) for rated and candidate generations '''
+        nums = set(self.candidates) | set(self.pending) | set(x for x, _, _ in self.observations)
+        rated = set(x for x, _, _ in self.observations)
+        return [(num, ) + self.curve.predict(num) + (num in rated, ) for num in sorted(nums)]
+
+    def best(self):
+        ''' generation with the highest estimated strength '''
+        return max(self.estimates(), key=operator.itemgetter(1))
+
+
+class Planner(object):
+    def __init__(self, all_ratings, names):
+        ''' names are all the players that could be rated, rated or not '''
+        rated = {}
+        for p in all_ratings.players:
+            gen = parse_generation(p.name)
+            if gen is not None and not p.fixed:
+                rated.setdefault(gen[0], []).append(p)
+
+        candidates = {}
+        for name in names:
+            gen = parse_generation(name)
+            if gen is not None:
+                candidates.setdefault(gen[0], []).append(gen[1])
+
+        self.plans = dict((series, SeriesPlan(series, rated.get(series, []),
+                                              candidates.get(series, [])))
+                          for series in set(rated) | set(candidates))
+
+    def choose(self, count=BATCH):
+        ''' returns names of players to add next, up to count per series '''
+        res = []
+        for series, plan in sorted(self.plans.items()):
+            res += ["%s_%s" % (series, num) for num in plan.choose(count)]
+        return res
+
+    def select(self, names, count=BATCH):
+        ''' the subset of names to play now: anything rated or not a generation, plus choose() '''
+        chosen = set(self.choose(count))
+        keep = []
+        for name in names:
+            gen = parse_generation(name)
+            if gen is None or name in chosen or gen[1] not in self.plans[gen[0]].candidates:
+                keep.append(name)
+        return keep
+
+
+def fill_names(all_ratings, step=None):
+    ''' every generation between the first and last rated of each series, in steps of step (or
+    of the smallest gap between rated generations) - for when the available generations are
+    not known '''
+    nums = {}
+    for p in all_ratings.players:
+        gen = parse_generation(p.name)
+        if gen is not None and not p.fixed:
+            nums.setdefault(gen[0], set()).add(gen[1])
+
+    names = []
+    for series, rated in nums.items():
+        rated = sorted(rated)
+        if len(rated) < 2:
+            continue
+        gap = step or min(b - a for a, b in zip(rated, rated[1:]))
+        names += ["%s_%s" % (series, num) for num in range(rated[0], rated[-1] + 1, gap)]
+    return names
+
+
+###############################################################################
+
+class Runner(object):
+    """Plan which generations to rate."""
+
+    def curve(self, filename, series=None, step=None):
+        ''' estimated strength along each series, rated or not '''
+        all_ratings = ratings.load_ratings(filename)
+        planner = Planner(all_ratings, fill_names(all_ratings, step))
+        for name, plan in sorted(planner.plans.items()):
+            if series is not None and not name.endswith("_" + series):
+                continue
+            if not plan.observations:
+                continue
+
+            num, mu, sd, _ = plan.best()
+            print "%s: best %s (%.1f +- %.1f), length scale %.1f" % (name, num, mu, sd,
+                                                                       plan.curve.length_scale)
+            for num, mu, sd, rated in plan.estimates():
+                print "  %6d %8.1f +- %6.1f %s" % (num, mu, sd, "rated" if rated else "")
+
+    def next(self, filename, count=BATCH, step=None):
+        ''' generations to rate next '''
+        all_ratings = ratings.load_ratings(filename)
+        for name in Planner(all_ratings, fill_names(all_ratings, step)).choose(count):
+            print name
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
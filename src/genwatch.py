@@ -0,0 +1,151 @@
+''' discovery of generations, at startup and while a tournament is running.
+
+A series is (name, first num, increment[, max num]) - eg ["h2", 255, 6, 500] is h2_255, h2_261,
+... up to h2_500.  Generations are probed with the manager's can_load() in order, stopping at the
+first one missing.
+
+The watcher remembers where each series stopped, and when training writes something new into the
+generations/models directories it probes again from there, so new generations join a running
+tournament (via gen_elo, under the usual slow add policy) without a restart.  Directory changes
+come from inotify if pyinotify is installed, otherwise the directories' mtimes are polled.  Either
+way, everything is probed again every FULL_PROBE_INTERVAL seconds in case an event was missed.
+Directories that don't exist yet (a game that hasn't started training) are checked for on every
+poll, and watched once they appear.
+'''
+
+import os
+import time
+
+from ggplib.util import log
+
+
+POLL_INTERVAL = 10.0
+FULL_PROBE_INTERVAL = 600.0
+
+
+def default_watch_dirs(game):
+    ''' where ggpzero's manager keeps generations and models '''
+    data_path = os.path.join(os.environ.get("GGPZERO_PATH", "."), "data", game)
+    return [os.path.join(data_path, d) for d in ("generations", "models")]
+
+
+class Series(object):
+    def __init__(self, name, num, incr, maxg=None):
+        self.name = name
+        self.num = num
+        self.incr = incr
+        self.maxg = maxg
+
+    def probe(self, man, game, verbose=True):
+        ''' returns newly loadable generations, in order '''
+        gens = []
+        while self.maxg is None or self.num <= self.maxg:
+            gen = "%s_%s" % (self.name, self.num)
+            if not man.can_load(game, gen):
+                if verbose:
+                    print "FAILED TO LOAD GEN", gen
+                break
+
+            gens.append(gen)
+            self.num += self.incr
+        return gens
+
+    def finished(self):
+        return self.maxg is not None and self.num > self.maxg
+
+
+class _Inotify(object):
+    ''' optional, only used if pyinotify is installed '''
+
+    def __init__(self, dirs):
+        import pyinotify
+
+        self.wm = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.wm, timeout=0)
+        self.mask = pyinotify.IN_CREATE | pyinotify.IN_MOVED_TO | pyinotify.IN_CLOSE_WRITE
+        self.missing = list(dirs)
+        self.watch_new()
+
+    def watch_new(self):
+        ''' watches any directories that have appeared, returns True if there were some '''
+        found = [d for d in self.missing if os.path.isdir(d)]
+        for d in found:
+            self.wm.add_watch(d, self.mask)
+            self.missing.remove(d)
+        return bool(found)
+
+    def changed(self):
+        appeared = self.watch_new()
+        if not self.notifier.check_events(timeout=0):
+            return appeared
+
+        self.notifier.read_events()
+        self.notifier.process_events()
+        return True
+
+
+class _Polling(object):
+    def __init__(self, dirs):
+        self.dirs = dirs
+        self.mtimes = self._mtimes()
+
+    def _mtimes(self):
+        return [os.stat(d).st_mtime if os.path.isdir(d) else None for d in self.dirs]
+
+    def changed(self):
+        mtimes = self._mtimes()
+        changed = mtimes != self.mtimes
+        self.mtimes = mtimes
+        return changed
+
+
+class GenerationWatcher(object):
+    def __init__(self, man, game, series, make_player, dirs=None, interval=POLL_INTERVAL):
+        ''' make_player(gen) returns a player for the generation '''
+        self.man = man
+        self.game = game
+        self.series = [Series(*s) for s in series]
+        self.make_player = make_player
+        self.dirs = dirs or default_watch_dirs(game)
+        self.interval = interval
+
+        self.events = None
+        self.last_check = self.last_probe = time.time()
+
+    def initial(self):
+        ''' generations available now (probing as the tournaments always have) '''
+        gens = []
+        for s in self.series:
+            gens += s.probe(self.man, self.game)
+        return gens
+
+    def start(self):
+        try:
+            self.events = _Inotify(self.dirs)
+        except ImportError:
+            self.events = _Polling(self.dirs)
+        log.info("watching %s for new generations (%s)" % (", ".join(self.dirs),
+                                                            self.events.__class__.__name__))
+
+    def poll(self):
+        ''' returns players for any new generations '''
+        if self.events is None:
+            self.start()
+
+        now = time.time()
+        if now - self.last_check < self.interval:
+            return []
+        self.last_check = now
+
+        if not self.events.changed() and now - self.last_probe < FULL_PROBE_INTERVAL:
+            return []
+        self.last_probe = now
+
+        gens = []
+        for s in self.series:
+            if not s.finished():
+                gens += s.probe(self.man, self.game, verbose=False)
+
+        for gen in gens:
+            log.info("new generation %s" % gen)
+        return [self.make_player(gen) for gen in gens]
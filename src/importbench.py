@@ -0,0 +1,87 @@
+''' import time benchmark for the command line tools.
+
+Each module is imported in a fresh interpreter several times, and the best/median wall time is
+reported.  Also reports if any of the heavy modules (nn/battle stack, matplotlib) were pulled in
+by a module that should be cheap to import.
+'''
+
+import os
+import sys
+import json
+import subprocess
+
+
+REPEATS = 10
+
+HEAVY_MODULES = ("ggpzero.nn", "ggpzero.battle", "ggplib.db", "matplotlib", "keras", "tensorflow",
+                 "fire")
+
+# module -> should it be free of HEAVY_MODULES?
+MODULES = [("ratings", True),
+           ("gamearchive", True),
+           ("eloplot", True),
+           ("elo", True)]
+
+SCRIPT = '''
+import sys, time, json
+t = time.time()
+import %s
+t = time.time() - t
+print json.dumps(dict(seconds=t, modules=sorted(sys.modules)))
+'''
+
+
+def time_import(module, repeats=REPEATS):
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    loaded = []
+    for _ in range(repeats):
+        out = subprocess.check_output([sys.executable, "-c", SCRIPT % module], cwd=cwd)
+        res = json.loads(out.splitlines()[-1])
+        times.append(res["seconds"])
+        loaded = res["modules"]
+
+    heavy = [h for h in HEAVY_MODULES if h in loaded]
+
+    times.sort()
+    return dict(module=module,
+                best=times[0],
+                median=times[len(times) // 2],
+                num_modules=len(loaded),
+                heavy=heavy)
+
+
+###############################################################################
+
+class Runner(object):
+    """Import time benchmarks."""
+
+    def run(self, repeats=REPEATS, output=None):
+        results = []
+        failed = False
+        for module, must_be_light in MODULES:
+            res = time_import(module, repeats)
+            results.append(res)
+
+            flag = ""
+            if must_be_light and res["heavy"]:
+                flag = "  <-- imports %s" % ", ".join(res["heavy"])
+                failed = True
+
+            print "%-15s best %7.1fms  median %7.1fms  %4d modules%s" % (module,
+                                                                         res["best"] * 1000,
+                                                                         res["median"] * 1000,
+                                                                         res["num_modules"],
+                                                                         flag)
+        if output:
+            with open(output, "w") as f:
+                json.dump(results, f, indent=4)
+
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
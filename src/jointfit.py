@@ -0,0 +1,180 @@
+''' joint rating fit, putting several .elo files on one scale.
+
+Each tournament is rated on its own arbitrary scale (STARTING_ELO, random pinned at 500 - or
+wherever it was pinned).  Players with the same name in more than one file (random, pymcs,
+simplemcts, or a generation played in two tournaments) are treated as one player, and link the
+scales together:
+
+  1. offsets - a file with a fixed player is pinned, its offset putting that player (ANCHOR_NAME
+     if fixed there, otherwise the first fixed) at ANCHOR_ELO.  Any other file gets the offset
+     where its shared players agree as closely as possible (least squares) with the joint
+     ratings.  This only needs the current snapshots.
+
+  2. refine - if any game history is available (archives, or the ratings logs), all games from
+     all files are fitted at once with ratings.fit_ratings(), starting from (and with a weak
+     prior on) the offset ratings.  Games between players of different files link the scales
+     directly.
+
+Note the shared players are only approximately the same strength in different games, so the
+joint scale is for comparing progress across related tournaments, not exact.
+'''
+
+import os
+import json
+import operator
+
+import ratings
+
+
+ANCHOR_NAME = "random"
+ANCHOR_ELO = 500.0
+
+OFFSET_ITERATIONS = 100
+
+GROUPS = dict(bt=["bt6", "bt7", "bt8"],
+              hex=["hex11", "hex13", "hex19"],
+              reversi=["r8", "r10"])
+
+
+def group_filenames(group):
+    return ["../data/elo/%s.elo" % name for name in GROUPS[group]]
+
+
+def table_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+class JointFit(object):
+    def __init__(self, filenames):
+        self.filenames = filenames
+        self.tables = dict((table_name(f), ratings.load_ratings(f)) for f in filenames)
+
+        counts = {}
+        for t in self.tables.values():
+            for p in t.players:
+                counts[p.name] = counts.get(p.name, 0) + 1
+        self.shared = set(name for name, count in counts.items() if count > 1)
+
+    def key(self, table, name):
+        ''' joint name of a player '''
+        return name if name in self.shared else "%s:%s" % (table, name)
+
+    def anchor(self, table):
+        ''' the fixed player pinning a table to ANCHOR_ELO, or None '''
+        fixed = [p for p in self.tables[table].players if p.fixed]
+        named = [p for p in fixed if p.name == ANCHOR_NAME]
+        return (named or fixed or [None])[0]
+
+    def solve_offsets(self):
+        ''' returns (dict of table -> offset, dict of shared name -> joint elo) '''
+        offsets = {}
+        free = []
+        for table in self.tables:
+            anchor = self.anchor(table)
+            if anchor is not None:
+                offsets[table] = ANCHOR_ELO - anchor.elo
+            else:
+                offsets[table] = 0.0
+                free.append(table)
+
+        joint = {}
+        for _ in range(OFFSET_ITERATIONS if free else 1):
+            # shared players are the mean over their tables
+            sums = {}
+            for table, t in self.tables.items():
+                for p in t.players:
+                    if p.name in self.shared:
+                        total, count = sums.get(p.name, (0.0, 0))
+                        sums[p.name] = total + p.elo + offsets[table], count + 1
+            joint = dict((n, total / count) for n, (total, count) in sums.items())
+            if ANCHOR_NAME in joint:
+                joint[ANCHOR_NAME] = ANCHOR_ELO
+
+            # and each unanchored table's offset is the mean disagreement of its shared players
+            for table in free:
+                diffs = [joint[p.name] - p.elo for p in self.tables[table].players
+                         if p.name in self.shared]
+                if diffs:
+                    offsets[table] = sum(diffs) / len(diffs)
+
+        return offsets, joint
+
+    def games(self):
+        ''' all known games from all tables, as (joint name0, joint name1, score0) '''
+        import gamearchive
+
+        res = []
+        for filename in self.filenames:
+            table = table_name(filename)
+            archive = gamearchive.archive_filename(filename)
+            if os.path.exists(archive):
+                games = ratings.games_from_archive(archive)
+            else:
+                games = ratings.games_from_log(self.tables[table])
+
+            res += [(self.key(table, n0), self.key(table, n1), s0) for n0, n1, s0 in games]
+        return res
+
+    def fit(self):
+        ''' returns (offsets, dict of joint name -> elo) '''
+        offsets, joint = self.solve_offsets()
+
+        elos = dict(joint)
+        fixed = set([ANCHOR_NAME])
+        for table, t in self.tables.items():
+            for p in t.players:
+                elos.setdefault(self.key(table, p.name), p.elo + offsets[table])
+                if p.fixed and p.name not in self.shared:
+                    fixed.add(self.key(table, p.name))
+
+        games = self.games()
+        if games:
+            elos = ratings.fit_ratings(elos, games, fixed=fixed)
+        return offsets, elos
+
+    def results(self):
+        ''' returns dict of table -> dict(offset, players=dict of name -> joint elo) '''
+        offsets, elos = self.fit()
+        res = {}
+        for table, t in self.tables.items():
+            res[table] = dict(offset=offsets[table],
+                              players=dict((p.name, elos[self.key(table, p.name)])
+                                           for p in t.players))
+        return res
+
+
+###############################################################################
+
+class Runner(object):
+    """Joint ratings across several .elo files."""
+
+    def fit(self, group=None, files=None, top=20, output=None):
+        if files is None:
+            filenames = group_filenames(group)
+        elif isinstance(files, basestring):
+            filenames = files.split(",")
+        else:
+            filenames = list(files)
+
+        jf = JointFit(filenames)
+        res = jf.results()
+
+        print "shared players:", ", ".join(sorted(jf.shared))
+        for table in sorted(res):
+            print "%-12s offset %+8.1f" % (table, res[table]["offset"])
+
+        rows = [(elo, table, name) for table in res
+                for name, elo in res[table]["players"].items()]
+        rows.sort(reverse=True, key=operator.itemgetter(0))
+        for elo, table, name in rows[:top]:
+            print "%-8s %-40s %8.1f" % (table, name, elo)
+
+        if output:
+            with open(output, "w") as f:
+                json.dump(res, f, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
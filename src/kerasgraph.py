@@ -0,0 +1,153 @@
+''' parses the keras model json (as found in data/<game>/models) into a simple layer graph, with
+shape inference.  Shapes never include the batch dimension. '''
+
+import json
+import base64
+import operator
+
+import storage
+
+
+class Layer(object):
+    def __init__(self, name, class_name, config, inputs):
+        self.name = name
+        self.class_name = class_name
+        self.config = config
+        self.inputs = inputs
+
+        # filled in by infer_shapes()
+        self.input_shapes = None
+        self.output_shape = None
+
+    def __repr__(self):
+        return "%s(%s %s)" % (self.class_name, self.name, self.output_shape)
+
+
+class Graph(object):
+    def __init__(self, layers, input_names, output_names):
+        # layers are in topological order (keras saves them that way)
+        self.layers = layers
+        self.input_names = input_names
+        self.output_names = output_names
+        self.by_name = dict((l.name, l) for l in layers)
+
+    @property
+    def input_shape(self):
+        return self.by_name[self.input_names[0]].output_shape
+
+
+def prod(shape):
+    return reduce(operator.mul, shape, 1)
+
+
+def lambda_kind(layer):
+    ''' the only lambda used by ggpzero models is the antirectifier '''
+    code = base64.b64decode(layer.config["function"][0])
+    assert "antirectifier" in code, "unknown lambda layer %s" % layer.name
+    return "antirectifier"
+
+
+def conv_output_size(size, kernel, stride, padding):
+    if padding == "same":
+        return (size + stride - 1) // stride
+    return (size - kernel) // stride + 1
+
+
+def _spatial(shape, data_format):
+    ''' returns channels, height, width '''
+    if data_format == "channels_last":
+        return shape[2], shape[0], shape[1]
+    return shape
+
+
+def _pack(c, h, w, data_format):
+    if data_format == "channels_last":
+        return (h, w, c)
+    return (c, h, w)
+
+
+def _output_shape(layer, shapes):
+    cfg = layer.config
+    kind = layer.class_name
+    shape = shapes[0] if shapes else None
+
+    if kind == "InputLayer":
+        return tuple(cfg["batch_input_shape"][1:])
+
+    if kind in ("BatchNormalization", "Activation", "Dropout"):
+        return shape
+
+    if kind in ("Add", "Multiply"):
+        # broadcasting (the squeeze excite scale multiplies by a (C, 1, 1) tensor)
+        return tuple(max(dims) for dims in zip(*shapes))
+
+    if kind in ("Conv2D", "AveragePooling2D", "MaxPooling2D"):
+        fmt = cfg.get("data_format", "channels_first")
+        c, h, w = _spatial(shape, fmt)
+        if kind == "Conv2D":
+            kh, kw = cfg["kernel_size"]
+            c = cfg["filters"]
+        else:
+            kh, kw = cfg["pool_size"]
+
+        sh, sw = cfg["strides"]
+        return _pack(c,
+                     conv_output_size(h, kh, sh, cfg["padding"]),
+                     conv_output_size(w, kw, sw, cfg["padding"]),
+                     fmt)
+
+    if kind == "GlobalAveragePooling2D":
+        return (_spatial(shape, cfg.get("data_format", "channels_first"))[0],)
+
+    if kind == "Dense":
+        return tuple(shape[:-1]) + (cfg["units"],)
+
+    if kind == "Reshape":
+        return tuple(cfg["target_shape"])
+
+    if kind == "Permute":
+        return tuple(shape[d - 1] for d in cfg["dims"])
+
+    if kind == "Flatten":
+        return (prod(shape),)
+
+    if kind == "Concatenate":
+        axis = cfg["axis"]
+        axis = axis - 1 if axis > 0 else len(shape) + axis
+        out = list(shape)
+        out[axis] = sum(s[axis] for s in shapes)
+        return tuple(out)
+
+    if kind == "Lambda":
+        lambda_kind(layer)
+        # antirectifier concatenates relu(x) and relu(-x) on axis 1
+        return (shape[0] * 2,) + tuple(shape[1:])
+
+    raise Exception("Unsupported layer %s (%s)" % (layer.name, kind))
+
+
+def infer_shapes(graph):
+    for layer in graph.layers:
+        layer.input_shapes = [graph.by_name[n].output_shape for n in layer.inputs]
+        layer.output_shape = _output_shape(layer, layer.input_shapes)
+
+
+def parse(model_json):
+    if isinstance(model_json, basestring):
+        model_json = json.loads(model_json)
+
+    cfg = model_json["config"]
+    layers = []
+    for l in cfg["layers"]:
+        inputs = [node[0] for node in l["inbound_nodes"][0]] if l["inbound_nodes"] else []
+        layers.append(Layer(l["name"], l["class_name"], l["config"], inputs))
+
+    graph = Graph(layers,
+                  [n[0] for n in cfg["input_layers"]],
+                  [n[0] for n in cfg["output_layers"]])
+    infer_shapes(graph)
+    return graph
+
+
+def load(filename):
+    return parse(storage.load_json(filename))
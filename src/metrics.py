@@ -0,0 +1,167 @@
+''' live metrics for running tournaments.
+
+After each game, gen_elo (and the asyncmatch coordinator) rewrite two status files next to the
+.elo file:
+
+  <base>.metrics.json  - for people and scripts
+  <base>.prom          - prometheus textfile collector format (point the node exporter's
+                         --collector.textfile.directory at data/elo, or set METRICS_DIR)
+
+Reported are games/hour (over the last WINDOW_SECS), mean / p95 match duration, the
+MatchTooLong rate, how many active players are in each CHOOSE_BUCKETS bucket, and an estimate of
+the time until every active player has reached the last bucket (at which point choose_players()
+has no one left to choose, and the run is over).
+'''
+
+import os
+import json
+import time
+
+
+WINDOW_SECS = 3600.0
+
+# rates over less than this are too noisy to report
+MIN_SPAN_SECS = 60.0
+
+# if None, files are written next to the .elo file
+METRICS_DIR = None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _atomic_write(filename, contents):
+    tmp_filename = "%s.%s" % (filename, os.getpid())
+    with open(tmp_filename, "w") as f:
+        f.write(contents)
+    os.rename(tmp_filename, filename)
+
+
+class Metrics(object):
+    def __init__(self, elo_filename, game, buckets, window=WINDOW_SECS):
+        base = os.path.splitext(elo_filename)[0]
+        if METRICS_DIR is not None:
+            base = os.path.join(METRICS_DIR, os.path.basename(base))
+
+        self.json_filename = base + ".metrics.json"
+        self.prom_filename = base + ".prom"
+        self.game = game
+        self.buckets = buckets
+        self.window = window
+
+        self.start_time = time.time()
+
+        # list of (end time, duration, too long)
+        self.games = []
+
+    def record(self, duration, too_long=False):
+        self.games.append((time.time(), duration, too_long))
+
+    def summary(self, all_ratings):
+        now = time.time()
+        recent = [g for g in self.games if g[0] > now - self.window]
+        span = max(MIN_SPAN_SECS, min(self.window, now - self.start_time))
+        games_per_hour = len(recent) * 3600.0 / span
+
+        durations = [d for _, d, too_long in self.games if not too_long]
+        active = [p for p in all_ratings.players if not p.fixed and not p.retired]
+
+        # players per bucket, as choose_players() sees them
+        buckets = {}
+        lower = 0
+        for count in self.buckets:
+            buckets[count] = len([p for p in active if lower <= p.played < count])
+            lower = count
+
+        # every game moves two players on by one
+        settle = self.buckets[-1]
+        games_to_settle = sum(max(0, settle - p.played) for p in active) / 2.0
+
+        eta = None
+        if games_to_settle == 0:
+            eta = 0.0
+        elif games_per_hour > 0:
+            eta = games_to_settle / games_per_hour * 3600.0
+
+        return dict(game=self.game,
+                    timestamp=now,
+                    uptime_secs=now - self.start_time,
+                    games=len(self.games),
+                    games_per_hour=games_per_hour,
+                    match_secs_mean=float(sum(durations)) / len(durations) if durations else None,
+                    match_secs_p95=percentile(durations, 95),
+                    match_too_long=len([g for g in self.games if g[2]]),
+                    match_too_long_rate=(len([g for g in self.games if g[2]]) /
+                                         float(len(self.games)) if self.games else 0.0),
+                    active_players=len(active),
+                    players_per_bucket=buckets,
+                    games_to_settle=games_to_settle,
+                    settle_eta_secs=eta)
+
+    def write(self, all_ratings):
+        summary = self.summary(all_ratings)
+        _atomic_write(self.json_filename, json.dumps(summary, indent=4, sort_keys=True))
+        _atomic_write(self.prom_filename, to_prometheus(summary))
+        return summary
+
+
+def to_prometheus(summary):
+    game = summary["game"]
+    lines = []
+
+    def metric(name, value, help_text, kind="gauge", **labels):
+        if value is None:
+            return
+        if not lines or not lines[-1].startswith("gzero_tournament_%s{" % name):
+            lines.append("# HELP gzero_tournament_%s %s" % (name, help_text))
+            lines.append("# TYPE gzero_tournament_%s %s" % (name, kind))
+
+        labels["game"] = game
+        label_str = ",".join('%s="%s"' % kv for kv in sorted(labels.items()))
+        lines.append("gzero_tournament_%s{%s} %s" % (name, label_str, float(value)))
+
+    metric("games_total", summary["games"], "games played this run", kind="counter")
+    metric("games_per_hour", summary["games_per_hour"], "recent games per hour")
+    metric("match_seconds_mean", summary["match_secs_mean"], "mean match duration")
+    metric("match_seconds_p95", summary["match_secs_p95"], "95th percentile match duration")
+    metric("match_too_long_total", summary["match_too_long"], "MatchTooLong aborts",
+           kind="counter")
+    metric("match_too_long_rate", summary["match_too_long_rate"], "fraction of MatchTooLong")
+    metric("active_players", summary["active_players"], "players being scheduled")
+    for bucket, count in sorted(summary["players_per_bucket"].items()):
+        metric("bucket_players", count, "active players per choose bucket", bucket=bucket)
+    metric("games_to_settle", summary["games_to_settle"], "games until all players settle")
+    metric("settle_eta_seconds", summary["settle_eta_secs"], "estimated time to settle")
+    metric("updated_timestamp_seconds", summary["timestamp"], "last update")
+
+    return "\n".join(lines) + "\n"
+
+
+###############################################################################
+
+class Runner(object):
+    """Tournament metrics."""
+
+    def show(self, elo_filename):
+        filename = os.path.splitext(elo_filename)[0] + ".metrics.json"
+        if METRICS_DIR is not None:
+            filename = os.path.join(METRICS_DIR, os.path.basename(filename))
+
+        with open(filename) as f:
+            summary = json.load(f)
+
+        age = time.time() - summary["timestamp"]
+        print "%s, updated %.0fs ago" % (summary["game"], age)
+        for k, v in sorted(summary.items()):
+            if k not in ("game", "timestamp"):
+                print "  %-22s %s" % (k, v)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,244 @@
+''' per model cpu inference benchmark over data/*/models.
+
+For each model json, measures evals/sec and latency percentiles at several batch sizes using the
+numpy engine (npinfer), along with peak memory.  Each model is run in its own process so that peak
+RSS is per model.
+
+If there is a converted .npw next to the model json it is used, otherwise the network is filled
+with random weights - the speed of a forward pass does not depend on the values.
+
+With mode "f16" or "i8", the weights are quantised first (see quantise.py) and run on npinfer's
+quantised path, so speed and peak memory can be compared against the float32 run.  Reports are
+keyed "<model>@<mode>" then.
+'''
+
+import os
+import sys
+import glob
+import json
+import time
+import socket
+import platform
+import resource
+import subprocess
+
+import numpy as np
+
+import storage
+import kerasgraph
+import npweights
+
+
+MODELS_GLOB = "../data/*/models/*.json"
+BATCH_SIZES = (1, 8, 64, 256)
+SECONDS_PER_BATCH_SIZE = 3.0
+PERCENTILES = (50, 90, 99)
+DEFAULT_TOLERANCE = 0.15
+
+
+def random_weights(graph, seed=42):
+    ''' returns list of (name, array) with keras shaped random weights for the graph '''
+    rng = np.random.RandomState(seed)
+    res = []
+    for layer in graph.layers:
+        cfg = layer.config
+        shape = layer.input_shapes[0] if layer.input_shapes else None
+
+        if layer.class_name == "Conv2D":
+            kh, kw = cfg["kernel_size"]
+            cin = shape[0]
+            fan_in = kh * kw * cin
+            res.append(("%s/kernel" % layer.name,
+                        rng.randn(kh, kw, cin, cfg["filters"]) / np.sqrt(fan_in)))
+            if cfg["use_bias"]:
+                res.append(("%s/bias" % layer.name, np.zeros(cfg["filters"])))
+
+        elif layer.class_name == "Dense":
+            fan_in = shape[-1]
+            res.append(("%s/kernel" % layer.name,
+                        rng.randn(fan_in, cfg["units"]) / np.sqrt(fan_in)))
+            if cfg["use_bias"]:
+                res.append(("%s/bias" % layer.name, np.zeros(cfg["units"])))
+
+        elif layer.class_name == "BatchNormalization":
+            channels = shape[0]
+            if cfg["scale"]:
+                res.append(("%s/gamma" % layer.name, np.ones(channels)))
+            if cfg["center"]:
+                res.append(("%s/beta" % layer.name, np.zeros(channels)))
+            res.append(("%s/moving_mean" % layer.name, rng.randn(channels) * 0.1))
+            res.append(("%s/moving_variance" % layer.name, 1.0 + rng.rand(channels)))
+
+    return [(name, array.astype(np.float32)) for name, array in res]
+
+
+def weights_for(model_filename, tmp_dir):
+    npw_filename = npweights.default_output(model_filename)
+    if os.path.exists(npw_filename):
+        return npw_filename, False
+
+    model_json = storage.load_json(model_filename)
+
+    tmp_filename = os.path.join(tmp_dir, "nnbench_%s.npw" % os.getpid())
+    npweights.write(tmp_filename, model_json, random_weights(kerasgraph.parse(model_json)))
+    return tmp_filename, True
+
+
+def bench_batch_size(model, batch_size, seconds):
+    rng = np.random.RandomState(batch_size)
+    x = (rng.rand(batch_size, *model.input_shape) > 0.5).astype(np.float32)
+
+    # warm up
+    model.predict(x)
+
+    latencies = []
+    start_time = time.time()
+    while time.time() - start_time < seconds:
+        t = time.time()
+        model.predict(x)
+        latencies.append(time.time() - t)
+
+    total = sum(latencies)
+    res = dict(batch_size=batch_size,
+               calls=len(latencies),
+               evals_per_sec=batch_size * len(latencies) / total)
+    for p in PERCENTILES:
+        res["latency_p%d_ms" % p] = float(np.percentile(latencies, p)) * 1000
+    return res
+
+
+def peak_rss_mb():
+    # linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def bench_model(model_filename, batch_sizes, seconds, tmp_dir="/tmp", mode=None):
+    ''' runs in the child process '''
+    import npinfer
+
+    npw_filename, is_tmp = weights_for(model_filename, tmp_dir)
+    quantised_filename = None
+    try:
+        if mode is not None:
+            import quantise
+            quantised_filename = os.path.join(tmp_dir, "nnbench_%s_%s.npw" % (os.getpid(), mode))
+            quantise.export(npw_filename, mode, quantised_filename)
+
+        model = npinfer.load(quantised_filename or npw_filename, quantised=mode is not None)
+        rss_loaded = peak_rss_mb()
+        results = [bench_batch_size(model, bs, seconds) for bs in batch_sizes]
+    finally:
+        if is_tmp:
+            os.remove(npw_filename)
+        if quantised_filename is not None:
+            os.remove(quantised_filename)
+
+    return dict(model=model_filename,
+                mode=mode or "f32",
+                random_weights=is_tmp,
+                input_shape=list(model.input_shape),
+                peak_rss_loaded_mb=rss_loaded,
+                peak_rss_mb=peak_rss_mb(),
+                results=results)
+
+
+def bench_all(model_filenames, batch_sizes, seconds, mode=None):
+    report = dict(host=socket.gethostname(),
+                  python=platform.python_version(),
+                  numpy=np.__version__,
+                  date=time.strftime("%Y/%m/%d %H:%M"),
+                  models={},
+                  failed={})
+
+    for filename in model_filenames:
+        key = os.path.relpath(filename, os.path.dirname(os.path.dirname(os.path.dirname(filename))))
+        cmd = [sys.executable, os.path.abspath(__file__), "one", filename,
+               "--batch_sizes=%s" % ",".join(str(b) for b in batch_sizes),
+               "--seconds=%s" % seconds]
+        if mode is not None:
+            key += "@%s" % mode
+            cmd.append("--mode=%s" % mode)
+        try:
+            res = json.loads(subprocess.check_output(cmd).splitlines()[-1])
+        except subprocess.CalledProcessError as exc:
+            # eg an unsupported layer - the rest of the models still get benchmarked
+            report["failed"][key] = "exit status %s" % exc.returncode
+            print "%-32s FAILED (exit status %s)" % (key, exc.returncode)
+            continue
+
+        report["models"][key] = res
+
+        print "%-32s %7.0f MB" % (key, res["peak_rss_mb"]),
+        for r in res["results"]:
+            print " b%-3d %8.0f/s p99 %6.1fms" % (r["batch_size"], r["evals_per_sec"],
+                                                   r["latency_p99_ms"]),
+        print
+
+    return report
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for key in sorted(report.get("failed", {})):
+        if key in baseline["models"]:
+            print "%-32s FAILED  <-- REGRESSION" % key
+            regressions.append((key, None))
+
+    for key, res in sorted(report["models"].items()):
+        base = baseline["models"].get(key)
+        if base is None:
+            continue
+
+        base_rates = dict((r["batch_size"], r["evals_per_sec"]) for r in base["results"])
+        for r in res["results"]:
+            if r["batch_size"] not in base_rates:
+                continue
+
+            ratio = r["evals_per_sec"] / base_rates[r["batch_size"]]
+            flag = ""
+            if ratio < 1.0 - tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append((key, r["batch_size"]))
+            print "%-32s b%-3d %6.2fx%s" % (key, r["batch_size"], ratio, flag)
+    return regressions
+
+
+def _batch_sizes(batch_sizes):
+    if isinstance(batch_sizes, basestring):
+        return [int(b) for b in batch_sizes.split(",")]
+    if isinstance(batch_sizes, int):
+        return [batch_sizes]
+    return list(batch_sizes)
+
+
+###############################################################################
+
+class Runner(object):
+    """Per model inference benchmarks."""
+
+    def run(self, models=MODELS_GLOB, batch_sizes=BATCH_SIZES,
+            seconds=SECONDS_PER_BATCH_SIZE, output=None, mode=None):
+        report = bench_all(sorted(glob.glob(models)), _batch_sizes(batch_sizes), seconds, mode)
+        if output:
+            with open(output, "w") as f:
+                json.dump(report, f, indent=4, sort_keys=True)
+
+    def compare(self, filename, baseline, tolerance=DEFAULT_TOLERANCE):
+        with open(filename) as f:
+            report = json.load(f)
+        with open(baseline) as f:
+            base = json.load(f)
+
+        if compare(report, base, tolerance):
+            sys.exit(1)
+
+    def one(self, model_filename, batch_sizes=BATCH_SIZES, seconds=SECONDS_PER_BATCH_SIZE,
+            mode=None):
+        print json.dumps(bench_model(model_filename, _batch_sizes(batch_sizes), seconds,
+                                     mode=mode))
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,385 @@
+''' pure numpy cpu inference for the published models.
+
+Builds the graph from the model json (via kerasgraph) and weights from a .npw file (see
+npweights).  BatchNormalization following a convolution is folded into the convolution weights,
+and convolutions are done as im2col + a single batched matrix multiply.
+
+Only channels_first models are supported (which is all of the ones in data/).
+
+With quantised=True, int8 / float16 kernels (see quantise.py) stay resident as stored, and their
+per channel scale (with any folded BatchNormalization) is applied to the matmul output.
+'''
+
+import time
+from functools import partial
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+import storage
+import kerasgraph
+import npweights
+
+
+L2_NORMALIZE_EPSILON = 1e-12
+CHECK_TOLERANCE = 1e-4
+
+
+def _same_padding(size, kernel, stride):
+    out = (size + stride - 1) // stride
+    total = max((out - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def im2col(x, kh, kw, sh, sw, padding):
+    ''' x is (N, C, H, W), returns (N, C * kh * kw, Ho * Wo) and (Ho, Wo) '''
+    if padding == "same":
+        pt, pb = _same_padding(x.shape[2], kh, sh)
+        pl, pr = _same_padding(x.shape[3], kw, sw)
+        if pt or pb or pl or pr:
+            x = np.pad(x, ((0, 0), (0, 0), (pt, pb), (pl, pr)), mode="constant")
+
+    n, c, h, w = x.shape
+    ho = (h - kh) // sh + 1
+    wo = (w - kw) // sw + 1
+
+    sn, sc, sy, sx = x.strides
+    windows = as_strided(x,
+                         shape=(n, c, kh, kw, ho, wo),
+                         strides=(sn, sc, sy, sx, sy * sh, sx * sw))
+    return windows.reshape(n, c * kh * kw, ho * wo), (ho, wo)
+
+
+def activation(name, inplace=False):
+    if name == "linear":
+        return None
+
+    if name == "relu":
+        if inplace:
+            return lambda x: np.maximum(x, 0, out=x)
+        return lambda x: np.maximum(x, 0)
+
+    if name == "elu":
+        # keras elu, alpha 1
+        return lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+    if name == "sigmoid":
+        return lambda x: 1.0 / (1.0 + np.exp(-x))
+
+    if name == "tanh":
+        return np.tanh
+
+    if name == "softmax":
+        def softmax(x):
+            e = np.exp(x - x.max(axis=-1, keepdims=True))
+            return e / e.sum(axis=-1, keepdims=True)
+        return softmax
+
+    raise Exception("Unsupported activation %s" % name)
+
+
+def bn_scale_shift(weights, epsilon):
+    ''' batch norm at inference is x * scale + shift '''
+    var = weights["moving_variance"].astype(np.float32)
+    scale = 1.0 / np.sqrt(var + epsilon)
+    if "gamma" in weights:
+        scale = scale * weights["gamma"]
+
+    shift = -weights["moving_mean"] * scale
+    if "beta" in weights:
+        shift = shift + weights["beta"]
+
+    return scale.astype(np.float32), shift.astype(np.float32)
+
+
+def kernel_and_scale(weights, quantised):
+    ''' returns (kernel, per output channel scale or None).  quantised kernels are kept as
+    stored. '''
+    kernel = np.asarray(weights["kernel"])
+    if not quantised or kernel.dtype == np.float32:
+        return kernel.astype(np.float32), None
+
+    scale = weights.get("kernel_scale", np.ones(kernel.shape[-1]))
+    return kernel, np.asarray(scale, dtype=np.float32)
+
+
+class Conv(object):
+    def __init__(self, cfg, weights, quantised=False):
+        assert cfg.get("data_format", "channels_first") == "channels_first"
+
+        # keras kernel is (kh, kw, cin, cout)
+        kernel, self.scale = kernel_and_scale(weights, quantised)
+        self.kh, self.kw, cin, self.cout = kernel.shape
+        self.sh, self.sw = cfg["strides"]
+        self.padding = cfg["padding"]
+        self.w = kernel.transpose(3, 2, 0, 1).reshape(self.cout, -1).copy()
+        self.b = np.asarray(weights["bias"], dtype=np.float32) if "bias" in weights else None
+        self.act = activation(cfg["activation"], inplace=True)
+
+    def fold_bn(self, scale, shift):
+        if self.scale is not None:
+            self.scale = self.scale * scale
+        else:
+            self.w *= scale[:, None]
+        if self.b is None:
+            self.b = shift.copy()
+        else:
+            self.b = self.b * scale + shift
+
+    def __call__(self, x):
+        n = x.shape[0]
+        if self.kh == self.kw == self.sh == self.sw == 1:
+            ho, wo = x.shape[2:]
+            cols = x.reshape(n, x.shape[1], ho * wo)
+        else:
+            cols, (ho, wo) = im2col(x, self.kh, self.kw, self.sh, self.sw, self.padding)
+
+        y = np.matmul(self.w, cols)
+        if self.scale is not None:
+            y *= self.scale[:, None]
+        if self.b is not None:
+            y += self.b[:, None]
+
+        y = y.reshape(n, self.cout, ho, wo)
+        return self.act(y) if self.act else y
+
+
+class Dense(object):
+    def __init__(self, cfg, weights, quantised=False):
+        self.w, self.scale = kernel_and_scale(weights, quantised)
+        self.b = np.asarray(weights["bias"], dtype=np.float32) if "bias" in weights else None
+        self.act = activation(cfg["activation"], inplace=True)
+
+    def __call__(self, x):
+        y = np.dot(x, self.w)
+        if self.scale is not None:
+            y *= self.scale
+        if self.b is not None:
+            y += self.b
+        return self.act(y) if self.act else y
+
+
+class BatchNorm(object):
+    def __init__(self, cfg, weights, ndim):
+        assert cfg["axis"] in (1, -ndim), "only channels_first batch norm supported"
+        scale, shift = bn_scale_shift(weights, cfg["epsilon"])
+        bshape = (1, -1) + (1,) * (ndim - 1)
+        self.scale = scale.reshape(bshape)
+        self.shift = shift.reshape(bshape)
+
+    def __call__(self, x):
+        return x * self.scale + self.shift
+
+
+def average_pool(x, cfg):
+    kh, kw = cfg["pool_size"]
+    sh, sw = cfg["strides"]
+    cols, (ho, wo) = im2col(x, kh, kw, sh, sw, cfg["padding"])
+    n, c = x.shape[:2]
+    return cols.reshape(n, c, kh * kw, ho * wo).mean(axis=2).reshape(n, c, ho, wo)
+
+
+def flatten(x, cfg):
+    if cfg.get("data_format") == "channels_first" and x.ndim > 2:
+        # keras moves channels last before flattening
+        x = x.transpose((0,) + tuple(range(2, x.ndim)) + (1,))
+    return x.reshape(x.shape[0], -1)
+
+
+def antirectifier(x):
+    x = x - x.mean(axis=1, keepdims=True)
+    norm = np.sqrt(np.maximum((x * x).sum(axis=1, keepdims=True), L2_NORMALIZE_EPSILON))
+    x = x / norm
+    return np.concatenate([np.maximum(x, 0), np.maximum(-x, 0)], axis=1)
+
+
+def concatenate(cfg, *xs):
+    axis = cfg["axis"]
+    return np.concatenate(xs, axis=axis if axis >= 0 else xs[0].ndim + axis)
+
+
+class Model(object):
+    def __init__(self, weights_file, quantised=False):
+        self.weights_file = weights_file
+        self.quantised = quantised
+        self.graph = kerasgraph.parse(weights_file.model_json)
+        self._build()
+
+    def _consumers(self):
+        consumers = dict((l.name, []) for l in self.graph.layers)
+        for l in self.graph.layers:
+            for i in l.inputs:
+                consumers[i].append(l)
+        return consumers
+
+    def _build(self):
+        consumers = self._consumers()
+        by_name = self.graph.by_name
+
+        # ops is list of (name, fn, input names)
+        self.ops = []
+        folded = {}
+        convs = {}
+
+        for layer in self.graph.layers:
+            kind = layer.class_name
+            cfg = layer.config
+            weights = self.weights_file.layer_weights(layer.name, kind,
+                                                      dequantise=not self.quantised)
+            inputs = [folded.get(i, i) for i in layer.inputs]
+
+            if kind == "InputLayer":
+                continue
+
+            if kind == "BatchNormalization":
+                src = by_name[layer.inputs[0]]
+                # only valid if the conv has no activation of its own
+                if (src.name in convs and len(consumers[src.name]) == 1 and
+                    src.config["activation"] == "linear"):
+                    convs[src.name].fold_bn(*bn_scale_shift(weights, cfg["epsilon"]))
+                    folded[layer.name] = src.name
+                    continue
+
+                fn = BatchNorm(cfg, weights, len(layer.output_shape))
+
+            elif kind == "Conv2D":
+                fn = convs[layer.name] = Conv(cfg, weights, self.quantised)
+
+            elif kind == "Dense":
+                fn = Dense(cfg, weights, self.quantised)
+
+            elif kind == "Activation":
+                fn = activation(cfg["activation"])
+                if fn is None:
+                    folded[layer.name] = inputs[0]
+                    continue
+
+            elif kind == "Dropout":
+                folded[layer.name] = inputs[0]
+                continue
+
+            elif kind == "Add":
+                fn = lambda *xs: reduce(np.add, xs)
+
+            elif kind == "Multiply":
+                fn = lambda *xs: reduce(np.multiply, xs)
+
+            elif kind == "GlobalAveragePooling2D":
+                fn = lambda x: x.mean(axis=(2, 3))
+
+            elif kind == "AveragePooling2D":
+                fn = partial(average_pool, cfg=cfg)
+
+            elif kind == "Reshape":
+                fn = lambda x, shape=tuple(cfg["target_shape"]): x.reshape((x.shape[0],) + shape)
+
+            elif kind == "Permute":
+                fn = lambda x, dims=(0,) + tuple(cfg["dims"]): x.transpose(dims)
+
+            elif kind == "Flatten":
+                fn = partial(flatten, cfg=cfg)
+
+            elif kind == "Concatenate":
+                fn = partial(concatenate, cfg)
+
+            elif kind == "Lambda":
+                kerasgraph.lambda_kind(layer)
+                fn = antirectifier
+
+            else:
+                raise Exception("Unsupported layer %s (%s)" % (layer.name, kind))
+
+            self.ops.append((layer.name, fn, inputs))
+
+        self.input_name = self.graph.input_names[0]
+        self.output_names = [folded.get(n, n) for n in self.graph.output_names]
+
+        # free intermediate results after their last use
+        last_use = {}
+        for ii, (_, _, inputs) in enumerate(self.ops):
+            for i in inputs:
+                last_use[i] = ii
+
+        self.release = [[] for _ in self.ops]
+        for name, ii in last_use.items():
+            if name not in self.output_names:
+                self.release[ii].append(name)
+
+    @property
+    def input_shape(self):
+        return self.graph.input_shape
+
+    def predict(self, x):
+        ''' x is (N, ...) input planes, returns list of outputs (policy heads..., value) '''
+        values = {self.input_name: np.asarray(x, dtype=np.float32)}
+        for (name, fn, inputs), release in zip(self.ops, self.release):
+            values[name] = fn(*[values[i] for i in inputs])
+            for r in release:
+                del values[r]
+
+        return [values[n] for n in self.output_names]
+
+
+def load(filename, quantised=False):
+    return Model(npweights.WeightsFile(filename), quantised)
+
+
+def make_reference(model_filename, h5_filename, output, batch_size=16, seed=42):
+    ''' run keras on random inputs and save inputs/outputs as npz (needs keras) '''
+    import keras
+
+    keras_model = keras.models.model_from_json(storage.read(model_filename))
+    keras_model.load_weights(h5_filename)
+
+    shape = keras_model.input_shape[1:]
+    rng = np.random.RandomState(seed)
+    inputs = (rng.rand(batch_size, *shape) > 0.5).astype(np.float32)
+    outputs = keras_model.predict(inputs)
+    np.savez(output, inputs=inputs, *outputs)
+
+
+def check(npw_filename, reference_filename, tolerance=CHECK_TOLERANCE):
+    ''' returns list of max abs differences per output, against a keras reference '''
+    model = load(npw_filename)
+    reference = np.load(reference_filename)
+    outputs = model.predict(reference["inputs"])
+
+    diffs = []
+    for ii, out in enumerate(outputs):
+        expect = reference["arr_%d" % ii]
+        assert expect.shape == out.shape, "shape mismatch %s %s" % (expect.shape, out.shape)
+        diffs.append(float(np.abs(expect - out).max()))
+
+    return diffs, all(d <= tolerance for d in diffs)
+
+
+###############################################################################
+
+class Runner(object):
+    """Numpy inference."""
+
+    def reference(self, model_filename, h5_filename, output, batch_size=16):
+        make_reference(model_filename, h5_filename, output, batch_size=batch_size)
+
+    def check(self, npw_filename, reference_filename, tolerance=CHECK_TOLERANCE):
+        diffs, ok = check(npw_filename, reference_filename, tolerance)
+        for name, d in zip(load(npw_filename).graph.output_names, diffs):
+            print "%-12s max abs diff %.3g" % (name, d)
+        print "OK" if ok else "FAILED"
+
+    def run(self, npw_filename, batch_size=8, repeats=10):
+        model = load(npw_filename)
+        x = (np.random.rand(batch_size, *model.input_shape) > 0.5).astype(np.float32)
+        model.predict(x)
+
+        start_time = time.time()
+        for _ in range(repeats):
+            model.predict(x)
+        elapsed = time.time() - start_time
+        print "%.1f evals/sec" % (batch_size * repeats / elapsed)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,171 @@
+''' binary weights container (.npw) that can be memory mapped.
+
+Layout:
+
+  magic        "GZNW\x01"
+  header_len   uint32, little endian
+  header       json - model json, tensor index (name, dtype, shape, offset)
+  padding      up to ALIGNMENT
+  tensors      raw little endian arrays, each starting on an ALIGNMENT boundary
+
+Loading maps the file read only and returns numpy views into the mapping, so there is no parsing
+or float conversion, and any number of processes on one host share the same pages via the OS page
+cache.
+
+The model json in data/<game>/models holds the architecture only - ggpzero saves the weights
+themselves in keras h5 files, so that is what is converted (h5py is needed for converting, but
+not for loading).
+'''
+
+import os
+import json
+import struct
+
+import numpy as np
+
+import storage
+
+
+MAGIC = "GZNW\x01"
+HEADER_LEN = struct.Struct("<I")
+ALIGNMENT = 64
+
+# keras order of weights per layer type
+WEIGHT_ORDER = dict(Conv2D=("kernel", "bias"),
+                    Dense=("kernel", "bias"),
+                    BatchNormalization=("gamma", "beta", "moving_mean", "moving_variance"))
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def short_weight_name(name):
+    # "ResLayer_0_conv1/kernel:0" -> "kernel"
+    return name.split("/")[-1].split(":")[0]
+
+
+def read_h5_weights(filename):
+    ''' returns ordered list of (layer_name/weight_name, array) from a keras h5 file '''
+    # optional dependency, only needed to convert
+    import h5py
+
+    res = []
+    with h5py.File(filename, "r") as f:
+        g = f["model_weights"] if "model_weights" in f else f
+        for layer_name in g.attrs["layer_names"]:
+            layer_group = g[layer_name]
+            for weight_name in layer_group.attrs["weight_names"]:
+                array = np.asarray(layer_group[weight_name], dtype=np.float32)
+                res.append(("%s/%s" % (layer_name, short_weight_name(weight_name)), array))
+    return res
+
+
+def write(filename, model_json, tensors):
+    ''' tensors is a list of (name, array) '''
+    index = []
+    offset = 0
+    for name, array in tensors:
+        array = np.ascontiguousarray(array)
+        dtype = array.dtype.newbyteorder("<").str
+        index.append(dict(name=name, dtype=dtype, shape=list(array.shape), offset=offset))
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps(dict(model=model_json, tensors=index), separators=(",", ":"))
+    data_start = _align(len(MAGIC) + HEADER_LEN.size + len(header))
+
+    tmp_filename = "%s.%s" % (filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for entry, (_, array) in zip(index, tensors):
+            f.seek(data_start + entry["offset"])
+            f.write(np.ascontiguousarray(array, dtype=entry["dtype"]).tostring())
+
+        # pad the final tensor, so the file size is aligned
+        f.truncate(data_start + offset)
+
+    os.rename(tmp_filename, filename)
+
+
+class WeightsFile(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.mapping = np.memmap(filename, dtype=np.uint8, mode="r")
+
+        assert self.mapping[:len(MAGIC)].tostring() == MAGIC, "not a weights file: %s" % filename
+        pos = len(MAGIC)
+        header_len, = HEADER_LEN.unpack(self.mapping[pos:pos + HEADER_LEN.size].tostring())
+        pos += HEADER_LEN.size
+        header = json.loads(self.mapping[pos:pos + header_len].tostring())
+        data_start = _align(pos + header_len)
+
+        self.model_json = header["model"]
+        self.names = []
+        self.tensors = {}
+        for entry in header["tensors"]:
+            dtype = np.dtype(str(entry["dtype"]))
+            start = data_start + entry["offset"]
+            nbytes = dtype.itemsize * int(np.prod(entry["shape"]))
+
+            # zero copy view into the read only mapping
+            view = self.mapping[start:start + nbytes].view(dtype).reshape(entry["shape"])
+            self.names.append(entry["name"])
+            self.tensors[entry["name"]] = view
+
+    def layer_weights(self, layer_name, class_name, dequantise=True):
+        ''' returns weights for a layer as a dict of short name -> array.  int8 quantised
+        weights (see quantise.py) are dequantised, unless dequantise=False - then they are as
+        stored, with the scale as "<short>_scale". '''
+        res = {}
+        for short in WEIGHT_ORDER.get(class_name, ()):
+            name = "%s/%s" % (layer_name, short)
+            if name in self.tensors:
+                res[short] = self.tensors[name]
+
+                if name + "_scale" in self.tensors:
+                    if dequantise:
+                        res[short] = res[short] * self.tensors[name + "_scale"]
+                    else:
+                        res[short + "_scale"] = self.tensors[name + "_scale"]
+        return res
+
+    @property
+    def nbytes(self):
+        return sum(t.nbytes for t in self.tensors.values())
+
+
+def default_output(model_filename):
+    return os.path.splitext(model_filename)[0] + ".npw"
+
+
+def convert(model_filename, h5_filename, output=None):
+    model_json = storage.load_json(model_filename)
+
+    tensors = read_h5_weights(h5_filename)
+    output = output or default_output(model_filename)
+    write(output, model_json, tensors)
+    return output
+
+
+###############################################################################
+
+class Runner(object):
+    """Convert and inspect .npw weights files."""
+
+    def convert(self, model_filename, h5_filename, output=None):
+        print "wrote", convert(model_filename, h5_filename, output)
+
+    def info(self, filename):
+        w = WeightsFile(filename)
+        for name in w.names:
+            t = w.tensors[name]
+            print "%-45s %-6s %s" % (name, t.dtype, t.shape)
+        print "%d tensors, %.1f MB" % (len(w.names), w.nbytes / 1e6)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
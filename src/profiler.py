@@ -0,0 +1,172 @@
+''' phase profiler for the tournament loop.
+
+Wall time is split into named phases (nested phases are named "outer/inner"), and a summary of
+count / total / mean / max per phase is written at exit, with the share of the run's wall time
+each top level phase took.  Optionally, every N games:
+
+  * cProfile - stats for the last N games are dumped to <prefix>.<games>.prof (view with
+    python -m pstats, snakeviz, ...).
+  * tracemalloc - the top allocation sites are written to <prefix>.<games>.malloc.txt.  Needs
+    python 3, or the pytracemalloc backport on python 2.
+
+When profiling is off, NULL is used in place of a profiler, and costs nothing.
+'''
+
+import time
+import json
+import atexit
+import operator
+from contextlib import contextmanager
+
+from ggplib.util import log
+
+
+TRACEMALLOC_TOP = 25
+
+
+class NullProfiler(object):
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    @contextmanager
+    def wrap(self, objs, method, name):
+        yield
+
+    def add(self, name, secs, count=1):
+        pass
+
+    def game_done(self):
+        pass
+
+
+NULL = NullProfiler()
+
+
+class PhaseProfiler(object):
+    def __init__(self, prefix, every=0, use_cprofile=False, use_tracemalloc=False):
+        self.prefix = prefix
+        self.every = every
+        self.start_time = time.time()
+        self.games = 0
+
+        # phase name -> [count, total secs, max secs]
+        self.totals = {}
+        self.stack = []
+
+        self.cprofile = None
+        if use_cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+        self.tracemalloc = None
+        if use_tracemalloc:
+            try:
+                import tracemalloc
+            except ImportError:
+                raise Exception("tracemalloc needs python 3 or the pytracemalloc backport")
+            tracemalloc.start()
+            self.tracemalloc = tracemalloc
+
+        atexit.register(self.report)
+
+    def add(self, name, secs, count=1):
+        if self.stack:
+            name = "%s/%s" % ("/".join(self.stack), name)
+
+        entry = self.totals.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += count
+        entry[1] += secs
+        entry[2] = max(entry[2], secs / max(1, count))
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.time()
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            self.add(name, time.time() - start_time)
+
+    @contextmanager
+    def wrap(self, objs, method, name):
+        ''' times calls to obj.<method>() as a phase, for the duration of the with block '''
+        def wrapped(orig, stack):
+            def fn(*args, **kwds):
+                start_time = time.time()
+                try:
+                    return orig(*args, **kwds)
+                finally:
+                    saved, self.stack = self.stack, stack
+                    self.add(name, time.time() - start_time)
+                    self.stack = saved
+            return fn
+
+        patched = []
+        for obj in objs:
+            if hasattr(obj, method):
+                setattr(obj, method, wrapped(getattr(obj, method), list(self.stack)))
+                patched.append(obj)
+        try:
+            yield
+        finally:
+            for obj in patched:
+                if method in vars(obj):
+                    delattr(obj, method)
+
+    def game_done(self):
+        self.games += 1
+        if self.every and self.games % self.every == 0:
+            self.snapshot()
+
+    def snapshot(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            filename = "%s.%d.prof" % (self.prefix, self.games)
+            self.cprofile.dump_stats(filename)
+            log.info("wrote %s" % filename)
+
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+        if self.tracemalloc is not None:
+            stats = self.tracemalloc.take_snapshot().statistics("lineno")
+            filename = "%s.%d.malloc.txt" % (self.prefix, self.games)
+            with open(filename, "w") as f:
+                for stat in stats[:TRACEMALLOC_TOP]:
+                    f.write("%s\n" % stat)
+            log.info("wrote %s" % filename)
+
+    def summary(self):
+        wall = time.time() - self.start_time
+        phases = {}
+        for name, (count, total, longest) in self.totals.items():
+            phases[name] = dict(count=count,
+                                total_secs=total,
+                                mean_secs=total / count if count else 0.0,
+                                max_secs=longest,
+                                pct_wall=100.0 * total / wall if wall else 0.0)
+
+        top_level = sum(p["total_secs"] for n, p in phases.items() if "/" not in n)
+        return dict(wall_secs=wall, games=self.games, unaccounted_secs=wall - top_level,
+                    phases=phases)
+
+    def report(self):
+        if self.cprofile is not None and self.every == 0:
+            self.snapshot()
+
+        summary = self.summary()
+        filename = "%s.profile.json" % self.prefix
+        with open(filename, "w") as f:
+            json.dump(summary, f, indent=4, sort_keys=True)
+
+        print "profile: %.1fs wall, %d games (%s)" % (summary["wall_secs"], summary["games"],
+                                                       filename)
+        rows = sorted(summary["phases"].items(), key=operator.itemgetter(0))
+        for name, p in rows:
+            print "  %-28s %6d %10.2fs %8.3fs mean %8.3fs max %5.1f%%" % (
+                name, p["count"], p["total_secs"], p["mean_secs"], p["max_secs"], p["pct_wall"])
+        print "  %-28s %17.2fs" % ("(unaccounted)", summary["unaccounted_secs"])
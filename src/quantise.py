@@ -0,0 +1,281 @@
+''' reduced precision (float16 / per channel int8) export of networks.
+
+Weights are quantised - conv and dense kernels.  Biases and batch norm parameters are tiny and
+stay float32.  int8 is symmetric, per output channel (the last axis of keras kernels), with the
+scale stored alongside as "<layer>/kernel_scale".
+
+For int8, activations can be quantised too, calibrated from sampled positions: the float32
+network is run over them, and the CALIBRATION_PCT percentile of each conv / dense layer's input
+(abs) becomes its per tensor scale, stored as "<layer>/input_scale".  Evaluating such a network
+simulates int8 inputs to those layers (rounding to the scale and clipping).
+
+npinfer.load(..., quantised=True) runs on the quantised kernels as stored (see nnbench --mode for
+speed and memory).  Quantised networks are evaluated in two ways:
+
+  * agreement - policy top-1 agreement, policy KL divergence and value abs error against the
+    float32 network, over positions sampled from recorded games.
+  * strength - the dequantised weights are saved as a new generation ("<gen>_f16", "<gen>_i8")
+    and a short tournament is run with gen_elo against the original.
+'''
+
+import os
+from functools import partial
+
+import numpy as np
+
+from ggplib.util import log
+
+import npinfer
+import npweights
+
+
+MODES = ("f16", "i8")
+QUANTISED_KINDS = ("Conv2D", "Dense")
+
+# clips the rare outliers, which would otherwise waste most of the int8 range
+CALIBRATION_PCT = 99.99
+
+
+def quantise_f16(array):
+    return [("", array.astype(np.float16))]
+
+
+def quantise_i8(array):
+    flat = array.reshape(-1, array.shape[-1])
+    scale = np.abs(flat).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.round(array / scale), -127, 127).astype(np.int8)
+    return [("", q), ("_scale", scale.astype(np.float32))]
+
+
+def quantise_weights(weights_file, mode):
+    ''' returns list of (name, array) for a new weights file '''
+    assert mode in MODES, "unknown mode %s" % mode
+    fn = quantise_f16 if mode == "f16" else quantise_i8
+
+    kinds = dict((l["name"], l["class_name"])
+                 for l in weights_file.model_json["config"]["layers"])
+
+    res = []
+    for name in weights_file.names:
+        array = weights_file.tensors[name]
+        layer_name, short = name.rsplit("/", 1)
+        if kinds.get(layer_name) in QUANTISED_KINDS and short == "kernel":
+            res += [(name + suffix, q) for suffix, q in fn(array)]
+        else:
+            res.append((name, np.array(array)))
+    return res
+
+
+def calibrate(model, positions, pct=CALIBRATION_PCT, batch_size=256):
+    ''' returns dict of layer name -> int8 scale of its input, for conv / dense layers of an
+    npinfer.Model, over the positions '''
+    ranges = {}
+    for start in range(0, len(positions), batch_size):
+        values = {model.input_name: np.asarray(positions[start:start + batch_size],
+                                               dtype=np.float32)}
+        for (name, fn, inputs), release in zip(model.ops, model.release):
+            args = [values[i] for i in inputs]
+            if isinstance(fn, (npinfer.Conv, npinfer.Dense)):
+                ranges[name] = max(ranges.get(name, 0.0),
+                                   float(np.percentile(np.abs(args[0]), pct)))
+            values[name] = fn(*args)
+            for r in release:
+                del values[r]
+
+    return dict((name, (r or 1.0) / 127.0) for name, r in ranges.items())
+
+
+def export(npw_filename, mode, output=None, positions_filename=None):
+    ''' with positions (see sample_positions), i8 also stores calibrated activation scales '''
+    if output is None:
+        output = "%s_%s.npw" % (os.path.splitext(npw_filename)[0], mode)
+
+    weights_file = npweights.WeightsFile(npw_filename)
+    tensors = quantise_weights(weights_file, mode)
+
+    if mode == "i8" and positions_filename is not None:
+        positions = np.load(positions_filename)["inputs"]
+        scales = calibrate(npinfer.Model(weights_file), positions)
+        tensors += [("%s/input_scale" % name, np.array([s], dtype=np.float32))
+                    for name, s in sorted(scales.items())]
+
+    npweights.write(output, weights_file.model_json, tensors)
+    return output
+
+
+def input_scales(weights_file):
+    ''' layer name -> activation scale, as stored by export() '''
+    return dict((name.rsplit("/", 1)[0], float(weights_file.tensors[name][0]))
+                for name in weights_file.names if name.endswith("/input_scale"))
+
+
+def _quantised_input(fn, scale, x, *xs):
+    x = np.clip(np.round(x / scale), -127, 127) * scale
+    return fn(x.astype(np.float32), *xs)
+
+
+def simulate_activations(model):
+    ''' rounds the inputs of layers with an input_scale to int8, in place.  returns model. '''
+    scales = input_scales(model.weights_file)
+    model.ops = [(name, partial(_quantised_input, fn, scales[name]) if name in scales else fn,
+                  inputs) for name, fn, inputs in model.ops]
+    return model
+
+
+def dequantised(weights_file):
+    ''' returns float32 weights as a dict of name -> array, undoing any quantisation '''
+    res = {}
+    for name in weights_file.names:
+        if name.endswith("_scale"):
+            continue
+
+        array = weights_file.tensors[name].astype(np.float32)
+        if name + "_scale" in weights_file.tensors:
+            array = array * weights_file.tensors[name + "_scale"]
+        res[name] = array
+    return res
+
+
+def agreement(model, reference_model, positions, batch_size=256):
+    ''' compares outputs (policy heads..., value) of two networks over the positions '''
+    top1 = kl = value_err = 0.0
+    num_policies = 0
+    for start in range(0, len(positions), batch_size):
+        x = positions[start:start + batch_size]
+        outs = model.predict(x)
+        refs = reference_model.predict(x)
+
+        for out, ref in zip(outs[:-1], refs[:-1]):
+            top1 += (out.argmax(axis=1) == ref.argmax(axis=1)).sum()
+            kl += (ref * (np.log(ref + 1e-8) - np.log(out + 1e-8))).sum()
+            num_policies += len(x)
+
+        value_err += np.abs(outs[-1] - refs[-1]).sum() / outs[-1].shape[1]
+
+    return dict(policy_top1=top1 / num_policies,
+                policy_kl=kl / num_policies,
+                value_mae=value_err / len(positions))
+
+
+def joint_moves_ok(moves, num_roles):
+    ''' archived moves must be one joint move per ply - a gdl move for every role '''
+    for joint in moves:
+        if not isinstance(joint, (list, tuple)) or len(joint) != num_roles:
+            return False
+        if not all(isinstance(m, basestring) for m in joint):
+            return False
+    return True
+
+
+def sample_positions(game, archive_filename, output, max_positions=4096, seed=42):
+    ''' replays archived games and writes sampled network input planes to an npz '''
+    # heavy, and only needed here
+    from ggplib.db import lookup
+    from ggpzero.nn.manager import get_manager
+
+    import gamearchive
+
+    game_info = lookup.by_name(game)
+    sm = game_info.get_sm()
+    transformer = get_manager().get_transformer(game)
+
+    rng = np.random.RandomState(seed)
+    num_roles = len(sm.get_roles())
+    archived = list(gamearchive.GameArchive(archive_filename))
+    records = [r for r in archived if joint_moves_ok(r.moves, num_roles)]
+    if len(records) < len(archived):
+        log.warning("skipping %d games without per ply joint moves" %
+                    (len(archived) - len(records)))
+    if not records:
+        raise Exception("no games in %s with moves recorded per ply and role" % archive_filename)
+    rng.shuffle(records)
+
+    joint_move = sm.get_joint_move()
+    base_state = sm.new_base_state()
+    planes = []
+    for record in records:
+        sm.reset()
+        prev_states = []
+        for moves in record.moves:
+            if len(planes) >= max_positions:
+                break
+
+            state = sm.get_current_state()
+            if rng.rand() < 0.25:
+                planes.append(transformer.state_to_channels(state.to_list(), prev_states))
+
+            for role_index, move in enumerate(moves):
+                ls = sm.get_legal_state(role_index)
+                legals = [ls.get_legal(ii) for ii in range(ls.get_count())]
+                choice = [l for l in legals if sm.legal_to_move(role_index, l) == move]
+                assert choice, "illegal move in archive %s" % move
+                joint_move.set(role_index, choice[0])
+
+            prev_states = [state.to_list()] + prev_states[:transformer.num_previous_states - 1]
+            sm.next_state(joint_move, base_state)
+            sm.update_bases(base_state)
+
+    np.savez(output, inputs=np.array(planes, dtype=np.float32))
+    return len(planes)
+
+
+def save_generation(game, gen, mode, npw_filename):
+    ''' saves dequantised weights as a new generation "<gen>_<mode>" for use in tournaments '''
+    from ggpzero.nn.manager import get_manager
+
+    man = get_manager()
+    nn = man.load_network(game, gen)
+    keras_model = nn.get_model()
+
+    weights = dequantised(npweights.WeightsFile(npw_filename))
+    for layer in keras_model.layers:
+        names = npweights.WEIGHT_ORDER.get(layer.__class__.__name__, ())
+        values = [weights["%s/%s" % (layer.name, n)] for n in names
+                  if "%s/%s" % (layer.name, n) in weights]
+        if values:
+            layer.set_weights(values)
+
+    new_gen = "%s_%s" % (gen, mode)
+    nn.generation_descr.name = new_gen
+    man.save_network(nn, generation_name=new_gen)
+    return new_gen
+
+
+###############################################################################
+
+class Runner(object):
+    """Reduced precision export and evaluation."""
+
+    def export(self, npw_filename, mode="i8", output=None, positions_filename=None):
+        print "wrote", export(npw_filename, mode, output, positions_filename)
+
+    def positions(self, game, archive_filename, output, max_positions=4096):
+        print "sampled", sample_positions(game, archive_filename, output, max_positions)
+
+    def agreement(self, npw_filename, quantised_filename, positions_filename):
+        positions = np.load(positions_filename)["inputs"]
+        model = simulate_activations(npinfer.load(quantised_filename))
+        res = agreement(model, npinfer.load(npw_filename), positions)
+        for k, v in sorted(res.items()):
+            print "%-12s %.4f" % (k, v)
+
+    def save_generation(self, game, gen, mode, npw_filename):
+        print "saved", save_generation(game, gen, mode, npw_filename)
+
+    def elo(self, game, gen, modes="f16,i8", filename=None):
+        ''' short tournament of the full precision generation against its quantised versions '''
+        import elo
+
+        match_info = elo.match_info_for(game)
+        gens = [gen] + ["%s_%s" % (gen, m) for m in modes.split(",")]
+        all_players = [elo.define_player(game, g, 800, 3) for g in gens]
+
+        filename = filename or "../data/elo/quantised_%s_%s.elo" % (game, gen)
+        elo.gen_elo(match_info, all_players, filename)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,312 @@
+''' rating tables (.elo files) - loading, saving, fitting, retirement and the commands on them.
+
+This module must stay cheap to import - it is used by cron jobs and tools that only inspect
+ratings, so nothing from the nn/battle stack (or matplotlib) is imported here.
+'''
+
+import os
+import re
+import csv
+import sys
+import json
+import math
+import operator
+
+from ggplib.util import log
+
+from ggpzero.util import attrutil as at
+
+import storage
+
+
+# retirement - settled players this far below the frontier stop being scheduled
+RETIRE_MIN_PLAYED = 60
+RETIRE_ELO_GAP = 800.0
+FRONTIER_TOP = 5
+
+# at most this many retired in one go, weakest first
+RETIRE_MAX = 10
+
+# fitting
+PRIOR_SD = 400.0
+MAX_STEP = 200.0
+FIT_TOLERANCE = 0.01
+FIT_MAX_ITERATIONS = 200
+
+LOG_RESULT_RE = re.compile(r"^(1st player wins|2nd player wins|Draws): (\S+) \(.*?\) / (\S+) \(")
+
+
+@at.register_attrs
+class PlayerRating(object):
+    name = at.attribute("xxyyyzz")
+    played = at.attribute(42)
+    elo = at.attribute(1302.124)
+    fixed = at.attribute(False)
+
+    # kept as an anchor, but no longer scheduled
+    retired = at.attribute(False)
+
+
+@at.register_attrs
+class AllRatings(object):
+    game = at.attribute("game")
+
+    # list of PlayerRating
+    players = at.attribute(default=at.attr_factory(list))
+
+    # simple log of recent games
+    log = at.attribute(default=at.attr_factory(list))
+
+
+def probability(rating1, rating2):
+    return 1.0 * 1.0 / (1 + 1.0 * math.pow(10, 1.0 * (rating1 - rating2) / 400))
+
+
+def next_elo_rating(rating_a, rating_b, k0, k1, player_a_wins, verbose=True):
+
+    # Winning probability of players
+    pa = probability(rating_b, rating_a)
+    pb = probability(rating_a, rating_b)
+
+    # player_a_wins is a bool, or a fractional score for player A (eg over a pair of games)
+    score_a = float(player_a_wins)
+    new_rating_a = rating_a + k0 * (score_a - pa)
+    new_rating_b = rating_b + k1 * ((1.0 - score_a) - pb)
+
+    if verbose:
+        log.info("rating_a k=%s %s -> %s" % (k0, rating_a, new_rating_a))
+        log.info("rating_b k=%s %s -> %s" % (k1, rating_b, new_rating_b))
+    return new_rating_a, new_rating_b
+
+
+def load_ratings(filename):
+    # parsed by hand, rather than at.json_to_attr(), since older files were written with the
+    # classes living in __main__
+    obj = storage.load_json(filename)["obj"]
+
+    ratings = AllRatings(obj["game"])
+    for p in obj["players"]:
+        p = p.get("obj", p)
+        ratings.players.append(PlayerRating(**dict((str(k), v) for k, v in p.items())))
+
+    ratings.log = list(obj.get("log", []))
+    return ratings
+
+
+def elo_dump_and_save(filename, ratings, verbose=False):
+    if verbose:
+        print "ELO DUMP:"
+        print "========="
+
+    # sort in place, so also benefit by saving in this order
+    ratings.players.sort(reverse=True,
+                         key=operator.attrgetter("elo"))
+    if verbose:
+        for p in ratings.players:
+            print p.name, p.played, p.elo
+
+    # written then renamed, so readers (eg ratingsd) never see a partial file
+    storage.write(filename, at.attr_to_json(ratings, pretty=True))
+
+
+def games_from_log(ratings):
+    ''' yields (name0, name1, score0) parsed from the result strings in the ratings log '''
+    for line in ratings.log:
+        m = LOG_RESULT_RE.match(line)
+        if m is None:
+            continue
+
+        res, name0, name1 = m.groups()
+        score0 = {"1st player wins": 1.0, "2nd player wins": 0.0}.get(res, 0.5)
+        yield name0, name1, score0
+
+
+def games_from_archive(filename):
+    ''' yields (name0, name1, score0) for every completed game in a game archive '''
+    import gamearchive
+
+    for record in gamearchive.GameArchive(filename):
+        if len(record.scores) != 2 or len(record.players) != 2:
+            continue
+
+        score0, score1 = record.scores
+        yield record.players[0], record.players[1], score0 / float(max(1, score0 + score1))
+
+
+def fit_ratings(initial, games, fixed=(), prior_sd=PRIOR_SD):
+    ''' maximum likelihood ratings (logistic/elo scale) given a list of (name0, name1, score0).
+
+    initial is dict of name -> elo, and is used both as the starting point and as the mean of a
+    weak gaussian prior (so that unbeaten players don't run off to infinity).  Players in fixed
+    are not moved, and so act as anchors for the scale. '''
+
+    c = math.log(10) / 400.0
+    elos = dict(initial)
+    opponents = {}
+    for name0, name1, score0 in games:
+        for n in (name0, name1):
+            elos.setdefault(n, 0.0)
+            opponents.setdefault(n, [])
+        opponents[name0].append((name1, score0))
+        opponents[name1].append((name0, 1.0 - score0))
+
+    prior = dict(elos)
+    free = [n for n in opponents if n not in fixed]
+    inv_var = 1.0 / (prior_sd * prior_sd)
+
+    for _ in range(FIT_MAX_ITERATIONS):
+        max_change = 0.0
+        for name in free:
+            elo = elos[name]
+            grad = -(elo - prior[name]) * inv_var
+            hess = inv_var
+            for opp, score in opponents[name]:
+                p = probability(elos[opp], elo)
+                grad += c * (score - p)
+                hess += c * c * p * (1.0 - p)
+
+            step = max(-MAX_STEP, min(MAX_STEP, grad / hess))
+            elos[name] = elo + step
+            max_change = max(max_change, abs(step))
+
+        if max_change < FIT_TOLERANCE:
+            break
+
+    return elos
+
+
+def frontier(ratings, top=FRONTIER_TOP, min_played=RETIRE_MIN_PLAYED):
+    ''' mean elo of the best settled, active (not fixed/retired) players.  Unsettled players
+    (eg newcomers still at STARTING_ELO) don't count. '''
+    elos = sorted((p.elo for p in ratings.players
+                   if not p.fixed and not p.retired and p.played >= min_played),
+                  reverse=True)[:top]
+    return sum(elos) / len(elos) if elos else None
+
+
+def retirement_candidates(ratings, min_played=RETIRE_MIN_PLAYED, gap=RETIRE_ELO_GAP,
+                          limit=RETIRE_MAX):
+    ''' active players whose rating is settled and far below the frontier, weakest first '''
+    best = frontier(ratings, min_played=min_played)
+    if best is None:
+        return []
+
+    players = [p for p in ratings.players
+               if not p.fixed and not p.retired and p.played >= min_played and p.elo < best - gap]
+    players.sort(key=operator.attrgetter("elo"))
+    return players[:limit]
+
+
+def retire(ratings, min_played=RETIRE_MIN_PLAYED, gap=RETIRE_ELO_GAP, limit=RETIRE_MAX):
+    ''' retires candidates in place, returns them '''
+    players = retirement_candidates(ratings, min_played, gap, limit)
+    for p in players:
+        p.retired = True
+    return players
+
+
+def refit(ratings, games):
+    ''' refits all ratings in place from the full game history '''
+    initial = dict((p.name, p.elo) for p in ratings.players)
+    fixed = set(p.name for p in ratings.players if p.fixed or p.retired)
+    elos = fit_ratings(initial, games, fixed=fixed)
+    for p in ratings.players:
+        p.elo = elos[p.name]
+
+
+def print_players(players):
+    for p in players:
+        status = " (fixed)" if p.fixed else " (retired)" if p.retired else ""
+        print "%-40s %5d %8.1f%s" % (p.name, p.played, p.elo, status)
+
+
+###############################################################################
+
+# commands that only need the rating tables (see elo.py)
+RATINGS_COMMANDS = ("show", "export", "refit", "retire", "reactivate")
+
+
+class Runner(object):
+    """Commands on .elo files."""
+
+    def show(self, filename, top=None, series=None):
+        ratings = load_ratings(filename)
+        players = sorted(ratings.players, key=operator.attrgetter("elo"), reverse=True)
+        if series is not None:
+            players = [p for p in players if "_%s_" % series in p.name]
+
+        print "%s (%d players)" % (ratings.game, len(ratings.players))
+        print_players(players[:top])
+
+    def export(self, filename, fmt="csv", output=None):
+        ratings = load_ratings(filename)
+        rows = [(p.name, p.played, round(p.elo, 2), p.fixed, p.retired)
+                for p in sorted(ratings.players, key=operator.attrgetter("elo"), reverse=True)]
+
+        f = open(output, "w") if output else sys.stdout
+        try:
+            if fmt == "csv":
+                writer = csv.writer(f)
+                writer.writerow(("name", "played", "elo", "fixed", "retired"))
+                writer.writerows(rows)
+            else:
+                assert fmt == "json", "unknown format %s" % fmt
+                json.dump([dict(name=n, played=pl, elo=e, fixed=fx, retired=r)
+                           for n, pl, e, fx, r in rows], f, indent=4)
+        finally:
+            if output:
+                f.close()
+
+    def refit(self, filename, archive=None, output=None):
+        ''' refit ratings from the game archive (or the ratings log if there is no archive) '''
+        import gamearchive
+
+        ratings = load_ratings(filename)
+        if archive is None:
+            archive = gamearchive.archive_filename(filename)
+
+        if os.path.exists(archive):
+            games = list(games_from_archive(archive))
+        else:
+            games = list(games_from_log(ratings))
+
+        print "refitting %s from %d games" % (filename, len(games))
+        refit(ratings, games)
+
+        # only written out if asked, as the tournament may still be updating filename
+        if output:
+            elo_dump_and_save(output, ratings)
+        print_players(sorted(ratings.players, key=operator.attrgetter("elo"), reverse=True))
+
+    def retire(self, filename, min_played=RETIRE_MIN_PLAYED, gap=RETIRE_ELO_GAP, limit=RETIRE_MAX,
+               dry_run=False):
+        ''' retire settled players far below the frontier.  Don't run while a tournament is
+        updating filename (see elo.AUTO_RETIRE). '''
+        ratings = load_ratings(filename)
+        best = frontier(ratings, min_played=min_played)
+        if best is None:
+            print "no settled players, nothing to retire"
+            return
+
+        print "frontier %.1f" % best
+        players = retirement_candidates(ratings, min_played, gap, limit)
+        print_players(players)
+
+        if not dry_run:
+            for p in players:
+                p.retired = True
+            elo_dump_and_save(filename, ratings)
+
+    def reactivate(self, filename, *names):
+        ratings = load_ratings(filename)
+        by_name = dict((p.name, p) for p in ratings.players)
+        for name in names:
+            by_name[name].retired = False
+        elo_dump_and_save(filename, ratings)
+        print_players([by_name[n] for n in names])
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,265 @@
+''' in memory ratings service.
+
+Keeps every rating table (data/elo/*.elo) loaded and indexed, and answers queries over localhost
+http with json, so leaderboards, plots and "pick the best generation" don't each re-read and
+parse the files.
+
+  /tables                           name, game, version and player count of every table
+  /top/<table>?n=10                 best players
+  /series/<table>/<series>          players of one series (eg h2), best first
+  /player/<table>/<name>            one player, with rank
+  /best/<table>?series=h2           best active player (optionally of one series)
+  /watch?since=<version>&timeout=30 blocks until any table changes after version
+
+Tables are reloaded when their file changes (polled by mtime, which is cheap), and each reload
+bumps a global version.  /watch is a long poll - it returns as soon as the version passes
+since, so consumers are told of new results rather than polling files.
+'''
+
+import os
+import glob
+import json
+import time
+import urllib2
+import operator
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from ggplib.util import log
+
+import ratings
+
+
+ELO_GLOB = "../data/elo/*.elo"
+DEFAULT_PORT = 9181
+POLL_INTERVAL = 1.0
+WATCH_TIMEOUT = 30.0
+DEFAULT_TOP = 10
+
+
+def table_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def player_series(name):
+    ''' "hex_lg_19_v3_800_h2_477" -> "h2" '''
+    parts = name.rsplit("_", 2)
+    return parts[-2] if len(parts) == 3 else None
+
+
+def player_dict(p, rank=None):
+    d = dict(name=p.name, played=p.played, elo=p.elo, fixed=p.fixed, retired=p.retired)
+    if rank is not None:
+        d["rank"] = rank
+    return d
+
+
+class Table(object):
+    ''' one loaded .elo file, with precomputed indexes '''
+
+    def __init__(self, filename, all_ratings, mtime, version):
+        self.filename = filename
+        self.game = all_ratings.game
+        self.mtime = mtime
+        self.version = version
+
+        self.players = sorted(all_ratings.players, key=operator.attrgetter("elo"), reverse=True)
+        self.ranks = dict((p.name, ii + 1) for ii, p in enumerate(self.players))
+        self.by_name = dict((p.name, p) for p in self.players)
+
+        self.series = {}
+        for p in self.players:
+            self.series.setdefault(player_series(p.name), []).append(p)
+
+    def summary(self):
+        return dict(game=self.game, version=self.version, players=len(self.players))
+
+    def best(self, series=None):
+        players = self.series.get(series, []) if series else self.players
+        for p in players:
+            if not p.fixed and not p.retired:
+                return p
+        return None
+
+
+class Tables(object):
+    def __init__(self, pattern=ELO_GLOB):
+        self.pattern = pattern
+        self.tables = {}
+        self.version = 0
+        self.cond = threading.Condition()
+
+    def refresh(self):
+        ''' reloads changed tables, returns names of those that changed '''
+        changed = []
+        for filename in glob.glob(self.pattern):
+            name = table_name(filename)
+            mtime = os.stat(filename).st_mtime
+            current = self.tables.get(name)
+            if current is not None and current.mtime == mtime:
+                continue
+
+            try:
+                all_ratings = ratings.load_ratings(filename)
+            except (IOError, ValueError) as exc:
+                # caught mid write, will be picked up on the next poll
+                log.warning("failed to load %s: %s" % (filename, exc))
+                continue
+
+            with self.cond:
+                self.version += 1
+                self.tables[name] = Table(filename, all_ratings, mtime, self.version)
+            changed.append(name)
+
+        if changed:
+            with self.cond:
+                self.cond.notify_all()
+        return changed
+
+    def follow(self, interval=POLL_INTERVAL):
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+    def wait(self, since, timeout):
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.version <= since:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            changed = sorted(n for n, t in self.tables.items() if t.version > since)
+            return dict(version=self.version, changed=changed)
+
+    def get(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            raise KeyError("unknown table: %s" % name)
+        return table
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        args = dict((k, v[-1]) for k, v in urlparse.parse_qs(url.query).items())
+
+        try:
+            res = self.dispatch(parts, args)
+        except (KeyError, ValueError, IndexError) as exc:
+            self.reply(404, dict(error=str(exc)))
+        else:
+            self.reply(200, res)
+
+    def dispatch(self, parts, args):
+        tables = self.server.tables
+        cmd = parts[0] if parts else "tables"
+
+        if cmd == "tables":
+            return dict(version=tables.version,
+                        tables=dict((n, t.summary()) for n, t in tables.tables.items()))
+
+        if cmd == "watch":
+            return tables.wait(int(args.get("since", tables.version)),
+                               float(args.get("timeout", WATCH_TIMEOUT)))
+
+        table = tables.get(parts[1])
+        if cmd == "top":
+            n = int(args.get("n", DEFAULT_TOP))
+            return [player_dict(p, ii + 1) for ii, p in enumerate(table.players[:n])]
+
+        if cmd == "series":
+            return [player_dict(p, table.ranks[p.name]) for p in table.series.get(parts[2], [])]
+
+        if cmd == "player":
+            return player_dict(table.by_name[parts[2]], table.ranks[parts[2]])
+
+        if cmd == "best":
+            p = table.best(args.get("series"))
+            return player_dict(p, table.ranks[p.name]) if p else None
+
+        raise KeyError("unknown command: %s" % cmd)
+
+    def reply(self, code, res):
+        body = json.dumps(res)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(port=DEFAULT_PORT, pattern=ELO_GLOB):
+    tables = Tables(pattern)
+    tables.refresh()
+
+    follower = threading.Thread(target=tables.follow)
+    follower.daemon = True
+    follower.start()
+
+    server = Server(("127.0.0.1", port), Handler)
+    server.tables = tables
+    log.info("ratings service on port %d, %d tables" % (port, len(tables.tables)))
+    server.serve_forever()
+
+
+###############################################################################
+# client side
+
+def query(path, port=DEFAULT_PORT, timeout=WATCH_TIMEOUT + 5):
+    f = urllib2.urlopen("http://127.0.0.1:%d/%s" % (port, path.lstrip("/")), timeout=timeout)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def best_generation(table, series=None, port=DEFAULT_PORT):
+    path = "best/%s" % table
+    if series:
+        path += "?series=%s" % series
+    return query(path, port)
+
+
+def watch(port=DEFAULT_PORT):
+    ''' yields list of changed table names, as they change '''
+    since = query("tables", port)["version"]
+    while True:
+        res = query("watch?since=%d" % since, port)
+        since = res["version"]
+        if res["changed"]:
+            yield res["changed"]
+
+
+###############################################################################
+
+class Runner(object):
+    """In memory ratings service."""
+
+    def serve(self, port=DEFAULT_PORT, pattern=ELO_GLOB):
+        serve(port, pattern)
+
+    def query(self, path, port=DEFAULT_PORT):
+        print json.dumps(query(path, port), indent=4)
+
+    def watch(self, port=DEFAULT_PORT):
+        for changed in watch(port):
+            print time.strftime("%H:%M:%S"), " ".join(changed)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
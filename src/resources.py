@@ -0,0 +1,296 @@
+''' resource profiles for tournaments, and placement of chunks onto a host.
+
+A profile is what one tournament chunk (see scheduler.py) is expected to need:
+
+  rss_mb     peak memory of the child process
+  threads    cores it keeps busy (cpu time / wall time)
+  load_secs  startup - imports, state machine and defining the players, until gen_elo has
+             prepared its ratings
+  game_secs  wall time per game
+
+Profiles are per game (the game of the tournament's .elo file) and per game + model, where the
+model is the largest network the tournament plays ("hexLG13/h2_477") - it is what sets the memory
+and much of the time a chunk needs.  A model without observations yet uses its game's profile.
+Before anything is measured, rss is estimated from the sizes of the networks that will be loaded
+(via costmodel) and game time from the durations in the game archive.  After every chunk the
+measured peak rss, cpu use, startup and time per game are folded into both profiles.  OOM kills
+grow the memory estimate, and chunks running far past their expected time (stragglers) are
+killed and grow the time estimate.
+
+Profiles are kept in PROFILES_FILENAME, which is per host and not checked in.
+'''
+
+import os
+import json
+import multiprocessing
+
+import ratings
+import costmodel
+import gamearchive
+
+
+PROFILES_FILENAME = "../data/elo/.resources.json"
+
+# tournament (elo.Runner method) -> data dir of its models
+MODELS_DIRS = dict(bt6="breakthroughSmall",
+                   bt8="breakthrough",
+                   hex11="hexLG11",
+                   hex13="hexLG13",
+                   hex19="hex19",
+                   connect6="connect6",
+                   amazons="amazons_10x10",
+                   reversi_8="reversi_8x8",
+                   reversi_10="reversi_10x10",
+                   chess_15d="chess",
+                   idk="draughts_killer")
+
+DEFAULT_PROFILE = dict(rss_mb=2000.0, threads=2.0, load_secs=120.0, game_secs=600.0)
+
+# process, interpreter, state machine and tf runtime, before any networks
+BASE_RSS_MB = 800.0
+
+# per network - the tf session/graph, plus float32 weights and their copies
+PER_MODEL_RSS_MB = 200.0
+BYTES_PER_PARAM = 4 * 3
+
+# networks resident at once in a chunk (players are loaded on demand)
+MAX_RESIDENT_MODELS = 8
+
+SMOOTHING = 0.3
+RSS_HEADROOM = 1.2
+OOM_GROWTH = 1.5
+STRAGGLER_FACTOR = 3.0
+STRAGGLER_GROWTH = 1.5
+ARCHIVE_SAMPLE = 200
+
+
+def host_memory_mb():
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) / 1024.0
+    return None
+
+
+def host_cores():
+    return multiprocessing.cpu_count()
+
+
+def player_gen(name):
+    ''' "hex_lg_19_v3_800_h2_477" -> "h2_477" '''
+    return "_".join(name.rsplit("_", 2)[-2:])
+
+
+def profile_key(tournament):
+    ''' the game of a scheduler.Tournament, or its name if it has no ratings yet '''
+    try:
+        return ratings.load_ratings(tournament.filename).game
+    except (IOError, OSError):
+        return tournament.name
+
+
+def model_key(tournament):
+    ''' "<game>/<model>" for the largest network in a scheduler.Tournament, or None '''
+    params = network_params(tournament.name, tournament.filename)
+    if not params:
+        return None
+    largest = max(params, key=lambda gen: (params[gen], gen))
+    return "%s/%s" % (profile_key(tournament), largest)
+
+
+def network_params(tournament, elo_filename):
+    ''' generation -> parameter count, of the networks played in the tournament '''
+    if tournament not in MODELS_DIRS or not os.path.exists(elo_filename):
+        return {}
+
+    costs = costmodel.ModelCosts("../data/%s/models" % MODELS_DIRS[tournament])
+    available = set(costs.model_names())
+    gens = set(player_gen(p.name) for p in ratings.load_ratings(elo_filename).players)
+    return dict((gen, costs.get(gen)["params"]) for gen in gens if gen in available)
+
+
+def estimate_rss_mb(tournament, elo_filename):
+    ''' from the size of the largest networks played in the tournament '''
+    params = network_params(tournament, elo_filename).values()
+    if not params:
+        return None
+
+    largest = sorted(params, reverse=True)[:MAX_RESIDENT_MODELS]
+    return BASE_RSS_MB + sum(PER_MODEL_RSS_MB + p * BYTES_PER_PARAM / 1e6 for p in largest)
+
+
+def estimate_game_secs(elo_filename):
+    ''' mean duration of the most recent archived games '''
+    filename = gamearchive.archive_filename(elo_filename)
+    if not os.path.exists(filename):
+        return None
+
+    archive = gamearchive.GameArchive(filename)
+    durations = [archive.get(ii).duration
+                 for ii in range(max(0, len(archive) - ARCHIVE_SAMPLE), len(archive))]
+    durations = [d for d in durations if d > 0]
+    if not durations:
+        return None
+    return sum(durations) / len(durations)
+
+
+class Profiles(object):
+    ''' profiles by game and by game + model - methods take a scheduler.Tournament '''
+
+    def __init__(self, filename=PROFILES_FILENAME):
+        self.filename = filename
+        self.profiles = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.profiles = json.load(f)
+
+        # tournament name -> (game key, model key or None)
+        self.keys = {}
+
+    def key(self, tournament):
+        if tournament.name not in self.keys:
+            self.keys[tournament.name] = profile_key(tournament), model_key(tournament)
+        return self.keys[tournament.name]
+
+    def save(self):
+        tmp_filename = "%s.%s" % (self.filename, os.getpid())
+        with open(tmp_filename, "w") as f:
+            json.dump(self.profiles, f, indent=4, sort_keys=True)
+        os.rename(tmp_filename, self.filename)
+
+    def get(self, tournament):
+        ''' the model's profile once it has been observed, otherwise the game's '''
+        _, model = self.key(tournament)
+        if model in self.profiles:
+            return self.profiles[model]
+        return self.game_profile(tournament)
+
+    def game_profile(self, tournament):
+        key, _ = self.key(tournament)
+        if key not in self.profiles:
+            profile = dict(DEFAULT_PROFILE, chunks=0, ooms=0, stragglers=0)
+            profile["rss_mb"] = (estimate_rss_mb(tournament.name, tournament.filename) or
+                                 profile["rss_mb"])
+            profile["game_secs"] = estimate_game_secs(tournament.filename) or profile["game_secs"]
+            self.profiles[key] = profile
+
+        # profiles saved before load_secs was measured
+        for k, v in DEFAULT_PROFILE.items():
+            self.profiles[key].setdefault(k, v)
+        return self.profiles[key]
+
+    def observed(self, tournament):
+        ''' the profiles a chunk's measurements go into - its game's and its model's (started
+        from the game's) '''
+        game = self.game_profile(tournament)
+        _, model = self.key(tournament)
+        if model is None:
+            return [game]
+
+        if model not in self.profiles:
+            self.profiles[model] = dict(game, chunks=0, ooms=0, stragglers=0)
+        return [game, self.profiles[model]]
+
+    def observe(self, tournament, peak_rss_mb, elapsed, games, load_secs=None, cpu_secs=None):
+        ''' a chunk finished.  load_secs is how long it took to start playing (or None if not
+        known), cpu_secs its user + system time. '''
+        for profile in self.observed(tournament):
+            self.fold(profile, peak_rss_mb, elapsed, games, load_secs, cpu_secs)
+        self.save()
+
+        # new generations may have been added to the tournament since
+        self.keys.pop(tournament.name, None)
+
+    def fold(self, profile, peak_rss_mb, elapsed, games, load_secs, cpu_secs):
+        profile["chunks"] += 1
+
+        def ema(name, value):
+            profile[name] = (1 - SMOOTHING) * profile[name] + SMOOTHING * value
+
+        # memory never shrinks below what was last seen, over estimating is the cheap mistake
+        ema("rss_mb", peak_rss_mb)
+        profile["rss_mb"] = max(profile["rss_mb"], peak_rss_mb * RSS_HEADROOM)
+
+        if cpu_secs is not None and elapsed > 0:
+            ema("threads", max(1.0, cpu_secs / elapsed))
+
+        if load_secs is not None:
+            ema("load_secs", load_secs)
+            elapsed -= load_secs
+
+        if games:
+            ema("game_secs", max(0.0, elapsed) / games)
+
+    def oom(self, tournament, peak_rss_mb=None):
+        for profile in self.observed(tournament):
+            profile["ooms"] += 1
+            profile["rss_mb"] = max(profile["rss_mb"], peak_rss_mb or 0) * OOM_GROWTH
+        self.save()
+
+    def straggler(self, tournament):
+        for profile in self.observed(tournament):
+            profile["stragglers"] += 1
+            profile["game_secs"] *= STRAGGLER_GROWTH
+        self.save()
+
+
+class Placement(object):
+    ''' packs chunks onto the host without going over memory or cores '''
+
+    def __init__(self, profiles, memory_mb=None, cores=None):
+        self.profiles = profiles
+        self.memory_mb = memory_mb or host_memory_mb()
+        self.cores = cores or host_cores()
+        self.reserved = {}
+
+    def used(self):
+        return (sum(p["rss_mb"] for p in self.reserved.values()),
+                sum(p["threads"] for p in self.reserved.values()))
+
+    def fits(self, tournament):
+        profile = self.profiles.get(tournament)
+        memory, cores = self.used()
+
+        # always allow one chunk, or a tournament bigger than the host would never run
+        if not self.reserved:
+            return True
+        return (memory + profile["rss_mb"] <= self.memory_mb and
+                cores + profile["threads"] <= self.cores)
+
+    def reserve(self, chunk):
+        self.reserved[chunk] = dict(self.profiles.get(chunk.tournament))
+
+    def release(self, chunk):
+        self.reserved.pop(chunk, None)
+
+    def deadline(self, chunk):
+        ''' seconds after which a chunk counts as a straggler '''
+        profile = self.profiles.get(chunk.tournament)
+        return STRAGGLER_FACTOR * (profile["load_secs"] + profile["game_secs"] * chunk.num_games)
+
+
+###############################################################################
+
+class Runner(object):
+    """Tournament resource profiles."""
+
+    def show(self, filename=PROFILES_FILENAME):
+        profiles = Profiles(filename)
+        print "host: %.0f MB available, %d cores" % (host_memory_mb(), host_cores())
+        for name, p in sorted(profiles.profiles.items()):
+            print ("%-20s %7.0f MB  %4.1f threads  %5.0fs load  %6.0fs/game  chunks %3d  ooms %2d"
+                   "  stragglers %2d" % (name, p["rss_mb"], p["threads"],
+                                         p.get("load_secs", DEFAULT_PROFILE["load_secs"]),
+                                         p["game_secs"], p["chunks"], p["ooms"], p["stragglers"]))
+
+    def estimate(self, tournament, elo_filename=None):
+        import scheduler
+        elo_filename = elo_filename or scheduler.elo_filename(tournament)
+        print "rss %s MB, %s s/game" % (estimate_rss_mb(tournament, elo_filename),
+                                        estimate_game_secs(elo_filename))
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
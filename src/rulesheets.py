@@ -0,0 +1,134 @@
+''' precompiled/cached rulesheets for data/rulesheets/*.kif
+
+Building a state machine from gdl means parsing the kif, grounding it into a propnet and
+compiling that.  This is done once per rulesheet by the build step - ggplib keeps the grounded
+artefacts in its game database, and we keep a manifest keyed by a content hash of the .kif, so
+startup is a cheap lookup by name.  If a .kif changes, its hash no longer matches the manifest
+and it is rebuilt on next use.
+'''
+
+import os
+import re
+import json
+import time
+import hashlib
+
+from ggplib.util import log
+from ggplib.db import lookup
+
+
+RULESHEETS_DIR = "../data/rulesheets"
+CACHE_DIR = os.path.join(RULESHEETS_DIR, ".cache")
+MANIFEST_FILENAME = os.path.join(CACHE_DIR, "manifest.json")
+
+
+def kif_filename(name):
+    return os.path.join(RULESHEETS_DIR, "%s.kif" % name)
+
+
+def all_names():
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(RULESHEETS_DIR)
+                  if f.endswith(".kif"))
+
+
+def content_hash(name):
+    with open(kif_filename(name), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def normalise(kif):
+    ''' strips comments and redundant whitespace, returns gdl as a single line '''
+    lines = [line.split(";", 1)[0] for line in kif.splitlines()]
+    gdl = " ".join(lines)
+    gdl = re.sub(r"([()])", r" \1 ", gdl)
+    return " ".join(gdl.split())
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILENAME):
+        return {}
+    with open(MANIFEST_FILENAME) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+
+    # write then rename, so concurrent workers never see a partial manifest
+    tmp_filename = "%s.%s" % (MANIFEST_FILENAME, os.getpid())
+    with open(tmp_filename, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.rename(tmp_filename, MANIFEST_FILENAME)
+
+
+def is_fresh(name, manifest=None):
+    if manifest is None:
+        manifest = load_manifest()
+    entry = manifest.get(name)
+    return entry is not None and entry["sha1"] == content_hash(name)
+
+
+def build(name, force=False):
+    manifest = load_manifest()
+    if not force and is_fresh(name, manifest):
+        return manifest[name]
+
+    sha1 = content_hash(name)
+    with open(kif_filename(name)) as f:
+        gdl = normalise(f.read())
+
+    start_time = time.time()
+
+    # ggplib grounds, compiles and stores the propnet in its database
+    game_info = lookup.by_gdl(gdl)
+    build_time = time.time() - start_time
+
+    log.info("built rulesheet %s (%s) in %.2fs" % (name, sha1[:8], build_time))
+
+    # reload, in case another worker built a different rulesheet in the meantime
+    manifest = load_manifest()
+    manifest[name] = dict(sha1=sha1,
+                          game=game_info.game,
+                          built=time.strftime("%Y/%m/%d %H:%M"),
+                          build_time=round(build_time, 3))
+    save_manifest(manifest)
+    return manifest[name]
+
+
+def get_game_info(name):
+    ''' returns game_info for the rulesheet, building it first if missing or stale '''
+    entry = build(name)
+    return lookup.by_name(entry["game"])
+
+
+def get_sm(name):
+    return get_game_info(name).get_sm()
+
+
+###############################################################################
+
+class Runner(object):
+    """Build and inspect the rulesheet cache."""
+
+    def build(self, name=None, force=False):
+        for n in [name] if name else all_names():
+            entry = build(n, force=force)
+            print "%-20s %s %s" % (n, entry["sha1"][:8], entry["game"])
+
+    def status(self):
+        manifest = load_manifest()
+        for n in all_names():
+            state = "ok" if is_fresh(n, manifest) else "stale"
+            print "%-20s %s" % (n, state)
+
+    def timeit(self, name):
+        start_time = time.time()
+        get_sm(name)
+        print "%s: state machine in %.3fs" % (name, time.time() - start_time)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,305 @@
+''' fair share scheduler, running several games' tournaments at once on one pool of workers.
+
+A tournament is one of the elo.Runner methods (hex13, connect6, ...).  Each worker slot runs a
+chunk of a tournament - a child process playing CHUNK_GAMES games with gen_elo - and when it
+finishes the slot is given to whichever tournament is furthest behind its share.
+
+  * priority - higher priority tournaments are always served first.
+  * weight - within a priority, worker time is shared in proportion to weight.
+  * convergence - the weight is scaled up for tournaments whose ratings are least settled (many
+    players with few games), so new generations get rated quickly.
+
+Only one chunk per tournament runs at a time, since gen_elo owns its .elo file while it runs.
+Chunks are only started if their resource profile (see resources.py) fits in the memory and
+cores left on the host.  Peak memory, cpu use, startup time and time per game of each chunk are
+fed back into the profiles, as are OOM kills and stragglers.
+
+Tournaments are given as "name[:weight[:priority]]", eg "hex13:2,connect6,bt8:1:1".
+'''
+
+import os
+import sys
+import time
+import signal
+import inspect
+import subprocess
+
+import ratings
+import resources
+import gamearchive
+
+
+CHUNK_GAMES = 10
+POLL_INTERVAL = 1.0
+
+# players with less than this many games count as unsettled
+SETTLED_GAMES = 40
+
+# how strongly to favour unsettled tournaments (0, weights only)
+CONVERGENCE_BOOST = 2.0
+
+
+def elo_filename(name):
+    ''' default .elo filename of an elo.Runner method '''
+    import elo
+    args = inspect.getargspec(getattr(elo.Runner, name))
+    return dict(zip(reversed(args.args), reversed(args.defaults or ())))["filename"]
+
+
+def unsettled(filename):
+    ''' 0 (all players settled) .. 1 (nothing played) '''
+    try:
+        all_ratings = ratings.load_ratings(filename)
+    except (IOError, OSError):
+        return 1.0
+
+    players = [p for p in all_ratings.players if not p.fixed and not p.retired]
+    if not players:
+        return 1.0
+    return sum(max(0.0, 1.0 - p.played / float(SETTLED_GAMES)) for p in players) / len(players)
+
+
+def total_played(filename):
+    try:
+        return sum(p.played for p in ratings.load_ratings(filename).players)
+    except (IOError, OSError):
+        return 0
+
+
+def total_archived(filename):
+    ''' games attempted, including those aborted as MatchTooLong (which aren't rated) '''
+    index_filename = gamearchive.archive_filename(filename) + ".idx"
+    if not os.path.exists(index_filename):
+        return 0
+    return os.path.getsize(index_filename) // gamearchive.INDEX_ENTRY.size
+
+
+class Tournament(object):
+    def __init__(self, name, weight=1.0, priority=0, filename=None):
+        self.name = name
+        self.weight = weight
+        self.priority = priority
+        self.filename = filename or elo_filename(name)
+
+        # worker seconds used so far
+        self.served = 0.0
+        self.chunks = 0
+        self.failures = 0
+
+        self.running = None
+        self.done = False
+
+    def effective_weight(self):
+        return self.weight * (1.0 + CONVERGENCE_BOOST * unsettled(self.filename))
+
+    def share_used(self):
+        return self.served / self.effective_weight()
+
+    def __repr__(self):
+        return "%s (w %.1f, p %d)" % (self.name, self.weight, self.priority)
+
+
+def parse_tournaments(spec):
+    if isinstance(spec, basestring):
+        spec = spec.split(",")
+
+    res = []
+    for s in spec:
+        parts = str(s).split(":")
+        weight = float(parts[1]) if len(parts) > 1 else 1.0
+        priority = int(parts[2]) if len(parts) > 2 else 0
+        res.append(Tournament(parts[0], weight, priority))
+    return res
+
+
+class Chunk(object):
+    ''' a running child process, playing some games of a tournament '''
+
+    def __init__(self, tournament, num_games):
+        self.tournament = tournament
+        self.num_games = num_games
+        self.start_time = time.time()
+        self.played_before = total_played(tournament.filename)
+        self.archived_before = total_archived(tournament.filename)
+
+        cmd = [sys.executable, os.path.abspath(__file__), "chunk", tournament.name,
+               "--num_games=%d" % num_games]
+        self.proc = subprocess.Popen(cmd)
+        self.peak_rss_mb = None
+        self.cpu_secs = None
+        self.load_secs = None
+        self.straggler = False
+
+    def check_started(self):
+        ''' notes the startup time - gen_elo saves the .elo file once it has prepared ratings,
+        and after every game '''
+        if self.load_secs is not None:
+            return
+        try:
+            mtime = os.path.getmtime(self.tournament.filename)
+        except OSError:
+            return
+        if mtime > self.start_time:
+            self.load_secs = mtime - self.start_time
+
+    def poll(self):
+        ''' returns the exit code (negative signal if killed) once finished, otherwise None '''
+        # wait4 rather than Popen.poll(), to get the peak rss of this child alone
+        pid, status, rusage = os.wait4(self.proc.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+
+        self.peak_rss_mb = rusage.ru_maxrss / 1024.0
+        self.cpu_secs = rusage.ru_utime + rusage.ru_stime
+        if os.WIFSIGNALED(status):
+            self.proc.returncode = -os.WTERMSIG(status)
+        else:
+            self.proc.returncode = os.WEXITSTATUS(status)
+        return self.proc.returncode
+
+    def games_played(self):
+        return (total_played(self.tournament.filename) - self.played_before) // 2
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+
+class Scheduler(object):
+    def __init__(self, tournaments, num_workers, chunk_games=CHUNK_GAMES, placement=None):
+        self.tournaments = tournaments
+        self.num_workers = num_workers
+        self.chunk_games = chunk_games
+        self.placement = placement
+        self.running = []
+
+    def candidates(self):
+        return [t for t in self.tournaments if not t.done and t.running is None]
+
+    def choose(self):
+        candidates = self.candidates()
+        if not candidates:
+            return None
+
+        # highest priority, then least share of the pool used
+        candidates.sort(key=lambda t: (-t.priority, t.share_used()))
+        if self.placement is None:
+            return candidates[0]
+
+        # don't let a smaller job jump the queue of a higher priority one that doesn't fit yet
+        top = candidates[0].priority
+        for t in candidates:
+            if t.priority == top and self.placement.fits(t):
+                return t
+        return None
+
+    def launch(self, tournament):
+        print "starting %s, served %.0fs" % (tournament, tournament.served)
+        tournament.running = Chunk(tournament, self.chunk_games)
+        self.running.append(tournament.running)
+        if self.placement is not None:
+            self.placement.reserve(tournament.running)
+
+    def finished(self, chunk, returncode):
+        t = chunk.tournament
+        t.running = None
+        t.served += chunk.elapsed()
+        t.chunks += 1
+
+        if self.placement is not None:
+            self.placement.release(chunk)
+            profiles = self.placement.profiles
+            if returncode == -signal.SIGKILL:
+                # the oom killer, or us killing a straggler
+                if chunk.straggler:
+                    profiles.straggler(t)
+                else:
+                    profiles.oom(t, chunk.peak_rss_mb)
+            else:
+                profiles.observe(t, chunk.peak_rss_mb, chunk.elapsed(), chunk.games_played(),
+                                 chunk.load_secs, chunk.cpu_secs)
+
+        if returncode != 0:
+            t.failures += 1
+            print "%s: chunk failed (%s)" % (t, returncode)
+
+        # gen_elo returns early when there is no one left to play
+        elif total_played(t.filename) == chunk.played_before:
+            # unless every game was too long - then it is left for another chunk to retry
+            if total_archived(t.filename) > chunk.archived_before:
+                print "%s: every game too long, will retry" % t
+            else:
+                print "%s: nothing left to play" % t
+                t.done = True
+
+    def step(self):
+        for chunk in self.running[:]:
+            chunk.check_started()
+            returncode = chunk.poll()
+            if returncode is not None:
+                self.running.remove(chunk)
+                self.finished(chunk, returncode)
+
+            elif (self.placement is not None and not chunk.straggler and
+                  chunk.elapsed() > self.placement.deadline(chunk)):
+                print "%s: straggler after %.0fs, killing" % (chunk.tournament, chunk.elapsed())
+                chunk.straggler = True
+                chunk.proc.kill()
+
+        while len(self.running) < self.num_workers:
+            t = self.choose()
+            if t is None:
+                break
+            self.launch(t)
+
+    def run(self, hours=None):
+        end_time = time.time() + hours * 3600 if hours else None
+        try:
+            while end_time is None or time.time() < end_time:
+                self.step()
+                if not self.running:
+                    break
+                time.sleep(POLL_INTERVAL)
+
+        finally:
+            for chunk in self.running:
+                chunk.proc.terminate()
+                chunk.proc.wait()
+
+        self.report()
+
+    def report(self):
+        for t in sorted(self.tournaments, key=lambda t: (-t.priority, t.name)):
+            print "%-12s served %8.0fs  chunks %4d  failures %3d  unsettled %.2f" % (
+                t.name, t.served, t.chunks, t.failures, unsettled(t.filename))
+
+
+###############################################################################
+
+class Runner(object):
+    """Run several tournaments on one pool of workers."""
+
+    def run(self, tournaments, workers=4, chunk_games=CHUNK_GAMES, hours=None,
+            memory_mb=None, cores=None, place=True):
+        placement = None
+        if place:
+            placement = resources.Placement(resources.Profiles(), memory_mb, cores)
+        Scheduler(parse_tournaments(tournaments), workers, chunk_games, placement).run(hours)
+
+    def status(self, tournaments):
+        for t in parse_tournaments(tournaments):
+            print "%-12s %-28s effective weight %.2f" % (t.name, t.filename,
+                                                        t.effective_weight())
+
+    def chunk(self, name, num_games=CHUNK_GAMES):
+        ''' runs in the child process '''
+        import elo
+        from ggpzero.battle.common import run
+
+        elo.NUM_GAMES = num_games
+        run(getattr(elo.Runner(), name), log_name_base="elo_%s_" % name)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
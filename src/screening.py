@@ -0,0 +1,145 @@
+''' two tier (multi fidelity) rating - cheap screening matches before full matches.
+
+Every generation first plays in a screening tier, at SCREEN_PLAYOUTS playouts and
+SCREEN_MOVE_TIME seconds a move, rated in its own file (<base>.screen.elo).  Only generations
+that might be near the top are promoted to full fidelity matches: once settled in screening, a
+generation is promoted if its screening rating plus PROMOTE_Z standard deviations comes within
+PROMOTE_GAP of the best screened generation.  The clearly weak never pay for full matches.  Once
+every generation has settled in screening, no more screening games are played.
+
+The tiers only help if they rank generations alike, so the spearman rank correlation between
+screening and full ratings (over generations rated in both) is logged each run, and reported per
+game by "screening.py correlation".
+'''
+
+import os
+import re
+import math
+
+import ratings
+
+
+SCREEN_PLAYOUTS = 100
+SCREEN_MOVE_TIME = 2.0
+
+# screening games per gen_elo run (they are cheap)
+SCREEN_GAMES = 100
+
+# screening ratings with fewer games than this are not yet decided
+SCREEN_SETTLED = 20
+
+# sd of a rating after one game, roughly - shrinks with sqrt(played)
+NOISE_ELO = 350.0
+
+PROMOTE_GAP = 200.0
+PROMOTE_Z = 1.0
+
+# full fidelity ratings with fewer games than this are left out of the correlation
+CORRELATION_MIN_PLAYED = 20
+
+PLAYOUTS_RE = re.compile(r"^(.*_v\d+)_\d+_(.*)$")
+
+
+def screen_filename(filename):
+    return os.path.splitext(filename)[0] + ".screen.elo"
+
+
+def generation_key(name):
+    ''' "hex_lg_19_v3_800_h2_477" -> "hex_lg_19_v3_h2_477", the same for either tier '''
+    m = PLAYOUTS_RE.match(name)
+    return "%s_%s" % m.groups() if m else name
+
+
+def all_settled(names, screen_ratings):
+    ''' True if every one of names (full fidelity generations) is settled in screening '''
+    settled = set(generation_key(p.name) for p in screen_ratings.players
+                  if p.played >= SCREEN_SETTLED)
+    return all(generation_key(n) in settled for n in names)
+
+
+def promoted(screen_ratings):
+    ''' returns generation keys promoted to full fidelity '''
+    settled = [p for p in screen_ratings.players
+               if not p.fixed and p.played >= SCREEN_SETTLED]
+    if not settled:
+        return set()
+
+    best = max(p.elo for p in settled)
+    return set(generation_key(p.name) for p in settled
+               if p.elo + PROMOTE_Z * NOISE_ELO / math.sqrt(p.played) >= best - PROMOTE_GAP)
+
+
+def select(names, full_ratings, screen_ratings):
+    ''' of names (full fidelity generations), the ones to play at full fidelity - those promoted,
+    and any already rated there '''
+    keys = promoted(screen_ratings)
+    rated = set(p.name for p in full_ratings.players) if full_ratings else set()
+    return [n for n in names if n in rated or generation_key(n) in keys]
+
+
+def _ranks(values):
+    ''' ranks, with ties given their mean rank '''
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2.0
+        i = j + 1
+    return ranks
+
+
+def spearman(xs, ys):
+    if len(xs) < 3:
+        return None
+
+    rx, ry = _ranks(xs), _ranks(ys)
+    n = float(len(xs))
+    mx, my = sum(rx) / n, sum(ry) / n
+    cov = sum((a - mx) * (b - my) for a, b in zip(rx, ry))
+    var = math.sqrt(sum((a - mx) ** 2 for a in rx) * sum((b - my) ** 2 for b in ry))
+    return cov / var if var else None
+
+
+def tier_correlation(full_ratings, screen_ratings):
+    ''' returns (spearman correlation or None, number of generations in both tiers) '''
+    screened = dict((generation_key(p.name), p) for p in screen_ratings.players
+                    if not p.fixed and p.played >= SCREEN_SETTLED)
+
+    pairs = []
+    for p in full_ratings.players:
+        s = screened.get(generation_key(p.name))
+        if s is not None and not p.fixed and p.played >= CORRELATION_MIN_PLAYED:
+            pairs.append((s.elo, p.elo))
+
+    return spearman([a for a, _ in pairs], [b for _, b in pairs]), len(pairs)
+
+
+###############################################################################
+
+class Runner(object):
+    """Screening tier reports."""
+
+    def correlation(self, *filenames):
+        ''' per game rank correlation between the screening and full tiers '''
+        for filename in filenames:
+            if not os.path.exists(screen_filename(filename)):
+                continue
+
+            full_ratings = ratings.load_ratings(filename)
+            screen_ratings = ratings.load_ratings(screen_filename(filename))
+            rho, count = tier_correlation(full_ratings, screen_ratings)
+            rho = "-" if rho is None else "%.3f" % rho
+
+            screened = [p for p in screen_ratings.players if not p.fixed]
+            print "%-16s spearman %6s over %3d, %3d screened, %3d promoted" % (
+                full_ratings.game, rho, count, len(screened), len(promoted(screen_ratings)))
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
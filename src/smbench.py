@@ -0,0 +1,204 @@
+''' state machine throughput benchmark across data/rulesheets
+
+For each rulesheet, for a fixed wall time:
+
+  * random playouts from the initial state (states/sec, playouts/sec, average game length)
+  * legal move generation on states sampled during the playouts
+  * terminal checks on the same sampled states
+
+The report is json, and can be compared against a stored baseline - anything slower than the
+baseline by more than the tolerance is flagged as a regression.
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import platform
+
+import rulesheets
+
+
+BASELINE_FILENAME = "../data/bench/sm_baseline.json"
+DEFAULT_SECONDS = 5.0
+DEFAULT_TOLERANCE = 0.15
+SAMPLE_EVERY = 7
+MAX_SAMPLES = 2000
+
+# rates that are compared against the baseline (higher is better)
+RATES = ("states_per_sec", "playouts_per_sec", "legals_per_sec", "terminals_per_sec")
+
+
+def playouts(sm, seconds, samples):
+    roles = sm.get_roles()
+    joint_move = sm.get_joint_move()
+    base_state = sm.new_base_state()
+
+    num_playouts = num_states = 0
+    start_time = time.time()
+    end_time = start_time + seconds
+    while time.time() < end_time:
+        sm.reset()
+        while not sm.is_terminal():
+            for role_index in range(len(roles)):
+                ls = sm.get_legal_state(role_index)
+                joint_move.set(role_index, ls.get_legal(random.randrange(ls.get_count())))
+
+            sm.next_state(joint_move, base_state)
+            sm.update_bases(base_state)
+            num_states += 1
+
+            if num_states % SAMPLE_EVERY == 0 and len(samples) < MAX_SAMPLES:
+                sample = sm.new_base_state()
+                sample.assign(base_state)
+                samples.append(sample)
+
+        num_playouts += 1
+
+    elapsed = time.time() - start_time
+    return dict(playouts=num_playouts,
+                states=num_states,
+                states_per_sec=num_states / elapsed,
+                playouts_per_sec=num_playouts / elapsed,
+                average_game_length=num_states / float(max(1, num_playouts)))
+
+
+def legals(sm, seconds, samples):
+    num_roles = len(sm.get_roles())
+    count = 0
+    start_time = time.time()
+    end_time = start_time + seconds
+    while time.time() < end_time:
+        for bs in samples:
+            sm.update_bases(bs)
+            for role_index in range(num_roles):
+                sm.get_legal_state(role_index).get_count()
+            count += 1
+
+    return dict(legals_per_sec=count / (time.time() - start_time))
+
+
+def terminals(sm, seconds, samples):
+    count = 0
+    start_time = time.time()
+    end_time = start_time + seconds
+    while time.time() < end_time:
+        for bs in samples:
+            sm.update_bases(bs)
+            sm.is_terminal()
+            count += 1
+
+    return dict(terminals_per_sec=count / (time.time() - start_time))
+
+
+def bench(name, seconds):
+    sm = rulesheets.get_sm(name)
+
+    samples = []
+    result = dict(name=name, sha1=rulesheets.content_hash(name))
+    result.update(playouts(sm, seconds, samples))
+    if samples:
+        result.update(legals(sm, seconds / 2.0, samples))
+        result.update(terminals(sm, seconds / 2.0, samples))
+    return result
+
+
+def bench_all(names, seconds):
+    report = dict(host=socket.gethostname(),
+                  python=platform.python_version(),
+                  date=time.strftime("%Y/%m/%d %H:%M"),
+                  seconds=seconds,
+                  results={})
+
+    for name in names:
+        res = report["results"][name] = bench(name, seconds)
+        print "%-20s %10.0f states/s %8.1f playouts/s  len %.1f" % (name,
+                                                                    res["states_per_sec"],
+                                                                    res["playouts_per_sec"],
+                                                                    res["average_game_length"])
+    return report
+
+
+def compare(report, baseline, tolerance):
+    ''' returns list of (name, rate, current, baseline) that regressed '''
+    if baseline.get("host") != report.get("host"):
+        print "warning: baseline is from host %s, not %s - rates may not be comparable" % (
+            baseline.get("host"), report.get("host"))
+
+    regressions = []
+    for name, res in sorted(report["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+
+        if base["sha1"] != res["sha1"]:
+            print "%s: rulesheet changed since baseline, not comparing" % name
+            continue
+
+        for rate in RATES:
+            if rate not in res or rate not in base:
+                continue
+
+            # a baseline rate of 0 (eg no playouts finished) has nothing to compare against
+            if not base[rate]:
+                print "%-20s %-18s %12.1f %12.1f %7s" % (name, rate, res[rate], base[rate], "n/a")
+                continue
+
+            ratio = res[rate] / base[rate]
+            flag = ""
+            if ratio < 1.0 - tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append((name, rate, res[rate], base[rate]))
+
+            print "%-20s %-18s %12.1f %12.1f %6.2fx%s" % (name, rate, res[rate],
+                                                         base[rate], ratio, flag)
+    return regressions
+
+
+def load_report(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_report(report, filename):
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=4, sort_keys=True)
+
+
+###############################################################################
+
+class Runner(object):
+    """State machine throughput benchmarks."""
+
+    def run(self, names=None, seconds=DEFAULT_SECONDS, output=None,
+            baseline=BASELINE_FILENAME, tolerance=DEFAULT_TOLERANCE):
+        if names is None:
+            names = rulesheets.all_names()
+        elif isinstance(names, basestring):
+            names = names.split(",")
+
+        report = bench_all(names, seconds)
+        if output:
+            save_report(report, output)
+
+        if baseline and os.path.exists(baseline):
+            if compare(report, load_report(baseline), tolerance):
+                sys.exit(1)
+
+    def compare(self, filename, baseline=BASELINE_FILENAME, tolerance=DEFAULT_TOLERANCE):
+        if compare(load_report(filename), load_report(baseline), tolerance):
+            sys.exit(1)
+
+    def save_baseline(self, filename, baseline=BASELINE_FILENAME):
+        save_report(load_report(filename), baseline)
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,160 @@
+''' transparent compression for the json files under data/.
+
+Files keep their names - whether a file is compressed (gzip or zstd) is detected from its magic
+bytes when read, so old plain files and compressed ones can be mixed freely.  When a file is
+rewritten it keeps its current compression, and new files are written with COMPRESS.
+
+zstd needs the zstandard module.  The model json files repeat the same layer dicts over and
+over, and compress much better with a dictionary trained on them (storage.py train_dict) - if
+DICT_FILENAME exists it is used for all zstd compression.  Note zstd files written with a
+dictionary can't be read without it.
+
+Only the copies under this repo's data/ should be converted - ggpzero reads its own generations
+and models directories itself, and knows nothing of this.
+'''
+
+import os
+import json
+import zlib
+
+
+GZIP_MAGIC = "\x1f\x8b"
+ZSTD_MAGIC = "\x28\xb5\x2f\xfd"
+
+# compression for new files: None, "gzip" or "zstd"
+COMPRESS = None
+
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+
+DICT_FILENAME = "../data/.zstd_dict"
+DICT_SIZE = 64 * 1024
+
+JSON_GLOBS = ("../data/*/models/*.json", "../data/*/generations/*.json",
+              "../data/*/weights/*.json")
+DATA_GLOBS = ("../data/elo/*.elo", ) + JSON_GLOBS
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("zstd compressed files need the zstandard module")
+    return zstandard
+
+
+def _zstd_dict():
+    if not os.path.exists(DICT_FILENAME):
+        return None
+    with open(DICT_FILENAME, "rb") as f:
+        return _zstd().ZstdCompressionDict(f.read())
+
+
+def compression(data):
+    ''' None, "gzip" or "zstd" '''
+    if data.startswith(GZIP_MAGIC):
+        return "gzip"
+    if data.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def decompress(data):
+    kind = compression(data)
+    if kind == "gzip":
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+    if kind == "zstd":
+        return _zstd().ZstdDecompressor(dict_data=_zstd_dict()).decompress(data)
+
+    return data
+
+
+def compress(data, kind):
+    if kind == "gzip":
+        c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return c.compress(data) + c.flush()
+
+    if kind == "zstd":
+        zstd = _zstd()
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_zstd_dict()).compress(data)
+
+    assert kind is None, "unknown compression %s" % kind
+    return data
+
+
+def file_compression(filename):
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as f:
+        return compression(f.read(4))
+
+
+def read(filename):
+    with open(filename, "rb") as f:
+        return decompress(f.read())
+
+
+def write(filename, data, kind="keep"):
+    ''' atomic (write then rename).  kind "keep" is the file's current compression, or COMPRESS
+    for a new file. '''
+    if kind == "keep":
+        kind = file_compression(filename) if os.path.exists(filename) else COMPRESS
+
+    tmp_filename = "%s.%s" % (filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+        f.write(compress(data, kind))
+    os.rename(tmp_filename, filename)
+
+
+def load_json(filename):
+    return json.loads(read(filename))
+
+
+def save_json(filename, obj, kind="keep", **kwds):
+    write(filename, json.dumps(obj, **kwds), kind)
+
+
+def data_filenames(patterns=DATA_GLOBS):
+    import glob
+    return sorted(f for pattern in patterns for f in glob.glob(pattern))
+
+
+###############################################################################
+
+class Runner(object):
+    """Compress / decompress data files in place."""
+
+    def convert(self, kind="gzip", *filenames):
+        ''' rewrite files (default all under data/) with compression kind (gzip, zstd or none) '''
+        kind = None if kind == "none" else kind
+        before = after = 0
+        for filename in filenames or data_filenames():
+            before += os.path.getsize(filename)
+            write(filename, read(filename), kind)
+            after += os.path.getsize(filename)
+
+        print "%d -> %d bytes" % (before, after)
+
+    def stats(self, *filenames):
+        for filename in filenames or data_filenames():
+            size = os.path.getsize(filename)
+            print "%-60s %-5s %9d %9d" % (filename, file_compression(filename) or "-", size,
+                                          len(read(filename)))
+
+    def train_dict(self, *filenames, **kwds):
+        ''' train a zstd dictionary on json files (default all of them under data/) '''
+        size = kwds.pop("size", DICT_SIZE)
+        assert not kwds, "unknown options %s" % kwds
+
+        samples = [read(f) for f in filenames or data_filenames(JSON_GLOBS)]
+        d = _zstd().train_dictionary(size, samples)
+        with open(DICT_FILENAME, "wb") as f:
+            f.write(d.as_bytes())
+        print "wrote %s, trained on %d files" % (DICT_FILENAME, len(samples))
+
+
+if __name__ == "__main__":
+    # 3rd party: https://github.com/google/python-fire
+    import fire
+    fire.Fire(Runner)
@@ -0,0 +1,154 @@
+''' npinfer layers against naive reference implementations.  Run with pytest (needs numpy). '''
+
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import npinfer
+
+
+ACTIVATIONS = {
+    "linear": lambda v: v,
+    "relu": lambda v: max(v, 0.0),
+    "elu": lambda v: v if v > 0 else math.exp(v) - 1.0,
+    "sigmoid": lambda v: 1.0 / (1.0 + math.exp(-v)),
+    "tanh": math.tanh,
+}
+
+
+def naive_conv(x, kernel, bias, strides, padding):
+    ''' x is (N, C, H, W), kernel is keras (kh, kw, cin, cout) '''
+    n, c, h, w = x.shape
+    kh, kw, _, cout = kernel.shape
+    sh, sw = strides
+
+    if padding == "same":
+        ho, wo = (h + sh - 1) // sh, (w + sw - 1) // sw
+        pt = max((ho - 1) * sh + kh - h, 0) // 2
+        pl = max((wo - 1) * sw + kw - w, 0) // 2
+    else:
+        ho, wo = (h - kh) // sh + 1, (w - kw) // sw + 1
+        pt = pl = 0
+
+    y = np.zeros((n, cout, ho, wo))
+    for b in range(n):
+        for o in range(cout):
+            for i in range(ho):
+                for j in range(wo):
+                    total = bias[o]
+                    for ci in range(c):
+                        for di in range(kh):
+                            for dj in range(kw):
+                                yy, xx = i * sh + di - pt, j * sw + dj - pl
+                                if 0 <= yy < h and 0 <= xx < w:
+                                    total += x[b, ci, yy, xx] * kernel[di, dj, ci, o]
+                    y[b, o, i, j] = total
+    return y
+
+
+def naive_bn(x, weights, epsilon):
+    y = np.zeros(x.shape)
+    for b in range(x.shape[0]):
+        for ci in range(x.shape[1]):
+            std = math.sqrt(weights["moving_variance"][ci] + epsilon)
+            y[b, ci] = ((x[b, ci] - weights["moving_mean"][ci]) / std * weights["gamma"][ci] +
+                        weights["beta"][ci])
+    return y
+
+
+def random_conv(rng, cin, cout, kh, kw):
+    return dict(kernel=rng.randn(kh, kw, cin, cout).astype(np.float32),
+                bias=rng.randn(cout).astype(np.float32))
+
+
+def random_bn(rng, channels):
+    return dict(gamma=rng.rand(channels).astype(np.float32) + 0.5,
+                beta=rng.randn(channels).astype(np.float32),
+                moving_mean=rng.randn(channels).astype(np.float32),
+                moving_variance=rng.rand(channels).astype(np.float32) + 0.1)
+
+
+@pytest.mark.parametrize("kernel_size,strides,padding", [
+    ((3, 3), (1, 1), "same"),
+    ((1, 1), (1, 1), "same"),
+    ((3, 3), (2, 2), "same"),
+    ((2, 3), (1, 2), "valid"),
+])
+def test_conv(kernel_size, strides, padding):
+    rng = np.random.RandomState(1)
+    x = rng.randn(2, 3, 7, 6).astype(np.float32)
+    weights = random_conv(rng, 3, 4, *kernel_size)
+    cfg = dict(strides=strides, padding=padding, activation="linear")
+
+    expect = naive_conv(x, weights["kernel"], weights["bias"], strides, padding)
+    assert np.allclose(npinfer.Conv(cfg, weights)(x), expect, atol=1e-4)
+
+
+def test_batch_norm():
+    rng = np.random.RandomState(2)
+    x = rng.randn(2, 4, 5, 5).astype(np.float32)
+    weights = random_bn(rng, 4)
+
+    bn = npinfer.BatchNorm(dict(axis=1, epsilon=1e-3), weights, x.ndim - 1)
+    assert np.allclose(bn(x), naive_bn(x, weights, 1e-3), atol=1e-4)
+
+
+@pytest.mark.parametrize("act", sorted(ACTIVATIONS))
+def test_conv_bn_folded(act):
+    rng = np.random.RandomState(3)
+    x = rng.randn(2, 3, 6, 6).astype(np.float32)
+    conv_weights = random_conv(rng, 3, 4, 3, 3)
+    bn_weights = random_bn(rng, 4)
+
+    expect = naive_conv(x, conv_weights["kernel"], conv_weights["bias"], (1, 1), "same")
+    expect = np.vectorize(ACTIVATIONS[act])(naive_bn(expect, bn_weights, 1e-3))
+
+    conv = npinfer.Conv(dict(strides=(1, 1), padding="same", activation="linear"),
+                        conv_weights)
+    conv.fold_bn(*npinfer.bn_scale_shift(bn_weights, 1e-3))
+    y = conv(x)
+    fn = npinfer.activation(act)
+    if fn is not None:
+        y = fn(y)
+
+    assert np.allclose(y, expect, atol=1e-4)
+
+
+@pytest.mark.parametrize("act", sorted(ACTIVATIONS))
+def test_activation(act):
+    x = np.linspace(-5, 5, 41).astype(np.float32)
+    expect = np.array([ACTIVATIONS[act](v) for v in x])
+
+    for inplace in (False, True):
+        fn = npinfer.activation(act, inplace=inplace)
+        y = x if fn is None else fn(x.copy())
+        assert np.allclose(y, expect, atol=1e-5), (act, inplace)
+
+
+def test_softmax():
+    x = np.random.RandomState(4).randn(3, 10).astype(np.float32)
+    e = [[math.exp(v) for v in row] for row in x]
+    expect = np.array([[v / sum(row) for v in row] for row in e])
+    assert np.allclose(npinfer.activation("softmax")(x), expect, atol=1e-5)
+
+
+def test_quantised_conv_bn():
+    rng = np.random.RandomState(5)
+    x = rng.randn(2, 3, 6, 6).astype(np.float32)
+    weights = random_conv(rng, 3, 4, 3, 3)
+    bn_scale, bn_shift = npinfer.bn_scale_shift(random_bn(rng, 4), 1e-3)
+    cfg = dict(strides=(1, 1), padding="same", activation="relu")
+
+    scale = np.abs(weights["kernel"]).max(axis=(0, 1, 2)) / 127.0
+    kernel = np.round(weights["kernel"] / scale).astype(np.int8)
+
+    dequantised = npinfer.Conv(cfg, dict(kernel=kernel * scale, bias=weights["bias"]))
+    quantised = npinfer.Conv(cfg, dict(kernel=kernel, kernel_scale=scale, bias=weights["bias"]),
+                             quantised=True)
+    assert quantised.w.dtype == np.int8
+
+    for conv in (dequantised, quantised):
+        conv.fold_bn(bn_scale, bn_shift)
+    assert np.allclose(quantised(x), dequantised(x), atol=1e-4)